@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Historial frío de location_data en archivos columnares comprimidos.
+
+El job (``python archive.py``) toma las filas anteriores a ARCHIVE_AFTER_DAYS, las
+agrupa por dispositivo y mes UTC y escribe cada grupo como un .npz comprimido (un
+arreglo de NumPy por columna) en un directorio local o en un bucket compatible con S3.
+En una misma transacción registra el archivo en el manifiesto (tabla location_archive,
+con min/max de tiempo y coordenadas) y borra sus filas de location_data.
+
+/api/location/range y la búsqueda por polígono consultan el manifiesto en la misma
+instantánea que la tabla y leen solo los archivos cuyo rango de tiempo (o rectángulo)
+toca la consulta; los archivos leídos quedan decodificados en memoria (ARCHIVE_CACHE_MB).
+
+Ejecutar con: python archive.py [--days 90] [--device ID] [--dry-run] [--vacuum]
+(--vacuum hace VACUUM ANALYZE al final para que el espacio liberado se reutilice)
+
+Variables de entorno:
+  ARCHIVE_URL=./archive     directorio local o s3://bucket/prefijo
+  ARCHIVE_S3_ENDPOINT=      endpoint de un almacenamiento compatible con S3 (vacío = AWS);
+                            credenciales con las variables estándar de AWS
+  ARCHIVE_AFTER_DAYS=90     antigüedad a partir de la cual se archiva
+  ARCHIVE_CACHE_MB=256      columnas de archivos leídos que se mantienen en memoria
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+from dotenv import load_dotenv
+
+from metrics import Counter
+
+load_dotenv()
+
+ARCHIVE_URL = os.getenv('ARCHIVE_URL', './archive')
+ARCHIVE_S3_ENDPOINT = os.getenv('ARCHIVE_S3_ENDPOINT', '')
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_CACHE_MB = float(os.getenv('ARCHIVE_CACHE_MB', 256))
+
+# Columnas que leen las consultas (el archivo guarda todas las de location_data)
+READ_COLUMNS = ('latitude', 'longitude', 'timestamp_value', 'created_at')
+
+ARCHIVE_READS = Counter('archive_file_reads_total', 'Archivos del historial leídos por origen', ('source',))
+
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, path, data):
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f'{target}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, target)
+
+    def get(self, path):
+        with open(os.path.join(self.root, path), 'rb') as f:
+            return f.read()
+
+    def delete(self, path):
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store:
+    def __init__(self, url, endpoint=None):
+        # Dependencia opcional: solo se necesita con ARCHIVE_URL=s3://...
+        import boto3
+        parts = urlsplit(url)
+        self.bucket = parts.netloc
+        self.prefix = parts.path.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint or None)
+
+    def _key(self, path):
+        return f'{self.prefix}/{path}' if self.prefix else path
+
+    def put(self, path, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(path), Body=data)
+
+    def get(self, path):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(path))['Body'].read()
+
+    def delete(self, path):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(path))
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if ARCHIVE_URL.startswith('s3://'):
+            _store = S3Store(ARCHIVE_URL, ARCHIVE_S3_ENDPOINT)
+        else:
+            _store = LocalStore(ARCHIVE_URL)
+    return _store
+
+
+def build_file(device_id, columns):
+    """Columnas de Database.get_archive_columns -> (bytes del .npz, fila del manifiesto)"""
+    arrays = {
+        'id': np.asarray(columns['id'], dtype=np.int64),
+        'latitude': np.asarray(columns['latitude'], dtype=np.float64),
+        'longitude': np.asarray(columns['longitude'], dtype=np.float64),
+        'timestamp_value': np.asarray(columns['timestamp_value'], dtype=np.int64),
+        # Nulos como NaN / ''
+        'accuracy': np.asarray(columns['accuracy'], dtype=np.float64),
+        'altitude': np.asarray(columns['altitude'], dtype=np.float64),
+        'speed': np.asarray(columns['speed'], dtype=np.float64),
+        'provider': np.asarray([value or '' for value in columns['provider']], dtype=np.str_),
+        'created_at': np.asarray(columns['created_at'], dtype='datetime64[us]'),
+    }
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    data = buffer.getvalue()
+
+    timestamps = arrays['timestamp_value']
+    month = datetime.fromtimestamp(timestamps[0] / 1000, tz=timezone.utc).strftime('%Y-%m')
+    folder = '_null' if device_id is None else quote(device_id, safe='') or '_empty'
+    ids = arrays['id']
+    entry = {
+        # Los ids hacen único el nombre aunque un mes se archive en varias pasadas
+        'path': f'{folder}/{month}/{ids.min()}-{ids.max()}.npz',
+        'device_id': device_id,
+        'min_time': int(timestamps.min()),
+        'max_time': int(timestamps.max()),
+        'min_lat': float(arrays['latitude'].min()),
+        'max_lat': float(arrays['latitude'].max()),
+        'min_lng': float(arrays['longitude'].min()),
+        'max_lng': float(arrays['longitude'].max()),
+        'rows': len(ids),
+        'bytes': len(data),
+        'max_id': int(ids.max()),
+    }
+    return data, entry
+
+
+class ColumnCache:
+    """Columnas decodificadas de los últimos archivos leídos, con descarte LRU por tamaño"""
+
+    def __init__(self, max_mb=ARCHIVE_CACHE_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        with self.lock:
+            columns = self.entries.get(path)
+            if columns is not None:
+                self.entries.move_to_end(path)
+            return columns
+
+    def put(self, path, columns):
+        size = sum(array.nbytes for array in columns.values())
+        with self.lock:
+            if path in self.entries or size > self.max_bytes:
+                return
+            self.entries[path] = columns
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= sum(array.nbytes for array in evicted.values())
+
+
+column_cache = ColumnCache()
+
+
+def _columns(path):
+    columns = column_cache.get(path)
+    if columns is not None:
+        ARCHIVE_READS.inc(labels=('cache',))
+        return columns
+    with np.load(io.BytesIO(get_store().get(path))) as npz:
+        columns = {name: npz[name] for name in READ_COLUMNS}
+    ARCHIVE_READS.inc(labels=('store',))
+    column_cache.put(path, columns)
+    return columns
+
+
+def points_in_polygon(latitudes, longitudes, polygon):
+    """Máscara de los puntos dentro de [[lat, lng], ...] (ray casting, como Area.contains)"""
+    inside = np.zeros(len(latitudes), dtype=bool)
+    previous_lat, previous_lng = polygon[-1]
+    for vertex_lat, vertex_lng in polygon:
+        if vertex_lat != previous_lat:
+            crosses = (latitudes < vertex_lat) != (latitudes < previous_lat)
+            crossing = vertex_lng + (latitudes - vertex_lat) * (previous_lng - vertex_lng) / (previous_lat - vertex_lat)
+            inside ^= crosses & (longitudes < crossing)
+        previous_lat, previous_lng = vertex_lat, vertex_lng
+    return inside
+
+
+def _read_files(files, start_time, end_time, polygon):
+    rows = []
+    for path, device_id in files:
+        columns = _columns(path)
+        latitudes, longitudes = columns['latitude'], columns['longitude']
+        timestamps = columns['timestamp_value']
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start_time is not None:
+            mask &= timestamps >= start_time
+        if end_time is not None:
+            mask &= timestamps <= end_time
+        if polygon is not None:
+            mask &= points_in_polygon(latitudes, longitudes, polygon)
+        rows.extend(
+            {'latitude': lat, 'longitude': lng, 'timestamp_value': timestamp, 'created_at': created_at, 'device_id': device_id}
+            for lat, lng, timestamp, created_at in zip(
+                latitudes[mask].tolist(), longitudes[mask].tolist(),
+                timestamps[mask].tolist(), columns['created_at'][mask].tolist()
+            )
+        )
+    return rows
+
+
+async def read_archived(files, start_time=None, end_time=None, polygon=None):
+    """Filas archivadas de ``files`` [(path, device_id), ...] en el rango y/o polígono,
+    con las mismas claves que las consultas de location_data"""
+    return await asyncio.to_thread(_read_files, files, start_time, end_time, polygon)
+
+
+async def archive_history(db, cutoff, device_id=None, dry_run=False):
+    """Archiva las filas anteriores a ``cutoff`` (ms); devuelve (archivos, filas)"""
+    store = get_store()
+    files = rows = 0
+    for group in await db.get_archive_candidates(cutoff, device_id):
+        start_time, end_time = group['start_time'], min(group['end_time'], cutoff)
+        label = f"{group['device_id']} {datetime.fromtimestamp(start_time / 1000, tz=timezone.utc):%Y-%m}"
+        if dry_run:
+            print(f"{label}: {group['rows']} filas")
+            continue
+        columns = await db.get_archive_columns(group['device_id'], start_time, end_time)
+        if not columns['id']:
+            continue
+        data, entry = await asyncio.to_thread(build_file, group['device_id'], columns)
+        await asyncio.to_thread(store.put, entry['path'], data)
+        if not await db.commit_archive_file(entry, start_time, end_time, entry['max_id']):
+            # Cambiaron las filas mientras se escribía el archivo; queda para la próxima pasada
+            await asyncio.to_thread(store.delete, entry['path'])
+            print(f"⚠️ {label}: las filas cambiaron durante el archivado, se reintentará")
+            continue
+        files += 1
+        rows += entry['rows']
+        print(f"✅ {label}: {entry['rows']} filas -> {entry['path']} ({entry['bytes'] / 1024:.0f} KiB)")
+    return files, rows
+
+
+async def _run(args):
+    from database import Database
+
+    db = Database()
+    await db.init_connection_pool()
+    try:
+        await db.create_table()
+        cutoff = int((time.time() - args.days * 86400) * 1000)
+        files, rows = await archive_history(db, cutoff, args.device, args.dry_run)
+        print(f"Archivados {rows} registros en {files} archivos")
+        if args.vacuum and rows:
+            await db.vacuum_locations()
+    finally:
+        await db.close_connection_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiva el historial antiguo de location_data")
+    parser.add_argument('--days', type=float, default=ARCHIVE_AFTER_DAYS, help="antigüedad mínima en días")
+    parser.add_argument('--device', help="solo este device_id")
+    parser.add_argument('--dry-run', action='store_true', help="solo muestra qué se archivaría")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM ANALYZE de location_data al terminar")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Índice espacial en memoria sobre la última posición de cada dispositivo.
+La caché de últimas posiciones (live.py) mueve cada dispositivo a su celda de una
+rejilla de AREA_CELL_DEG grados al llegar cada posición, así "qué dispositivos hay
+en esta área" solo recorre las celdas que cubre el área (o las ocupadas, si son
+menos) y los dispositivos dentro de ellas, no toda la flota.
+
+La misma rejilla responde "los N dispositivos más cercanos a un punto": se recorren
+anillos de celdas alrededor del punto hasta que ningún dispositivo fuera de lo
+recorrido pueda estar más cerca que los N encontrados.
+
+Las suscripciones de área (AreaWatchers) también se registran por celda: cada
+posición nueva se compara solo con las suscripciones de su celda y con las que ya
+tenían al dispositivo dentro, y se emite 'enter', 'move' o 'leave'.
+
+Variables de entorno:
+  AREA_CELL_DEG=0.01           lado de la celda en grados (~1.1 km en latitud)
+  AREA_MAX_WATCHERS=1000       suscripciones de área simultáneas por proceso
+  AREA_WATCH_MAX_CELLS=4096    celdas por suscripción; un área mayor se revisa con cada posición
+  AREA_QUEUE_MAX=256           eventos pendientes por suscripción antes de reenviar la foto completa
+  AREA_HEARTBEAT_S=15          comentario de keep-alive del stream SSE si no hubo eventos
+"""
+
+import asyncio
+import math
+import os
+
+from dotenv import load_dotenv
+
+from metrics import Counter, Gauge
+
+load_dotenv()
+
+AREA_CELL_DEG = float(os.getenv('AREA_CELL_DEG', 0.01))
+AREA_MAX_WATCHERS = int(os.getenv('AREA_MAX_WATCHERS', 1000))
+AREA_WATCH_MAX_CELLS = int(os.getenv('AREA_WATCH_MAX_CELLS', 4096))
+AREA_QUEUE_MAX = int(os.getenv('AREA_QUEUE_MAX', 256))
+AREA_HEARTBEAT_S = float(os.getenv('AREA_HEARTBEAT_S', 15))
+
+EARTH_RADIUS_M = 6_371_008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+AREA_EVENTS = Counter('area_watch_events_total', 'Eventos de suscripciones de área por tipo', ('event',))
+AREA_WATCHERS = Gauge('area_watchers', 'Suscripciones de área abiertas')
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Distancia haversine en metros (radio medio de la Tierra)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Area:
+    """Rectángulo o polígono en (lat, lng), con su rectángulo envolvente"""
+
+    def __init__(self, min_lat, min_lng, max_lat, max_lng, polygon=None):
+        if min_lat > max_lat or min_lng > max_lng:
+            raise ValueError("El rectángulo debe ir de (min_lat, min_lng) a (max_lat, max_lng)")
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = min_lat, min_lng, max_lat, max_lng
+        self.polygon = polygon
+
+    @classmethod
+    def from_polygon(cls, points):
+        polygon = [(float(lat), float(lng)) for lat, lng in points]
+        if len(polygon) < 3:
+            raise ValueError("El polígono necesita al menos 3 vértices")
+        lats = [lat for lat, _ in polygon]
+        lngs = [lng for _, lng in polygon]
+        return cls(min(lats), min(lngs), max(lats), max(lngs), polygon)
+
+    @classmethod
+    def parse(cls, bbox=None, polygon=None):
+        """Desde los parámetros de la URL: bbox='minLat,minLng,maxLat,maxLng' o polygon='lat,lng;lat,lng;...'"""
+        try:
+            if bbox:
+                values = [float(value) for value in bbox.split(',')]
+                if len(values) != 4:
+                    raise ValueError
+                return cls(*values)
+            if polygon:
+                return cls.from_polygon(point.split(',') for point in polygon.split(';') if point.strip())
+        except ValueError as e:
+            raise ValueError(str(e) or "Coordenadas inválidas") from None
+        raise ValueError("Se requiere bbox o polygon")
+
+    def contains(self, lat, lng):
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+        if self.polygon is None:
+            return True
+        # Ray casting sobre la longitud (mismo criterio que ST_Contains salvo en el borde)
+        inside = False
+        previous_lat, previous_lng = self.polygon[-1]
+        for vertex_lat, vertex_lng in self.polygon:
+            if (vertex_lat > lat) != (previous_lat > lat):
+                crossing = vertex_lng + (lat - vertex_lat) * (previous_lng - vertex_lng) / (previous_lat - vertex_lat)
+                if lng < crossing:
+                    inside = not inside
+            previous_lat, previous_lng = vertex_lat, vertex_lng
+        return inside
+
+
+class GridIndex:
+    """Dispositivos por celda de la rejilla, actualizados en el lugar"""
+
+    def __init__(self, cell_deg=AREA_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}    # (fila, columna) -> set(device_id)
+        self.points = {}   # device_id -> (lat, lng, celda)
+
+    def cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def cell_range(self, area):
+        """Filas y columnas (inclusive) que cubre el rectángulo envolvente del área"""
+        first_row, first_col = self.cell(area.min_lat, area.min_lng)
+        last_row, last_col = self.cell(area.max_lat, area.max_lng)
+        return first_row, last_row, first_col, last_col
+
+    def move(self, device_id, lat, lng):
+        cell = self.cell(lat, lng)
+        previous = self.points.get(device_id)
+        if previous is not None and previous[2] != cell:
+            self._discard(device_id, previous[2])
+        if previous is None or previous[2] != cell:
+            self.cells.setdefault(cell, set()).add(device_id)
+        self.points[device_id] = (lat, lng, cell)
+
+    def _discard(self, device_id, cell):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(device_id)
+            if not members:
+                del self.cells[cell]
+
+    def clear(self):
+        self.cells = {}
+        self.points = {}
+
+    def query(self, area):
+        """device_id de los dispositivos dentro del área"""
+        first_row, last_row, first_col, last_col = self.cell_range(area)
+        span = (last_row - first_row + 1) * (last_col - first_col + 1)
+        if span <= len(self.cells):
+            candidates = (
+                self.cells.get((row, col), ())
+                for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)
+            )
+        else:
+            # Área con más celdas que las ocupadas: recorrer solo las ocupadas
+            candidates = (
+                members for (row, col), members in self.cells.items()
+                if first_row <= row <= last_row and first_col <= col <= last_col
+            )
+        found = []
+        for members in candidates:
+            for device_id in members:
+                lat, lng, _ = self.points[device_id]
+                if area.contains(lat, lng):
+                    found.append(device_id)
+        return found
+
+    def nearest(self, lat, lng, limit, radius_m=None):
+        """[(distancia_m, device_id)] de los ``limit`` dispositivos más cercanos, del más cercano al más lejano"""
+        row, col = self.cell(lat, lng)
+        found = []
+        visited = 0
+        ring = 0
+        while visited < len(self.points):
+            cells = self._ring(row, col, ring)
+            if len(cells) > len(self.cells):
+                # Anillos más grandes que las celdas ocupadas: terminar con todas las que faltan
+                cells = [
+                    cell for cell in self.cells
+                    if max(abs(cell[0] - row), abs(cell[1] - col)) >= ring
+                ]
+                ring = None
+            for cell in cells:
+                for device_id in self.cells.get(cell, ()):
+                    visited += 1
+                    point_lat, point_lng, _ = self.points[device_id]
+                    found.append((distance_m(lat, lng, point_lat, point_lng), device_id))
+            if ring is None:
+                break
+            # Cota inferior de la distancia a cualquier dispositivo fuera de los anillos recorridos
+            bound = self._outside_bound(lat, lng, row, col, ring)
+            found.sort()
+            del found[limit:]
+            if (len(found) == limit and found[-1][0] <= bound) or (radius_m is not None and bound > radius_m):
+                break
+            ring += 1
+        found.sort()
+        if radius_m is not None:
+            found = [item for item in found if item[0] <= radius_m]
+        return found[:limit]
+
+    @staticmethod
+    def _ring(row, col, ring):
+        if ring == 0:
+            return [(row, col)]
+        top, bottom = row - ring, row + ring
+        cells = [(top, c) for c in range(col - ring, col + ring + 1)]
+        cells += [(bottom, c) for c in range(col - ring, col + ring + 1)]
+        cells += [(r, col - ring) for r in range(top + 1, bottom)]
+        cells += [(r, col + ring) for r in range(top + 1, bottom)]
+        return cells
+
+    def _outside_bound(self, lat, lng, row, col, ring):
+        size = self.cell_deg
+        lat_low, lat_high = (row - ring) * size, (row + ring + 1) * size
+        lng_low, lng_high = (col - ring) * size, (col + ring + 1) * size
+        lat_gap = min(lat - lat_low, lat_high - lat) * METERS_PER_DEGREE
+        # Los grados de longitud se encogen hacia los polos: el coseno del borde más alejado del ecuador
+        shrink = math.cos(math.radians(min(89.9, max(abs(lat_low), abs(lat_high)))))
+        lng_gap = min(lng - lng_low, lng_high - lng) * METERS_PER_DEGREE * shrink
+        return min(lat_gap, lng_gap)
+
+
+class AreaWatch:
+    """Suscripción a un área: dispositivos que tiene dentro y eventos pendientes para el cliente"""
+
+    def __init__(self, area, queue_max=AREA_QUEUE_MAX):
+        self.area = area
+        self.members = set()
+        self.cells = ()
+        self.queue = asyncio.Queue(queue_max)
+
+    def push(self, event, payload):
+        try:
+            self.queue.put_nowait((event, payload))
+        except asyncio.QueueFull:
+            # Cliente lento: lo pendiente se reemplaza por una foto completa al leer
+            self.drain()
+            self.queue.put_nowait(('snapshot', None))
+            AREA_EVENTS.inc(labels=('overflow',))
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class AreaWatchers:
+    """Suscripciones de área sobre la caché de últimas posiciones (``positions.index``)"""
+
+    def __init__(self, positions, max_watchers=AREA_MAX_WATCHERS, max_cells=AREA_WATCH_MAX_CELLS):
+        self.positions = positions
+        self.max_watchers = max_watchers
+        self.max_cells = max_cells
+        self.watches = set()
+        self.by_cell = {}     # celda -> suscripciones que la cubren
+        self.by_device = {}   # device_id -> suscripciones que lo tienen dentro
+        self.wide = set()     # suscripciones de más de max_cells celdas
+
+    def add(self, area):
+        if len(self.watches) >= self.max_watchers:
+            raise RuntimeError("Demasiadas suscripciones de área")
+        watch = AreaWatch(area)
+        first_row, last_row, first_col, last_col = self.positions.index.cell_range(area)
+        if (last_row - first_row + 1) * (last_col - first_col + 1) > self.max_cells:
+            self.wide.add(watch)
+        else:
+            watch.cells = [(row, col) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+            for cell in watch.cells:
+                self.by_cell.setdefault(cell, set()).add(watch)
+        self.watches.add(watch)
+        self._fill(watch)
+        AREA_WATCHERS.set(len(self.watches))
+        return watch
+
+    def remove(self, watch):
+        if watch not in self.watches:
+            return
+        self.watches.discard(watch)
+        self.wide.discard(watch)
+        for cell in watch.cells:
+            watchers = self.by_cell.get(cell)
+            if watchers is not None:
+                watchers.discard(watch)
+                if not watchers:
+                    del self.by_cell[cell]
+        self._empty(watch)
+        AREA_WATCHERS.set(len(self.watches))
+
+    def _fill(self, watch):
+        watch.members = set(self.positions.index.query(watch.area))
+        for device_id in watch.members:
+            self.by_device.setdefault(device_id, set()).add(watch)
+
+    def _empty(self, watch):
+        for device_id in watch.members:
+            watchers = self.by_device.get(device_id)
+            if watchers is not None:
+                watchers.discard(watch)
+                if not watchers:
+                    del self.by_device[device_id]
+        watch.members = set()
+
+    def snapshot(self, watch):
+        """Posiciones dentro del área; descarta los eventos pendientes, que la foto ya incluye"""
+        watch.drain()
+        return [self.positions.get(device_id) for device_id in sorted(watch.members)]
+
+    def resync(self):
+        """Tras recargar la caché: recalcular todas las áreas y reenviar la foto"""
+        for watch in self.watches:
+            self._empty(watch)
+            self._fill(watch)
+            watch.drain()
+            watch.push('snapshot', None)
+
+    def on_position(self, position):
+        """Suscriptor de 'position' del hub, después de la caché que mueve el índice"""
+        device_id = position.get('device_id')
+        # Una posición más vieja que la de la caché no se guardó y no genera eventos
+        if self.positions.get(device_id) is not position:
+            return
+        point = self.positions.index.points.get(device_id)
+        if point is None or not self.watches:
+            return
+        lat, lng, cell = point
+        candidates = self.by_cell.get(cell, set()) | self.by_device.get(device_id, set()) | self.wide
+        for watch in candidates:
+            if watch.area.contains(lat, lng):
+                if device_id in watch.members:
+                    event = 'move'
+                else:
+                    event = 'enter'
+                    watch.members.add(device_id)
+                    self.by_device.setdefault(device_id, set()).add(watch)
+                watch.push(event, position)
+            elif device_id in watch.members:
+                event = 'leave'
+                watch.members.discard(device_id)
+                watchers = self.by_device[device_id]
+                watchers.discard(watch)
+                if not watchers:
+                    del self.by_device[device_id]
+                watch.push(event, {'device_id': device_id})
+            else:
+                continue
+            AREA_EVENTS.inc(labels=(event,))
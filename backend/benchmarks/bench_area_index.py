@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la consulta "dispositivos en el área" sobre las últimas posiciones.
+Compara el filtrado de toda la flota (lo que hacía el navegador con
+latest-by-devices) con LatestPositions.in_area (índice de rejilla), para un
+rectángulo y un polígono de ~2 km alrededor de un punto, y mide el costo por
+posición de mantener el índice y 100 suscripciones de área.
+Ejecutar desde backend/: python benchmarks/bench_area_index.py [dispositivos] [consultas]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from area_index import Area, AreaWatchers
+from live import LatestPositions
+
+# Centro aproximado del área de operación (ver el mapa del frontend)
+ORIGIN = (11.01315, -74.82767)
+
+
+def position(device_id, lat, lng):
+    return {'device_id': device_id, 'latitude': lat, 'longitude': lng, 'timestamp_value': 0}
+
+
+def fleet(devices, rng, spread=0.5):
+    return [
+        position(f'device-{i}', ORIGIN[0] + rng.uniform(-spread, spread), ORIGIN[1] + rng.uniform(-spread, spread))
+        for i in range(devices)
+    ]
+
+
+def areas(queries, rng, half=0.01):
+    result = []
+    for i in range(queries):
+        lat, lng = ORIGIN[0] + rng.uniform(-0.4, 0.4), ORIGIN[1] + rng.uniform(-0.4, 0.4)
+        if i % 2:
+            result.append(Area(lat - half, lng - half, lat + half, lng + half))
+        else:
+            result.append(Area.from_polygon([(lat - half, lng - half), (lat + half, lng), (lat - half, lng + half)]))
+    return result
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+async def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(7)
+    cache = LatestPositions()
+    cache.prime(fleet(devices, rng))
+    shapes = areas(queries, rng)
+    print(f"{devices} dispositivos, {queries} áreas de ~2 km, {len(cache.index.cells)} celdas ocupadas")
+
+    found = [0]
+
+    def scan():
+        for area in shapes:
+            found[0] = len([p for p in cache.all() if area.contains(p['latitude'], p['longitude'])])
+
+    def indexed():
+        for area in shapes:
+            found[0] = len(cache.in_area(area))
+
+    for area in shapes:
+        scanned = sorted(p['device_id'] for p in cache.all() if area.contains(p['latitude'], p['longitude']))
+        assert scanned == [p['device_id'] for p in cache.in_area(area)]
+
+    scan_time = timed(scan, 1) / queries
+    index_time = timed(indexed, 5) / queries
+    print(f"  filtrar la flota  {scan_time * 1e3:10.3f} ms/consulta")
+    print(f"  índice de rejilla {index_time * 1e3:10.3f} ms/consulta")
+    print(f"  aceleración       {scan_time / index_time:10.1f}x")
+
+    watchers = AreaWatchers(cache)
+    for area in shapes[:100]:
+        watchers.add(area)
+    updates = [position(f'device-{rng.randrange(devices)}', ORIGIN[0] + rng.uniform(-0.5, 0.5),
+                        ORIGIN[1] + rng.uniform(-0.5, 0.5)) for _ in range(100_000)]
+
+    def ingest():
+        for update in updates:
+            cache.update(update)
+            watchers.on_position(update)
+
+    per_update = timed(ingest, 1) / len(updates)
+    print(f"  posición + 100 suscripciones {per_update * 1e6:8.2f} µs")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
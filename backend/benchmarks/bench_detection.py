@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la detección de personas en el servidor, solo CPU.
+1. Costo de un análisis HOG por ancho de frame, en un solo proceso.
+2. El pipeline completo (PersonDetector) con N dispositivos a 30 fps y pools de
+   distinto tamaño: frames analizados y descartados por segundo, latencia del
+   análisis y retraso máximo del event loop medido con un ticker de 10 ms, que
+   muestra que el loop sigue libre mientras el pool decodifica y analiza, y los
+   keyframes pedidos al broadcaster (PLI), que deben ser 0.
+Los frames son sintéticos (ruido con bordes, 1280x720) codificados en VP8 como los
+entrega el SFU: un keyframe cada [keyframe_s] segundos o cuando se pide y frames delta
+el resto del tiempo, así que la tasa analizada es la menor entre DETECTION_SAMPLE_FPS y
+la de keyframes. El costo de HOG depende sobre todo del tamaño, no del contenido.
+Ejecutar desde backend/: python benchmarks/bench_detection.py [dispositivos] [segundos] [keyframe_s]
+"""
+
+import asyncio
+import fractions
+import os
+import statistics
+import sys
+import time
+
+import av
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import person_detector
+from person_detector import DETECTION_FRAMES, PersonDetector, count_people
+
+SOURCE_FPS = 30
+WIDTH, HEIGHT = 1280, 720
+
+
+class SyntheticSource:
+    """Lo que PersonDetector usa de sfu.PublishedTrack: frames VP8 y pedidos de keyframe"""
+
+    def __init__(self, keyframe, delta, gop, phase=0):
+        self.keyframe = keyframe
+        self.delta = delta
+        self.gop = gop
+        # Desfase del GOP: los teléfonos no envían keyframes sincronizados
+        self.frames = phase
+        self.keyframe_requests = 0
+        self.keyframe_requested = False
+
+    def request_keyframe(self):
+        self.keyframe_requests += 1
+        self.keyframe_requested = True
+
+    def next_frame(self):
+        periodic = self.frames % self.gop == 0
+        self.frames += 1
+        if periodic or self.keyframe_requested:
+            self.keyframe_requested = False
+            return self.keyframe, True
+        return self.delta, False
+
+
+def encode_vp8(image):
+    """(keyframe, frame delta) VP8 de la imagen, como los ensambla aiortc"""
+    encoder = av.CodecContext.create('libvpx', 'w')
+    encoder.width, encoder.height = WIDTH, HEIGHT
+    encoder.pix_fmt = 'yuv420p'
+    encoder.time_base = fractions.Fraction(1, SOURCE_FPS)
+    encoder.bit_rate = 1_500_000
+    packets = []
+    for pts in range(2):
+        frame = av.VideoFrame.from_ndarray(image, format='gray').reformat(format='yuv420p')
+        frame.pts = pts
+        packets.extend(encoder.encode(frame))
+    packets.extend(encoder.encode(None))
+    return bytes(packets[0]), bytes(packets[1])
+
+
+def synthetic_image(seed):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 255, (HEIGHT, WIDTH), dtype=np.uint8)
+    # Rectángulos con bordes marcados para que HOG tenga gradientes que evaluar
+    for _ in range(20):
+        x, y = rng.integers(0, WIDTH - 120), rng.integers(0, HEIGHT - 240)
+        cv2.rectangle(image, (int(x), int(y)), (int(x) + 60, int(y) + 180), int(rng.integers(0, 255)), -1)
+    return image
+
+
+def bench_single(image):
+    print("Análisis HOG en un proceso")
+    print(f"{'ancho':>8} {'ms/frame':>10} {'frames/s':>10}")
+    for width in (320, 480, 640, 960):
+        gray = cv2.resize(image, (width, round(HEIGHT * width / WIDTH) // 2 * 2), interpolation=cv2.INTER_AREA)
+        count_people(gray)  # inicializa HOG
+        runs = []
+        for _ in range(5):
+            started = time.perf_counter()
+            count_people(gray)
+            runs.append(time.perf_counter() - started)
+        per_frame = statistics.median(runs)
+        print(f"{width:>8} {per_frame * 1000:>10.1f} {1 / per_frame:>10.1f}")
+
+
+async def bench_pipeline(frames, devices, workers, seconds, gop):
+    published = []
+
+    async def publish(device_id, person_count, timestamp):
+        published.append(device_id)
+
+    detector = PersonDetector(publish, workers=workers, sample_fps=person_detector.DETECTION_SAMPLE_FPS)
+    loop = asyncio.get_running_loop()
+
+    # Arranque del pool fuera de la medición
+    for _ in range(workers):
+        detector._pool().submit(_warm).result()
+
+    lag = []
+
+    async def ticker():
+        while True:
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            lag.append(loop.time() - expected)
+
+    tracks = []
+
+    async def source(index):
+        device_id = f'cam-{index}'
+        track = SyntheticSource(*frames, gop, phase=index * gop // devices)
+        tracks.append(track)
+        while True:
+            data, keyframe = track.next_frame()
+            detector.offer(device_id, track, 'VP8', data, keyframe)
+            await asyncio.sleep(1 / SOURCE_FPS)
+
+    before = dict(DETECTION_FRAMES.values)
+    tasks = [asyncio.create_task(ticker())] + [
+        asyncio.create_task(source(i)) for i in range(devices)
+    ]
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    delta = {key[0]: value - before.get(key, 0) for key, value in DETECTION_FRAMES.values.items()}
+    await detector.close()
+    analyzed = delta.get('analyzed', 0) / seconds
+    dropped = delta.get('dropped', 0) / seconds
+    requests = sum(track.keyframe_requests for track in tracks)
+    print(f"{workers:>8} {analyzed:>12.1f} {analyzed / devices:>12.2f} {dropped:>13.1f} {max(lag) * 1000:>11.1f} "
+          f"{statistics.median(lag) * 1000:>12.2f} {requests:>5}")
+
+
+def _warm():
+    count_people(np.zeros((128, 64), dtype=np.uint8))
+
+
+async def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    keyframe_s = float(sys.argv[3]) if len(sys.argv) > 3 else 2
+    image = synthetic_image(0)
+    bench_single(image)
+    frames = encode_vp8(image)
+    print()
+    print(f"Pipeline: {devices} dispositivos a {SOURCE_FPS} fps, muestreo {person_detector.DETECTION_SAMPLE_FPS:g} fps, "
+          f"{person_detector.DETECTION_FRAME_WIDTH} px, keyframe cada {keyframe_s:g} s, {os.cpu_count()} CPU")
+    print(f"{'procesos':>8} {'analizados/s':>12} {'por disp./s':>12} {'descartados/s':>13} {'lag máx ms':>11} "
+          f"{'lag p50 ms':>12} {'PLI':>5}")
+    for workers in sorted({1, 2, max(os.cpu_count() or 1, 1)}):
+        await bench_pipeline(frames, devices, workers, seconds, max(round(keyframe_s * SOURCE_FPS), 1))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la agrupación de candidatos ICE (ICE_BATCH_MS).
+Levanta el servidor de señalización en este proceso y conecta un broadcaster y
+N viewers (python-socketio). El broadcaster envía el offer y luego sus candidatos
+con un patrón de trickle típico (host, srflx y relay en ráfagas). Para cada modo se mide:
+  - mensajes ICE que recibe cada viewer
+  - latencia hasta el primer candidato y hasta el último, desde el offer
+
+Sin medios reales, el tiempo hasta el primer frame se aproxima con la llegada de los
+candidatos: las comprobaciones ICE empiezan con el primero y terminan como pronto
+con el último.
+Ejecutar desde backend/: python benchmarks/bench_ice_batching.py [viewers] [ventana_ms ...]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import socketio
+
+import webrtc_server
+from ice_batch import IceBatcher
+
+PORT = int(os.getenv('BENCH_PORT', 8097))
+URL = f'http://127.0.0.1:{PORT}'
+
+# (espera antes de la ráfaga en ms, candidatos en la ráfaga): host, srflx (STUN), relay (TURN)
+TRICKLE = [(0, 6), (40, 4), (120, 4)]
+CANDIDATES = sum(count for _, count in TRICKLE)
+
+
+def candidate(i):
+    return {'sdpMid': '0', 'sdpMLineIndex': 0,
+            'candidate': f'candidate:{i} 1 udp 2122260223 192.168.1.{i} 5{i:04d} typ host'}
+
+
+async def run_session(broadcaster, viewer, received):
+    received.clear()
+    received['start'] = time.perf_counter()
+    target = viewer.get_sid()
+    await broadcaster.emit('offer', {'target': target, 'sdp': {'type': 'offer', 'sdp': 'v=0'}})
+    sent = 0
+    for wait_ms, count in TRICKLE:
+        await asyncio.sleep(wait_ms / 1000)
+        for _ in range(count):
+            await broadcaster.emit('ice-candidate', {'target': target, 'candidate': candidate(sent)})
+            sent += 1
+            await asyncio.sleep(0.002)
+    while received.get('count', 0) < CANDIDATES:
+        await asyncio.sleep(0.001)
+    return received['messages'], received['first'] - received['start'], received['last'] - received['start']
+
+
+def viewer_client(received):
+    client = socketio.AsyncClient()
+
+    def note(count):
+        now = time.perf_counter()
+        received.setdefault('first', now)
+        received['last'] = now
+        received['messages'] = received.get('messages', 0) + 1
+        received['count'] = received.get('count', 0) + count
+
+    client.on('ice-candidate', lambda data: note(1))
+    client.on('ice-candidates', lambda data: note(len(data['candidates'])))
+    return client
+
+
+async def measure(viewers, window_ms):
+    webrtc_server.ice_batcher = IceBatcher(webrtc_server._deliver_ice, window_ms) if window_ms else None
+    broadcaster = socketio.AsyncClient()
+    await broadcaster.connect(URL)
+    await broadcaster.emit('register-broadcaster', {'deviceId': 'bench-cam'})
+
+    results = []
+    for i in range(viewers):
+        received = {}
+        viewer = viewer_client(received)
+        await viewer.connect(URL)
+        await viewer.emit('register-viewer', {'viewerId': f'bench-{i}', 'iceBatch': True})
+        await asyncio.sleep(0.05)
+        results.append(await run_session(broadcaster, viewer, received))
+        await viewer.disconnect()
+    await broadcaster.disconnect()
+
+    messages = statistics.mean(r[0] for r in results)
+    first = statistics.median(r[1] for r in results) * 1000
+    last = statistics.median(r[2] for r in results) * 1000
+    label = f"{window_ms:g} ms" if window_ms else "sin agrupar"
+    print(f"  {label:>12}  {messages:6.1f} msg/viewer  primer candidato {first:6.1f} ms  "
+          f"último {last:6.1f} ms")
+
+
+async def main():
+    viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    windows = [float(w) for w in sys.argv[2:]] or [0, 10, 25, 50]
+    runner = await webrtc_server.start_webrtc_server(host='127.0.0.1', port=PORT)
+    print(f"{viewers} viewers, {CANDIDATES} candidatos por sesión en {len(TRICKLE)} ráfagas")
+    try:
+        for window_ms in windows:
+            await measure(viewers, window_ms)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Costo del logging en el hilo del event loop, por mensaje.
+Escribe a una tubería drenada por otro hilo (como stdout bajo PM2) y compara:
+print síncrono, StreamHandler síncrono (logging.basicConfig), la cola de log_config
+con JSON, la cola con límite de tasa del camino caliente y un mensaje DEBUG deshabilitado.
+Ejecutar desde backend/: python benchmarks/bench_logging.py [mensajes]
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import logging.handlers
+
+from log_config import EnqueueHandler, HotPathLogger, JSONFormatter
+
+
+def make_pipe(read_delay=0.0):
+    """Tubería cuyo extremo de lectura se vacía en un hilo aparte (lento si read_delay > 0)"""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, 'rb', buffering=0) as reader:
+            while reader.read(512 if read_delay else 65536):
+                if read_delay:
+                    time.sleep(read_delay)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(write_fd, 'w', buffering=1)
+
+
+def fresh_logger(name, *handlers, level=logging.INFO):
+    logger = logging.getLogger(name)
+    logger.handlers = list(handlers)
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def wait_drained(log_queue):
+    """Espera a que el listener vacíe la cola para no medir su trabajo en la siguiente variante"""
+    while not log_queue.empty():
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def timed(n, fn):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    out = make_pipe()
+    addr = ('10.0.0.12', 52811)
+    results = []
+
+    results.append(('print (2 por datagrama, antes)', timed(n, lambda i: (
+        print(f"UDP mensaje recibido de {addr[0]}:{addr[1]}", file=out),
+        print(f"Datos insertados: {i}", file=out),
+    ))))
+
+    sync_handler = logging.StreamHandler(out)
+    sync_handler.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+    sync_logger = fresh_logger('bench.sync', sync_handler)
+    results.append(('StreamHandler síncrono (logger.info f-string)', timed(
+        n, lambda i: sync_logger.info(f"📨 Retransmitiendo OFFER de {addr[0]} a {i}")
+    )))
+
+    log_queue = queue.SimpleQueue()
+    json_handler = logging.StreamHandler(out)
+    json_handler.setFormatter(JSONFormatter())
+    listener = logging.handlers.QueueListener(log_queue, json_handler)
+    listener.start()
+
+    queue_logger = fresh_logger('bench.queue', EnqueueHandler(log_queue))
+    results.append(('cola + JSON (sin límite)', timed(
+        n, lambda i: queue_logger.info("📨 Retransmitiendo OFFER de %s a %s", addr[0], i)
+    )))
+    wait_drained(log_queue)
+
+    limited_logger = HotPathLogger(fresh_logger('bench.limited', EnqueueHandler(log_queue)), 20)
+    results.append(('cola + límite 20/s (camino caliente)', timed(
+        n, lambda i: limited_logger.info("📨 Retransmitiendo OFFER de %s a %s", addr[0], i)
+    )))
+    wait_drained(log_queue)
+
+    results.append(('DEBUG deshabilitado (udp.ingest)', timed(
+        n, lambda i: queue_logger.debug("UDP mensaje recibido de %s:%s", addr[0], addr[1])
+    )))
+
+    listener.stop()
+
+    # Consumidor lento de stdout (PM2 con disco o red lentos): print bloquea el loop
+    # cuando se llena la tubería; la cola solo encola
+    slow_n = n // 5
+    slow_out = make_pipe(read_delay=0.001)
+    results.append(('print, stdout lento', timed(
+        slow_n, lambda i: print(f"UDP mensaje recibido de {addr[0]}:{addr[1]}", file=slow_out)
+    )))
+    slow_queue = queue.SimpleQueue()
+    slow_handler = logging.StreamHandler(slow_out)
+    slow_handler.setFormatter(JSONFormatter())
+    slow_listener = logging.handlers.QueueListener(slow_queue, slow_handler)
+    slow_listener.start()
+    slow_logger = fresh_logger('bench.slow', EnqueueHandler(slow_queue))
+    results.append(('cola + JSON, stdout lento', timed(
+        slow_n, lambda i: slow_logger.info("UDP mensaje recibido de %s:%s", addr[0], addr[1])
+    )))
+
+    for name, micros in results:
+        print(f"{name:48} {micros:8.2f} µs/mensaje")
+    os._exit(0)  # no esperar a que el consumidor lento vacíe la cola
+
+
+if __name__ == '__main__':
+    main()
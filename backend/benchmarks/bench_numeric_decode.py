@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark de decodificación de columnas DECIMAL de location_data.
+Compara el codec por defecto de asyncpg (decimal.Decimal + coerción a float en
+pydantic) con el codec numeric -> float que registra Database._init_connection.
+Necesita un PostgreSQL local:
+  BENCH_DSN=postgresql://postgres@localhost/postgres python benchmarks/bench_numeric_decode.py [filas]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import asyncpg
+
+
+SETUP = """
+CREATE TEMP TABLE bench_location (
+    latitude DECIMAL(10, 8) NOT NULL,
+    longitude DECIMAL(11, 8) NOT NULL,
+    accuracy DECIMAL(8, 2),
+    altitude DECIMAL(8, 2),
+    speed DECIMAL(8, 2)
+);
+INSERT INTO bench_location
+SELECT 11.0 + random() / 100, -74.8 - random() / 100, random() * 20, random() * 50, random() * 30
+FROM generate_series(1, $ROWS);
+"""
+
+QUERY = "SELECT latitude, longitude, accuracy, altitude, speed FROM bench_location"
+
+
+async def run(connection, convert, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = await connection.fetch(QUERY)
+        for record in records:
+            # Lo que antes hacía pydantic con cada campo Decimal
+            convert(record['latitude']), convert(record['longitude'])
+            convert(record['accuracy']), convert(record['altitude']), convert(record['speed'])
+        best = min(best, time.perf_counter() - start)
+    return len(records) / best
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dsn = os.getenv('BENCH_DSN', 'postgresql://postgres@localhost/postgres')
+    connection = await asyncpg.connect(dsn)
+    try:
+        await connection.execute(SETUP.replace('$ROWS', str(rows)))
+
+        decimal_rate = await run(connection, float)
+
+        await connection.set_type_codec(
+            'numeric', schema='pg_catalog', encoder=str, decoder=float, format='text'
+        )
+        float_rate = await run(connection, lambda value: value)
+    finally:
+        await connection.close()
+
+    print(f"filas: {rows}")
+    print(f"Decimal + float(): {decimal_rate:>12,.0f} filas/s")
+    print(f"codec float:       {float_rate:>12,.0f} filas/s  ({float_rate / decimal_rate:.2f}x)")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de serialización de los endpoints de listas.
+Compara filas/segundo entre el camino anterior (modelo pydantic por fila +
+validación/serialización de response_model) y RecordsResponse (orjson directo).
+Ejecutar desde backend/: python benchmarks/bench_serialization.py [filas]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pydantic import TypeAdapter
+
+from models import LocationResponse, AllLocationsResponse
+from serializers import RecordsResponse
+
+
+def make_rows(n):
+    """Filas sintéticas con los mismos tipos que devuelve asyncpg"""
+    base = datetime(2025, 1, 1)
+    rows = []
+    for i in range(n):
+        rows.append({
+            'id': i,
+            'latitude': Decimal('11.0041') + Decimal(i % 1000) / Decimal(100000),
+            'longitude': Decimal('-74.8070') - Decimal(i % 1000) / Decimal(100000),
+            'timestamp_value': 1735689600000 + i * 1000,
+            'accuracy': Decimal('5.20'),
+            'altitude': Decimal('12.00'),
+            'speed': Decimal('1.35'),
+            'provider': 'gps',
+            'created_at': base + timedelta(seconds=i),
+            'device_id': f'device-{i % 50}',
+        })
+    return rows
+
+
+def project(rows, fields):
+    return [{k: r[k] for k in fields} for r in rows]
+
+
+def old_path(rows, model):
+    """Construcción por fila + response_model como lo hace FastAPI"""
+    adapter = TypeAdapter(list[model])
+    models = [model(**r) for r in rows]
+    value = adapter.validate_python(models, from_attributes=True)
+    content = adapter.dump_python(value, mode='json')
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode('utf-8')
+
+
+def new_path(rows, model):
+    return RecordsResponse(rows).body
+
+
+def bench(fn, rows, model, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows, model)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = make_rows(n)
+    location_fields = list(LocationResponse.model_fields)
+    endpoints = [
+        ('/api/location/latest-by-devices', project(rows[:50], location_fields), LocationResponse),
+        ('/api/location/all', rows[:1000], AllLocationsResponse),
+        ('/api/location/range', project(rows, location_fields), LocationResponse),
+    ]
+
+    print(f"{'endpoint':36} {'filas':>8} {'antes (filas/s)':>16} {'después (filas/s)':>18} {'x':>6}")
+    for name, data, model in endpoints:
+        before = bench(old_path, data, model)
+        after = bench(new_path, data, model)
+        print(f"{name:36} {len(data):>8} {before:>16,.0f} {after:>18,.0f} {after / before:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark del registro de sesiones de señalización.
+Simula N sesiones (broadcasters y viewers) que se registran, piden stream y se
+desconectan en orden aleatorio, comparando el esquema anterior (búsqueda lineal
+del sid en active_broadcasters/active_viewers) con SessionRegistry.
+Ejecutar desde backend/: python benchmarks/bench_sessions.py [sesiones] [dispositivos]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sessions import SessionRegistry
+
+
+class LinearSessions:
+    """Copia de la lógica anterior de webrtc_server (sin los emits)"""
+
+    def __init__(self):
+        self.broadcasters = {}
+        self.viewers = {}
+        self.broadcaster_viewers = {}
+
+    def register_broadcaster(self, sid, device_id):
+        self.broadcasters[device_id] = sid
+        if device_id not in self.broadcaster_viewers:
+            self.broadcaster_viewers[device_id] = set()
+
+    def register_viewer(self, sid, viewer_id):
+        self.viewers[viewer_id] = {'socketId': sid, 'watchingDevice': None}
+
+    def watch(self, sid, device_id):
+        broadcaster_sid = self.broadcasters.get(device_id)
+        if broadcaster_sid:
+            for viewer_data in self.viewers.values():
+                if viewer_data['socketId'] == sid:
+                    viewer_data['watchingDevice'] = device_id
+                    break
+            self.broadcaster_viewers.setdefault(device_id, set()).add(sid)
+        return broadcaster_sid
+
+    def remove(self, sid):
+        for device_id, broadcaster_sid in list(self.broadcasters.items()):
+            if broadcaster_sid == sid:
+                del self.broadcasters[device_id]
+                self.broadcaster_viewers.pop(device_id, None)
+                break
+        for viewer_id, viewer_data in list(self.viewers.items()):
+            if viewer_data['socketId'] == sid:
+                watching = viewer_data.get('watchingDevice')
+                if watching in self.broadcaster_viewers:
+                    self.broadcaster_viewers[watching].discard(sid)
+                del self.viewers[viewer_id]
+                break
+
+
+def make_script(sessions, devices, seed=7):
+    """Secuencia de operaciones: conexiones intercaladas y desconexiones en orden aleatorio"""
+    rng = random.Random(seed)
+    ops = []
+    for i in range(devices):
+        ops.append(('broadcaster', f'b{i}', f'device-{i}'))
+    for i in range(sessions - devices):
+        sid = f'v{i}'
+        ops.append(('viewer', sid, f'viewer-{i}'))
+        ops.append(('watch', sid, f'device-{rng.randrange(devices)}'))
+    leaving = [f'v{i}' for i in range(sessions - devices)] + [f'b{i}' for i in range(devices)]
+    rng.shuffle(leaving)
+    ops.extend(('remove', sid, None) for sid in leaving)
+    return ops
+
+
+def run(impl, ops):
+    start = time.perf_counter()
+    for op, sid, arg in ops:
+        if op == 'broadcaster':
+            impl.register_broadcaster(sid, arg)
+        elif op == 'viewer':
+            impl.register_viewer(sid, arg)
+        elif op == 'watch':
+            impl.watch(sid, arg)
+        else:
+            impl.remove(sid)
+    elapsed = time.perf_counter() - start
+    assert not impl.broadcasters and not impl.viewers
+    return elapsed
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    ops = make_script(sessions, devices)
+    print(f"{sessions} sesiones, {devices} dispositivos, {len(ops)} operaciones")
+
+    registry_time = run(SessionRegistry(), ops)
+    print(f"  SessionRegistry   {registry_time * 1000:10.1f} ms  "
+          f"({len(ops) / registry_time:,.0f} ops/s)")
+    linear_time = run(LinearSessions(), ops)
+    print(f"  búsqueda lineal   {linear_time * 1000:10.1f} ms  "
+          f"({len(ops) / linear_time:,.0f} ops/s)")
+    print(f"  aceleración       {linear_time / registry_time:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
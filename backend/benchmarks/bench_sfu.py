@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark de CPU del modo SFU por viewer (loopback).
+El proceso principal ejecuta solo el SfuRouter. Un proceso hijo ejecuta el
+broadcaster (aiortc con un track sintético de ruido, para que el códec produzca un
+bitrate realista) y los viewers, que consumen sus tracks. La señalización viaja
+por un Pipe. Para 0, 1, 2, 4, ... viewers se mide la CPU del proceso del SFU
+durante una ventana fija (getrusage, todos los hilos) y se calcula el costo
+incremental por viewer.
+Ejecutar desde backend/: python benchmarks/bench_sfu.py [max_viewers] [segundos]
+"""
+
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+DEVICE_ID = 'bench-cam'
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def _recv(conn):
+    return await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+
+async def run_sfu(conn):
+    """Proceso principal: solo el SFU"""
+    from sfu import SFU_FRAMES, SfuRouter
+
+    async def emit(event, data, room):
+        conn.send(('signal', event, data, room))
+
+    router = SfuRouter(emit)
+    while True:
+        message = await _recv(conn)
+        kind = message[0]
+        if kind == 'offer':
+            await router.publish('broadcaster', DEVICE_ID, message[1])
+        elif kind == 'subscribe':
+            await router.subscribe(message[1], DEVICE_ID)
+        elif kind == 'answer':
+            await router.answer(message[1], message[2])
+        elif kind == 'measure':
+            frames_before = sum(SFU_FRAMES.values.values())
+            cpu_before = _cpu_seconds()
+            await asyncio.sleep(message[1])
+            conn.send(('measured', _cpu_seconds() - cpu_before,
+                       sum(SFU_FRAMES.values.values()) - frames_before))
+        elif kind == 'stop':
+            await router.close()
+            return
+
+
+def run_peers(conn, max_viewers, seconds):
+    """Proceso hijo: broadcaster y viewers"""
+    asyncio.run(_run_peers(conn, max_viewers, seconds))
+
+
+async def _run_peers(conn, max_viewers, seconds):
+    from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+    from av import VideoFrame
+
+    class NoiseTrack(VideoStreamTrack):
+        """320x240 a 30 fps con contenido cambiante"""
+
+        async def recv(self):
+            pts, time_base = await self.next_timestamp()
+            frame = VideoFrame(width=320, height=240, format='yuv420p')
+            for plane in frame.planes:
+                plane.update(os.urandom(plane.buffer_size))
+            frame.pts = pts
+            frame.time_base = time_base
+            return frame
+
+    async def consume(track):
+        try:
+            while True:
+                await track.recv()
+        except Exception:
+            pass
+
+    broadcaster = RTCPeerConnection()
+    broadcaster.addTrack(NoiseTrack())
+    await broadcaster.setLocalDescription(await broadcaster.createOffer())
+    conn.send(('offer', {'type': 'offer', 'sdp': broadcaster.localDescription.sdp}))
+    _, event, data, _ = await _recv(conn)
+    await broadcaster.setRemoteDescription(RTCSessionDescription(sdp=data['sdp']['sdp'], type='answer'))
+
+    viewers = []
+    counts = [0] + [2 ** i for i in range(max_viewers.bit_length()) if 2 ** i <= max_viewers]
+    print(f"{'viewers':>8} {'CPU SFU':>10} {'por viewer':>12} {'frames/s':>10}")
+    baseline = None
+    for count in counts:
+        while len(viewers) < count:
+            viewer_id = f'viewer-{len(viewers)}'
+            pc = RTCPeerConnection()
+            pc.on('track', lambda track: asyncio.ensure_future(consume(track)))
+            viewers.append(pc)
+            conn.send(('subscribe', viewer_id))
+            _, event, data, _ = await _recv(conn)
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=data['sdp']['sdp'], type='offer'))
+            await pc.setLocalDescription(await pc.createAnswer())
+            conn.send(('answer', viewer_id, {'type': 'answer', 'sdp': pc.localDescription.sdp}))
+        await asyncio.sleep(2)  # conexión establecida y primer keyframe
+        conn.send(('measure', seconds))
+        _, cpu, frames = await _recv(conn)
+        percent = cpu / seconds * 100
+        if baseline is None:
+            baseline = percent
+            per_viewer = '-'
+        else:
+            per_viewer = f"{(percent - baseline) / count:.2f}%"
+        print(f"{count:>8} {percent:>9.1f}% {per_viewer:>12} {frames / seconds:>10.1f}")
+
+    conn.send(('stop',))
+    for pc in viewers + [broadcaster]:
+        await pc.close()
+
+
+def main():
+    max_viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    parent, child = multiprocessing.Pipe()
+    peers = multiprocessing.get_context('spawn').Process(target=run_peers, args=(child, max_viewers, seconds))
+    peers.start()
+    asyncio.run(run_sfu(parent))
+    peers.join()
+
+
+if __name__ == '__main__':
+    main()
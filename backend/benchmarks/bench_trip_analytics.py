@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la analítica de recorridos (trip_analytics.analyze) sobre una pista
+sintética de varios millones de puntos a 1 Hz: trayectos a velocidad variable,
+paradas con ruido de GPS y huecos sin señal.
+Compara con un lazo de Python sobre dicts (la forma de las filas de
+get_locations_by_range) que calcula solo distancia, tiempo en movimiento y
+paradas, medido sobre una parte de la pista y extrapolado.
+Mejor de 3 ejecuciones. Ejecutar desde backend/: python benchmarks/bench_trip_analytics.py [puntos] [puntos_lazo]
+"""
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from trip_analytics import (
+    ANALYTICS_GAP_S, ANALYTICS_MAX_SPEED_MPS, ANALYTICS_STOP_MIN_S, ANALYTICS_STOP_SPEED_MPS, analyze
+)
+
+# Centro aproximado del área de operación (ver el mapa del frontend)
+ORIGIN = (11.01315, -74.82767)
+BASE_TIME_MS = 1_700_000_000_000
+
+
+def synthetic_track(points, seed=7):
+    """Columnas (ms, lat, lng): segmentos alternos de movimiento (2-30 m/s) y parada, con huecos"""
+    rng = np.random.default_rng(seed)
+    segments = points // 600 + 1
+    lengths = rng.integers(120, 1080, segments)
+    moving = np.arange(segments) % 2 == 0
+    speed = np.where(moving, rng.uniform(2, 30, segments), 0.0)
+    heading = rng.uniform(0, 2 * np.pi, segments)
+    step_speed = np.repeat(speed, lengths)[:points]
+    step_heading = np.repeat(heading, lengths)[:points] + rng.normal(0, 0.05, points)
+    seconds = np.ones(points)
+    seconds[rng.random(points) < 1 / 5000] = rng.uniform(400, 7200)   # huecos sin señal
+    latitudes = ORIGIN[0] + np.cumsum(step_speed * np.cos(step_heading)) / 111_195
+    longitudes = ORIGIN[1] + np.cumsum(step_speed * np.sin(step_heading)) / (111_195 * math.cos(math.radians(ORIGIN[0])))
+    # Ruido de GPS (~3 m)
+    latitudes += rng.normal(0, 3 / 111_195, points)
+    longitudes += rng.normal(0, 3 / 111_195, points)
+    timestamps = BASE_TIME_MS + (np.cumsum(seconds) * 1000).astype(np.int64)
+    return timestamps, latitudes, longitudes
+
+
+def python_loop(rows):
+    """Distancia, tiempo en movimiento y paradas con un lazo por fila (sin suavizado)"""
+    distance = moving = 0.0
+    stops = 0
+    slow_since = None
+    previous = rows[0]
+    for row in rows[1:]:
+        dt = (row['timestamp_value'] - previous['timestamp_value']) / 1000
+        if 0 < dt <= ANALYTICS_GAP_S:
+            phi1, phi2 = math.radians(previous['latitude']), math.radians(row['latitude'])
+            a = (math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2)
+                 * math.sin(math.radians(row['longitude'] - previous['longitude']) / 2) ** 2)
+            step = 2 * 6_371_008.8 * math.asin(min(1.0, math.sqrt(a)))
+            speed = step / dt
+            if speed < ANALYTICS_STOP_SPEED_MPS:
+                slow_since = slow_since or previous['timestamp_value']
+            else:
+                if slow_since and (previous['timestamp_value'] - slow_since) / 1000 >= ANALYTICS_STOP_MIN_S:
+                    stops += 1
+                slow_since = None
+                if speed <= ANALYTICS_MAX_SPEED_MPS:
+                    distance += step
+                    moving += dt
+        previous = row
+    return distance, moving, stops
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), value
+
+
+def main():
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    loop_points = int(sys.argv[2]) if len(sys.argv) > 2 else 300_000
+    timestamps, latitudes, longitudes = synthetic_track(points)
+    print(f"{points:,} puntos ({(timestamps[-1] - timestamps[0]) / 86_400_000:.1f} días a 1 Hz)")
+
+    # Forma en que llegan de get_track_columns: listas de Python por columna
+    columns = (timestamps.tolist(), latitudes.tolist(), longitudes.tolist())
+    vectorized, result = best_of(lambda: analyze(*columns))
+    summary = result['summary']
+    print(f"  NumPy (listas -> arreglos + análisis) {vectorized:8.2f} s  ({points / vectorized:,.0f} puntos/s)")
+    print(f"    {summary['distance_m'] / 1000:,.0f} km, {summary['moving_s'] / 3600:,.1f} h en movimiento, "
+          f"{len(result['stops']):,} paradas, {len(result['trips']):,} trips, {len(result['days'])} días")
+
+    rows = [
+        {'timestamp_value': t, 'latitude': lat, 'longitude': lng}
+        for t, lat, lng in zip(*(column[:loop_points] for column in columns))
+    ]
+    loop, _ = best_of(lambda: python_loop(rows))
+    loop *= points / loop_points
+    print(f"  lazo de Python sobre dicts (estimado) {loop:8.2f} s  ({points / loop:,.0f} puntos/s)")
+    print(f"  aceleración                           {loop / vectorized:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Verificación de /api/location/nearest con ventana (Database.get_nearest_locations)
+contra un PostgreSQL con PostGIS, con la misma configuración que el servidor (DB_*):
+  python benchmarks/check_nearest.py
+
+Inserta dispositivos de prueba alrededor de un punto a 60° de latitud, donde un grado
+de longitud mide la mitad que uno de latitud (un orden en grados planos no coincide
+con el orden en metros), y un dispositivo con miles de filas pegadas al punto, que
+antes llenaba los candidatos del KNN. Compara el resultado con la distancia mínima
+de cada dispositivo calculada por fuerza bruta, muestra el plan y borra las filas.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import NEAREST_LOCATIONS, Database  # noqa: E402
+
+PREFIX = 'nearest-check-'
+LAT, LNG = 60.0, 25.0
+DENSE_ROWS = 5000
+
+BRUTE_FORCE = """
+    SELECT DISTINCT ON (device_id) device_id,
+           ST_Distance(
+               ST_SetSRID(ST_Point(longitude, latitude), 4326)::geography,
+               ST_SetSRID(ST_Point($2, $1), 4326)::geography
+           ) AS distance_m
+    FROM location_data
+    WHERE timestamp_value BETWEEN $3 AND $4 AND device_id IS NOT NULL
+    ORDER BY device_id, distance_m;
+"""
+
+
+def test_rows(now):
+    rng = random.Random(1)
+    rows = []
+    # Miles de filas de un mismo dispositivo a menos de ~50 m
+    for i in range(DENSE_ROWS):
+        rows.append((LAT + rng.uniform(-0.0004, 0.0004), LNG + rng.uniform(-0.0008, 0.0008),
+                     now - i, f'{PREFIX}dense'))
+    # Al este 0.01° (~556 m) y al norte 0.008° (~890 m): en grados el del norte parece más cerca
+    rows.append((LAT, LNG + 0.01, now, f'{PREFIX}east'))
+    rows.append((LAT + 0.008, LNG, now, f'{PREFIX}north'))
+    for i in range(40):
+        distance = 0.002 * (i + 1)
+        rows.append((LAT + rng.uniform(-distance, distance), LNG + rng.uniform(-2 * distance, 2 * distance),
+                     now - rng.randint(0, 60000), f'{PREFIX}{i:02d}'))
+    # Fuera de la ventana de tiempo: no debe aparecer aunque esté sobre el punto
+    rows.append((LAT, LNG, now - 3_600_000, f'{PREFIX}old'))
+    return rows
+
+
+async def main():
+    db = Database()
+    await db.init_connection_pool()
+    try:
+        async with db._acquire('ingest') as connection:
+            postgis = await connection.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'postgis';")
+            if postgis is None:
+                sys.exit("❌ La base no tiene PostGIS")
+            indexed = await connection.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'idx_location_data_device_geog_time');"
+            )
+            print(f"PostGIS {postgis}; índice de la migración 007: {'sí' if indexed else 'no'}")
+            now = int(time.time() * 1000)
+            await connection.copy_records_to_table(
+                'location_data', records=test_rows(now),
+                columns=('latitude', 'longitude', 'timestamp_value', 'device_id')
+            )
+            await connection.execute("ANALYZE location_data;")
+
+        start_time, end_time = now - 120_000, now
+        ok = True
+        for limit, radius_m in ((5, None), (20, None), (10, 2000.0)):
+            started = time.perf_counter()
+            results = await db.get_nearest_locations(LAT, LNG, start_time, end_time, limit, radius_m)
+            elapsed = (time.perf_counter() - started) * 1000
+            async with db._acquire('ingest') as connection:
+                expected = await connection.fetch(BRUTE_FORCE, LAT, LNG, start_time, end_time)
+            expected = sorted(
+                (row for row in expected if radius_m is None or row['distance_m'] <= radius_m),
+                key=lambda row: row['distance_m']
+            )[:limit]
+            got = [(row['device_id'], round(row['distance_m'], 3)) for row in results]
+            want = [(row['device_id'], round(row['distance_m'], 3)) for row in expected]
+            match = got == want
+            ok = ok and match
+            print(f"limit={limit} radius_m={radius_m}: {len(got)} dispositivos en {elapsed:.1f} ms "
+                  f"{'✅' if match else '❌'}")
+            if not match:
+                print(f"  obtenido: {got}\n  esperado: {want}")
+
+        east_first = [row['device_id'] for row in await db.get_nearest_locations(
+            LAT, LNG, start_time, end_time, 50)]
+        order_ok = east_first.index(f'{PREFIX}east') < east_first.index(f'{PREFIX}north')
+        ok = ok and order_ok and f'{PREFIX}old' not in east_first
+        print(f"orden en metros (este antes que norte): {'✅' if order_ok else '❌'}")
+
+        async with db._acquire('ingest') as connection:
+            plan = await connection.fetch(
+                "EXPLAIN (ANALYZE, COSTS OFF) " + NEAREST_LOCATIONS, LAT, LNG, start_time, end_time, 10, None
+            )
+        print('\n'.join(row[0] for row in plan))
+        print("✅ resultados exactos" if ok else "❌ resultados distintos de la fuerza bruta")
+    finally:
+        async with db._acquire('ingest') as connection:
+            await connection.execute("DELETE FROM location_data WHERE device_id LIKE $1;", f'{PREFIX}%')
+        await db.close_connection_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
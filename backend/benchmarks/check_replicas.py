@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Verificación del enrutamiento a réplicas de lectura con un primario y una réplica reales.
+Usa la misma configuración que el servidor (DB_* para el primario, DB_REPLICA_DSNS):
+  DB_REPLICA_DSNS=postgresql://postgres@localhost:5433/postgres python benchmarks/check_replicas.py [--simulate]
+
+Sin opciones mide el retraso que reporta cada réplica, el tiempo hasta ver en ella una
+fila escrita en el primario y a qué pool van las lecturas de historial y de "lo último".
+Con --simulate (superusuario en la réplica) además pausa la reproducción del WAL y
+desconecta el walreceiver (primary_conninfo vacío), comprueba que la réplica deja de
+recibir las lecturas correspondientes y restaura la configuración.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import Database  # noqa: E402
+
+DEVICE = 'replica-check'
+
+
+def _acquires(db):
+    return {lane: stats.acquires for lane, stats in db.pool_stats.items()}
+
+
+async def routed_to(db, call):
+    """Pool ('read' o 'replica') que atendió ``call``"""
+    before = _acquires(db)
+    await call()
+    after = _acquires(db)
+    return [lane for lane in after if after[lane] > before[lane]]
+
+
+async def wait_for(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await predicate():
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+def lags(db):
+    return ', '.join(f"{r.label}={r.lag}" for r in db.replicas)
+
+
+async def check_routing(db, label):
+    now = int(time.time() * 1000)
+    history = await routed_to(db, lambda: db.get_locations_by_range(now - 60000, now, DEVICE))
+    latest = await routed_to(db, lambda: db.get_latest_location(DEVICE))
+    print(f"{label}: retraso [{lags(db)}] historial -> {history}, última posición -> {latest}")
+    return history, latest
+
+
+async def write_marker(db):
+    return await db.insert_location({'lat': 0.0, 'lon': 0.0, 'time': int(time.time() * 1000), 'deviceId': DEVICE})
+
+
+async def replica_has(replica, row_id):
+    return await replica.pool.fetchval("SELECT EXISTS (SELECT 1 FROM location_data WHERE id = $1);", row_id)
+
+
+async def simulate(db, replica):
+    wait = db.replica_check_interval * 2 + db.replica_max_lag + 1
+    results = {}
+
+    # Reproducción pausada: el retraso crece con las escrituras del primario
+    await replica.pool.execute("SELECT pg_wal_replay_pause();")
+    try:
+        await write_marker(db)
+        await asyncio.sleep(wait)
+        await write_marker(db)
+        await asyncio.sleep(db.replica_check_interval + 0.5)
+        results['pausada'] = await check_routing(db, "réplica pausada")
+    finally:
+        await replica.pool.execute("SELECT pg_wal_replay_resume();")
+    await wait_for(lambda: _fresh(replica, db), wait)
+
+    # Walreceiver desconectado: ya reprodujo todo lo recibido, pero no recibe nada nuevo
+    conninfo = await replica.pool.fetchval("SHOW primary_conninfo;")
+    await replica.pool.execute("ALTER SYSTEM SET primary_conninfo = '';")
+    await replica.pool.execute("SELECT pg_reload_conf();")
+    try:
+        await asyncio.sleep(wait)
+        results['desconectada'] = await check_routing(db, "réplica desconectada")
+    finally:
+        await replica.pool.execute(f"ALTER SYSTEM SET primary_conninfo = '{conninfo.replace(chr(39), chr(39) * 2)}';")
+        await replica.pool.execute("SELECT pg_reload_conf();")
+    reconnected = await wait_for(lambda: _fresh(replica, db), 30)
+    print(f"réplica reconectada: {reconnected} [{lags(db)}]")
+    return results
+
+
+async def _fresh(replica, db):
+    return replica.lag is not None and replica.lag <= db.replica_max_lag
+
+
+async def main():
+    if not os.getenv('DB_REPLICA_DSNS'):
+        sys.exit("Falta DB_REPLICA_DSNS")
+    db = Database()
+    await db.init_connection_pool()
+    try:
+        await db.create_table()
+        replica = db.replicas[0]
+        print(f"retraso inicial: {lags(db)}")
+
+        row = await write_marker(db)
+        start = time.perf_counter()
+        seen = await wait_for(lambda: replica_has(replica, row['id']), 10)
+        print(f"fila del primario visible en la réplica: {seen} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+        history, latest = await check_routing(db, "réplica al día")
+        ok = history == ['replica'] and latest == ['replica']
+        if '--simulate' in sys.argv:
+            results = await simulate(db, replica)
+            ok = ok and results['pausada'] == (['replica'], ['read'])
+            ok = ok and results['desconectada'] == (['read'], ['read'])
+        print("✅ enrutamiento correcto" if ok else "❌ enrutamiento inesperado")
+    finally:
+        async with db._acquire('ingest') as connection:
+            await connection.execute("DELETE FROM location_data WHERE device_id = $1;", DEVICE)
+        await db.close_connection_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
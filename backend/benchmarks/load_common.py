@@ -0,0 +1,115 @@
+"""
+Utilidades comunes de las pruebas de carga (load_*.py).
+Cada prueba produce un registro JSON por ejecución con el commit, los parámetros y,
+por operación, throughput, latencias p50/p99 y pérdidas, para comparar entre commits.
+El registro se agrega a --output (JSON Lines) o, sin --output, se imprime al final.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por interpolación lineal sobre valores ya ordenados"""
+    if not sorted_values:
+        return None
+    index = (len(sorted_values) - 1) * fraction
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+class Recorder:
+    """Latencias y conteos de una operación (envíos esperados frente a respuestas recibidas)"""
+
+    def __init__(self):
+        self.latencies = []
+        self.sent = 0
+        self.errors = 0
+
+    def add(self, seconds):
+        self.latencies.append(seconds)
+
+    def merge(self, other):
+        self.latencies.extend(other['latencies'])
+        self.sent += other['sent']
+        self.errors += other['errors']
+
+    def raw(self):
+        """Forma serializable para pasar resultados entre procesos"""
+        return {'latencies': self.latencies, 'sent': self.sent, 'errors': self.errors}
+
+    def summary(self, seconds):
+        values = sorted(self.latencies)
+        received = len(values)
+        lost = max(self.sent - received - self.errors, 0)
+        return {
+            'sent': self.sent,
+            'received': received,
+            'errors': self.errors,
+            'lost': lost,
+            'loss_ratio': round((lost + self.errors) / self.sent, 6) if self.sent else 0.0,
+            'throughput_per_s': round(received / seconds, 2) if seconds else None,
+            'latency_ms': {
+                'p50': _ms(percentile(values, 0.50)),
+                'p99': _ms(percentile(values, 0.99)),
+                'mean': _ms(statistics.fmean(values)) if values else None,
+                'max': _ms(values[-1]) if values else None,
+            },
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def print_table(operations):
+    print(f"{'operación':<20} {'enviados':>9} {'recibidos':>9} {'pérdida':>8} {'ops/s':>10} "
+          f"{'p50 ms':>9} {'p99 ms':>9}")
+    for name, result in operations.items():
+        latency = result['latency_ms']
+        print(f"{name:<20} {result['sent']:>9} {result['received']:>9} {result['loss_ratio']:>8.2%} "
+              f"{result['throughput_per_s'] or 0:>10.1f} {_fmt(latency['p50']):>9} {_fmt(latency['p99']):>9}")
+
+
+def _fmt(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+def report(suite, params, operations, output=None, extra=None):
+    """Imprime la tabla y guarda (o imprime) el registro JSON de la ejecución"""
+    print_table(operations)
+    record = {
+        'suite': suite,
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'machine': platform.machine()},
+        'params': params,
+        'operations': operations,
+    }
+    if extra:
+        record.update(extra)
+    line = json.dumps(record, ensure_ascii=False)
+    if output:
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        print(f"📄 Resultado agregado a {output}")
+    else:
+        print(line)
+    return record
+
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de lectura de los endpoints HTTP del API (main.py).
+Para cada endpoint, --concurrency clientes repiten la petición durante --duration
+segundos (lazo cerrado: cada cliente envía la siguiente al recibir la respuesta).
+Con --mix se agrega una fase final con todos los endpoints a la vez, como el frontend.
+Los parámetros (device_id, rangos, polígonos) salen de los datos existentes.
+
+Sin --url el API se levanta en un proceso aparte con uvicorn (EMBEDDED_SERVICES=0,
+sin UDP ni WebRTC) y la base de datos de .env. Errores = respuestas que no son 2xx o
+que no llegan en --request-timeout; cuentan como pérdida.
+
+Ejecutar desde backend/:
+  python benchmarks/load_http.py --concurrency 32 --duration 10 [--workers 2] [--mix]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import aiohttp
+
+from load_common import Recorder, report
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _iso(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).isoformat()
+
+
+async def build_endpoints(session, url):
+    """Endpoints de lectura con parámetros tomados de los datos: nombre -> fábrica de peticiones"""
+    async with session.get(f'{url}/api/devices') as response:
+        devices = await response.json() if response.status == 200 else []
+    latest = {}
+    for device_id in devices[:20]:
+        async with session.get(f'{url}/api/location/latest', params={'device_id': device_id}) as response:
+            if response.status == 200:
+                latest[device_id] = await response.json()
+    if not latest:
+        print("⚠️ Sin datos de ubicación: solo se prueban los endpoints sin parámetros")
+
+    def device():
+        return random.choice(list(latest))
+
+    def range_params():
+        device_id = device()
+        end = latest[device_id]['timestamp_value']
+        return {'startDate': _iso(end - 3_600_000), 'endDate': _iso(end), 'device_id': device_id}
+
+    def area_body():
+        device_id = device()
+        lat, lon = latest[device_id]['latitude'], latest[device_id]['longitude']
+        d = 0.005
+        return {'device_id': device_id, 'polygon': [[lat - d, lon - d], [lat - d, lon + d], [lat + d, lon + d], [lat + d, lon - d]]}
+
+    endpoints = {
+        'health': lambda: ('GET', '/api/health', None, None),
+        'latest': lambda: ('GET', '/api/location/latest', None, None),
+        'latest-by-devices': lambda: ('GET', '/api/location/latest-by-devices', None, None),
+        'all-100': lambda: ('GET', '/api/location/all', {'limit': 100}, None),
+        'devices': lambda: ('GET', '/api/devices', None, None),
+        'geofences': lambda: ('GET', '/api/geofences', None, None),
+    }
+    if latest:
+        endpoints.update({
+            'latest-device': lambda: ('GET', '/api/location/latest', {'device_id': device()}, None),
+            'range-1h': lambda: ('GET', '/api/location/range', range_params(), None),
+            'area-records': lambda: ('POST', '/api/location/area-records', None, area_body()),
+        })
+    return endpoints
+
+
+async def _client(session, url, factories, recorder_for, deadline, timeout):
+    index = random.randrange(len(factories))
+    while time.monotonic() < deadline:
+        name, factory = factories[index % len(factories)]
+        index += 1
+        method, path, params, body = factory()
+        recorder = recorder_for(name)
+        recorder.sent += 1
+        started = time.monotonic()
+        try:
+            async with session.request(method, url + path, params=params, json=body,
+                                       timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                await response.read()
+                if response.status >= 300:
+                    recorder.errors += 1
+                    continue
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            recorder.errors += 1
+            continue
+        recorder.add(time.monotonic() - started)
+
+
+async def run_phase(session, url, factories, args):
+    """--concurrency clientes durante --duration s sobre los endpoints dados"""
+    recorders = {name: Recorder() for name, _ in factories}
+    deadline = time.monotonic() + args.duration
+    started = time.monotonic()
+    await asyncio.gather(*(
+        _client(session, url, factories, recorders.__getitem__, deadline, args.request_timeout)
+        for _ in range(args.concurrency)
+    ))
+    elapsed = time.monotonic() - started
+    return {name: recorder.summary(elapsed) for name, recorder in recorders.items()}
+
+
+def run_api(port, workers):
+    """Proceso del API: uvicorn con main:app, sin servicios embebidos"""
+    import uvicorn
+
+    os.environ['EMBEDDED_SERVICES'] = '0'
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND_DIR, os.getenv('PYTHONPATH')]))
+    os.chdir(BACKEND_DIR)
+    uvicorn.run('main:app', host='127.0.0.1', port=port, workers=workers, log_level='warning')
+
+
+async def wait_healthy(session, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f'{url}/api/health') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    sys.exit(f"❌ El API no responde en {url}")
+
+
+async def main(args):
+    api = None
+    if not args.url:
+        args.url = f'http://127.0.0.1:{args.port}'
+        api = multiprocessing.get_context('spawn').Process(target=run_api, args=(args.port, args.workers))
+        api.start()
+
+    operations = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_healthy(session, args.url)
+            endpoints = await build_endpoints(session, args.url)
+            selected = [name for name in (args.endpoints or endpoints) if name in endpoints]
+            for name in selected:
+                operations.update(await run_phase(session, args.url, [(name, endpoints[name])], args))
+                print(f"  {name}: {operations[name]['throughput_per_s']} req/s")
+            if args.mix:
+                mixed = await run_phase(session, args.url, [(name, endpoints[name]) for name in selected], args)
+                operations.update({f'mix:{name}': result for name, result in mixed.items()})
+    finally:
+        if api is not None:
+            api.terminate()
+            api.join()
+
+    report('http_read', {
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'api_workers': args.workers if api is not None else None,
+        'mix': args.mix,
+        'external_server': api is None,
+    }, operations, args.output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prueba de carga de lectura del API HTTP')
+    parser.add_argument('--concurrency', type=int, default=16, help='clientes simultáneos')
+    parser.add_argument('--duration', type=float, default=10, help='segundos por fase')
+    parser.add_argument('--endpoints', nargs='+', help='subconjunto de endpoints (por defecto todos)')
+    parser.add_argument('--mix', action='store_true', help='fase adicional con todos los endpoints a la vez')
+    parser.add_argument('--request-timeout', type=float, default=10)
+    parser.add_argument('--url', help='API existente (por defecto se levanta uno local)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('LOAD_HTTP_PORT', 18000)))
+    parser.add_argument('--workers', type=int, default=1, help='workers de uvicorn del API local')
+    parser.add_argument('--output', help='archivo JSON Lines al que agregar el resultado')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
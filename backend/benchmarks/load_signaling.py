@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de la señalización WebRTC (webrtc_server.py).
+Un enjambre de clientes python-socketio simula broadcasters y viewers con el flujo
+real: register-broadcaster / register-viewer, request-stream -> viewer-joined, offer,
+answer y candidatos ICE en ambos sentidos. Cada viewer es una sesión; todas las
+sesiones empiezan a la vez después de conectar y registrar a todos los clientes.
+
+Sin --url el servidor se levanta en un proceso aparte (logging activo como en
+producción, salida descartada). El enjambre se reparte en --procs procesos para que
+el cliente no sea el cuello de botella; cada proceso lleva sus broadcasters con sus viewers.
+
+Operaciones medidas (latencia del envío a la llegada al otro cliente):
+  connect, register (register-viewer -> available-broadcasters), viewer-joined,
+  offer, answer, ice y session (request-stream -> último candidato de ambos lados)
+
+Ejecutar desde backend/:
+  python benchmarks/load_signaling.py --broadcasters 20 --viewers 5 --ice 8 --procs 2
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from load_common import Recorder, report
+
+OPERATIONS = ('connect', 'register', 'viewer-joined', 'offer', 'answer', 'ice', 'session')
+# Tamaño típico de una descripción SDP de video con audio (~3 KB)
+SDP_BODY = 'v=0\r\no=- 0 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n' + ('a=' + 'x' * 70 + '\r\n') * 40
+MARK = 'load:'
+
+
+def _token(text):
+    return text.rsplit(MARK, 1)[1]
+
+
+def _candidate(index, key):
+    return {
+        'candidate': f'candidate:{index} 1 udp 2122260223 10.0.0.{index % 250} {50000 + index} typ host {MARK}{key}',
+        'sdpMid': '0',
+        'sdpMLineIndex': 0,
+    }
+
+
+class Swarm:
+    """Broadcasters y viewers de un proceso, con sus tiempos de envío pendientes"""
+
+    def __init__(self, args, first):
+        self.args = args
+        self.first = first
+        self.recorders = {name: Recorder() for name in OPERATIONS}
+        self.pending = {}    # clave del mensaje -> instante de envío
+        self.sessions = {}   # sid del viewer -> [inicio, candidatos que faltan]
+        self.clients = []
+        self.done = asyncio.Event()
+
+    def sent(self, operation, key):
+        self.pending[key] = time.monotonic()
+        self.recorders[operation].sent += 1
+
+    def arrived(self, operation, key):
+        started = self.pending.pop(key, None)
+        if started is not None:
+            self.recorders[operation].add(time.monotonic() - started)
+
+    def progress(self, viewer_sid):
+        session = self.sessions.get(viewer_sid)
+        if session is None:
+            return
+        session[1] -= 1
+        if session[1] <= 0:
+            del self.sessions[viewer_sid]
+            self.recorders['session'].add(time.monotonic() - session[0])
+            if not self.sessions:
+                self.done.set()
+
+    def _client(self):
+        import socketio
+
+        client = socketio.AsyncClient(reconnection=False)
+        self.clients.append(client)
+        return client
+
+    async def _connect(self, client, semaphore):
+        async with semaphore:
+            self.recorders['connect'].sent += 1
+            started = time.monotonic()
+            try:
+                await client.connect(self.args.url, transports=self.args.transports)
+            except Exception:
+                self.recorders['connect'].errors += 1
+                return False
+            self.recorders['connect'].add(time.monotonic() - started)
+            return True
+
+    def _on_ice(self, client, receiver_is_viewer):
+        def handle(data):
+            self.arrived('ice', _token(data['candidate']['candidate']))
+            self.progress(client.get_sid() if receiver_is_viewer else data['sender'])
+
+        def handle_batch(data):
+            for candidate in data['candidates']:
+                handle({'sender': data['sender'], 'candidate': candidate})
+
+        client.on('ice-candidate', handle)
+        client.on('ice-candidates', handle_batch)
+
+    async def _send_ice(self, client, target, prefix):
+        for index in range(self.args.ice):
+            key = f'{prefix}:{index}'
+            self.sent('ice', key)
+            await client.emit('ice-candidate', {'target': target, 'candidate': _candidate(index, key)})
+
+    async def broadcaster(self, index, semaphore):
+        client = self._client()
+
+        async def on_viewer_joined(data):
+            viewer_sid = data['viewerId']
+            self.arrived('viewer-joined', ('joined', viewer_sid))
+            key = f'offer-{viewer_sid}'
+            self.sent('offer', key)
+            await client.emit('offer', {'target': viewer_sid, 'sdp': {'type': 'offer', 'sdp': SDP_BODY + MARK + key}})
+
+        async def on_answer(data):
+            self.arrived('answer', _token(data['sdp']['sdp']))
+            if not self.args.ice:
+                self.progress(data['sender'])
+            await self._send_ice(client, data['sender'], f'b-{data["sender"]}')
+
+        client.on('viewer-joined', on_viewer_joined)
+        client.on('answer', on_answer)
+        self._on_ice(client, receiver_is_viewer=False)
+        if await self._connect(client, semaphore):
+            await client.emit('register-broadcaster', {'deviceId': self.device_id(index), 'iceBatch': self.args.ice_batch})
+
+    async def viewer(self, index, semaphore):
+        client = self._client()
+        registered = asyncio.Event()
+
+        def on_available(data):
+            self.arrived('register', ('register', client.get_sid()))
+            registered.set()
+
+        async def on_offer(data):
+            self.arrived('offer', _token(data['sdp']['sdp']))
+            sid = client.get_sid()
+            key = f'answer-{sid}'
+            self.sent('answer', key)
+            await client.emit('answer', {'target': data['sender'], 'sdp': {'type': 'answer', 'sdp': SDP_BODY + MARK + key}})
+            await self._send_ice(client, data['sender'], f'v-{sid}')
+
+        client.on('available-broadcasters', on_available)
+        client.on('offer', on_offer)
+        self._on_ice(client, receiver_is_viewer=True)
+        if not await self._connect(client, semaphore):
+            return None
+        self.sent('register', ('register', client.get_sid()))
+        await client.emit('register-viewer', {'viewerId': f'load-viewer-{self.first}-{index}', 'iceBatch': self.args.ice_batch})
+        try:
+            await asyncio.wait_for(registered.wait(), self.args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        return client
+
+    def device_id(self, index):
+        return f'load-cam-{self.first + index}'
+
+    async def request_stream(self, client, device_id):
+        sid = client.get_sid()
+        self.sessions[sid] = [time.monotonic(), 2 * self.args.ice or 1]
+        self.sent('viewer-joined', ('joined', sid))
+        await client.emit('request-stream', {'deviceId': device_id})
+
+
+async def _run_swarm(conn, go, args, first, count):
+    swarm = Swarm(args, first)
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    await asyncio.gather(*(swarm.broadcaster(i, semaphore) for i in range(count)))
+    viewers = await asyncio.gather(*(
+        swarm.viewer(i * args.viewers + j, semaphore) for i in range(count) for j in range(args.viewers)
+    ))
+    conn.send('ready')
+    await asyncio.get_running_loop().run_in_executor(None, go.wait)
+
+    started = time.monotonic()
+    for position, client in enumerate(viewers):
+        if client is not None:
+            await swarm.request_stream(client, swarm.device_id(position // args.viewers))
+    if not swarm.sessions:
+        swarm.done.set()
+    try:
+        await asyncio.wait_for(swarm.done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.monotonic() - started
+    # Sesiones sin terminar: su 'session' cuenta como perdida
+    swarm.recorders['session'].sent = sum(1 for client in viewers if client is not None)
+
+    conn.send(({name: recorder.raw() for name, recorder in swarm.recorders.items()}, elapsed))
+    for client in swarm.clients:
+        if client.connected:
+            await client.disconnect()
+
+
+def run_swarm(conn, go, args, first, count):
+    asyncio.run(_run_swarm(conn, go, args, first, count))
+
+
+def run_server(port):
+    """Proceso del servidor de señalización"""
+    from log_config import setup_logging
+    import webrtc_server
+
+    sys.stdout = open(os.devnull, 'w')
+    setup_logging()
+
+    async def serve():
+        await webrtc_server.start_webrtc_server(host='127.0.0.1', port=port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def _healthy(url):
+    import urllib.request
+
+    try:
+        with urllib.request.urlopen(f'{url}/health', timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def main(args):
+    context = multiprocessing.get_context('spawn')
+    server = None
+    if not args.url:
+        args.url = f'http://127.0.0.1:{args.port}'
+        server = context.Process(target=run_server, args=(args.port,), daemon=True)
+        server.start()
+    deadline = time.monotonic() + 15
+    while not _healthy(args.url):
+        if time.monotonic() > deadline:
+            sys.exit(f"❌ El servidor de señalización no responde en {args.url}")
+        time.sleep(0.1)
+
+    go = context.Event()
+    workers = []
+    per_proc = [args.broadcasters // args.procs + (1 if i < args.broadcasters % args.procs else 0)
+                for i in range(args.procs)]
+    first = 0
+    for count in per_proc:
+        if count == 0:
+            continue
+        parent, child = multiprocessing.Pipe()
+        process = context.Process(target=run_swarm, args=(child, go, args, first, count))
+        process.start()
+        workers.append((process, parent))
+        first += count
+
+    for _, parent in workers:
+        parent.recv()   # 'ready': todos conectados y registrados
+    print(f"🐝 {args.broadcasters} broadcasters y {args.broadcasters * args.viewers} viewers conectados; "
+          f"iniciando sesiones")
+    go.set()
+
+    recorders = {name: Recorder() for name in OPERATIONS}
+    elapsed = 0.0
+    for process, parent in workers:
+        raw, seconds = parent.recv()
+        elapsed = max(elapsed, seconds)
+        for name, values in raw.items():
+            recorders[name].merge(values)
+        process.join()
+    if server is not None:
+        server.terminate()
+        server.join()
+
+    operations = {name: recorder.summary(elapsed) for name, recorder in recorders.items()}
+    # La conexión y el registro ocurren antes de la fase de sesiones: su throughput no aplica
+    for name in ('connect', 'register'):
+        operations[name]['throughput_per_s'] = None
+    report('signaling', {
+        'broadcasters': args.broadcasters,
+        'viewers_per_broadcaster': args.viewers,
+        'ice_per_side': args.ice,
+        'ice_batch': args.ice_batch,
+        'procs': args.procs,
+        'transports': args.transports,
+        'external_server': server is None,
+    }, operations, args.output, extra={'session_phase_s': round(elapsed, 3)})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prueba de carga de la señalización WebRTC')
+    parser.add_argument('--broadcasters', type=int, default=10)
+    parser.add_argument('--viewers', type=int, default=5, help='viewers por broadcaster')
+    parser.add_argument('--ice', type=int, default=8, help='candidatos ICE por lado y sesión')
+    parser.add_argument('--ice-batch', action='store_true', help='anunciar iceBatch al registrarse')
+    parser.add_argument('--procs', type=int, default=max((os.cpu_count() or 2) // 2, 1), help='procesos del enjambre')
+    parser.add_argument('--connect-concurrency', type=int, default=50, help='conexiones simultáneas en el arranque')
+    parser.add_argument('--transports', nargs='+', default=['websocket'], help='transportes de engine.io')
+    parser.add_argument('--timeout', type=float, default=30, help='segundos máximos de la fase de sesiones')
+    parser.add_argument('--url', help='servidor existente (por defecto se levanta uno local)')
+    parser.add_argument('--port', type=int, default=int(os.getenv('LOAD_SIGNALING_PORT', 18081)))
+    parser.add_argument('--output', help='archivo JSON Lines al que agregar el resultado')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
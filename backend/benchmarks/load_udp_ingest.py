@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de la ingesta UDP (start_udp_server -> PostgreSQL).
+Este proceso levanta el servidor UDP con la base de datos de .env (DB_*, usar una
+PostgreSQL local) y un proceso hijo envía datagramas con el formato de la app
+(lat/lon/time/acc/alt/spd/prov/deviceId) a la tasa pedida: N dispositivos que se
+mueven por Barranquilla, cada uno con su propia secuencia de tiempos.
+
+Latencia = envío del datagrama -> fila insertada (evento 'position' del hub, que se
+publica tras el INSERT ... RETURNING). Pérdida = enviados sin fila al terminar la
+espera de drenado (búfer del socket desbordado, errores de inserción, ...).
+Con varias tasas se ejecuta un escalón por tasa, para encontrar el punto de saturación.
+Las filas de prueba (deviceId con el prefijo de la ejecución) se borran al final.
+
+Ejecutar desde backend/:
+  python benchmarks/load_udp_ingest.py --rate 200 500 1000 --duration 10 --devices 50
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from load_common import Recorder, report
+
+# Centro aproximado del área de operación (ver el mapa del frontend)
+ORIGIN = (11.01315, -74.82767)
+BASE_TIME_MS = 1_700_000_000_000
+
+
+def generate(conn, host, port, rate, duration, devices, prefix, seed):
+    """Proceso hijo: envía a `rate` datagramas/s durante `duration` s; devuelve los instantes de envío"""
+    rng = random.Random(seed)
+    positions = [
+        [ORIGIN[0] + rng.uniform(-0.05, 0.05), ORIGIN[1] + rng.uniform(-0.05, 0.05), rng.uniform(0, 2 * math.pi)]
+        for _ in range(devices)
+    ]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    total = int(rate * duration)
+    sent_at = []
+    start = time.monotonic()
+    for seq in range(total):
+        # Ritmo constante: el datagrama seq sale en start + seq / rate
+        delay = start + seq / rate - time.monotonic()
+        if delay > 0.0005:
+            time.sleep(delay)
+        device = seq % devices
+        lat, lon, heading = positions[device]
+        heading += rng.uniform(-0.3, 0.3)
+        speed = rng.uniform(0, 15)
+        lat += math.cos(heading) * speed * 1e-5
+        lon += math.sin(heading) * speed * 1e-5
+        positions[device] = [lat, lon, heading]
+        datagram = json.dumps({
+            'lat': round(lat, 7),
+            'lon': round(lon, 7),
+            # Único por datagrama: identifica la fila insertada
+            'time': BASE_TIME_MS + seq,
+            'acc': round(rng.uniform(3, 20), 1),
+            'alt': round(rng.uniform(0, 40), 1),
+            'spd': round(speed, 2),
+            'prov': 'gps',
+            'deviceId': f'{prefix}{device}',
+        }).encode()
+        sent_at.append(time.monotonic())
+        sock.sendto(datagram, (host, port))
+    elapsed = time.monotonic() - start
+    sock.close()
+    conn.send((sent_at, elapsed))
+
+
+async def run_step(args, rate, step_prefix):
+    from live import hub
+    from udp_server import UDP_INSERT_ERRORS, UDP_PARSE_FAILURES
+
+    received = {}
+
+    def on_position(position):
+        if position['device_id'].startswith(step_prefix):
+            received[position['timestamp_value'] - BASE_TIME_MS] = time.monotonic()
+
+    hub.subscribe('position', on_position)
+    errors_before = UDP_INSERT_ERRORS.values[()] + UDP_PARSE_FAILURES.values[()]
+
+    parent, child = multiprocessing.Pipe()
+    generator = multiprocessing.get_context('spawn').Process(
+        target=generate, args=(child, '127.0.0.1', args.port, rate, args.duration, args.devices, step_prefix, 1)
+    )
+    generator.start()
+    loop = asyncio.get_running_loop()
+    sent_at, send_seconds = await loop.run_in_executor(None, parent.recv)
+    generator.join()
+
+    # Drenado: esperar las inserciones pendientes
+    deadline = loop.time() + args.drain
+    while len(received) < len(sent_at) and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    hub.unsubscribe('position', on_position)
+
+    recorder = Recorder()
+    recorder.sent = len(sent_at)
+    recorder.errors = int(UDP_INSERT_ERRORS.values[()] + UDP_PARSE_FAILURES.values[()] - errors_before)
+    for seq, done in received.items():
+        recorder.add(done - sent_at[seq])
+    last = max(received.values(), default=sent_at[0] if sent_at else 0)
+    # Throughput sobre la ventana de envío más lo que tardó en vaciarse
+    window = max(last - sent_at[0], send_seconds) if sent_at else 0
+    summary = recorder.summary(window)
+    summary['target_rate'] = rate
+    summary['achieved_send_rate'] = round(len(sent_at) / send_seconds, 1) if send_seconds else None
+    return summary
+
+
+async def main(args):
+    os.environ['UDP_PORT'] = str(args.port)
+    from database import Database
+    from udp_server import start_udp_server, stop_udp_server
+
+    db = Database()
+    await db.init_connection_pool()
+    await db.create_table()
+    transport, _ = await start_udp_server(db)
+    prefix = f'load-{uuid.uuid4().hex[:6]}'
+
+    operations = {}
+    try:
+        for step, rate in enumerate(args.rate):
+            operations[f'insert@{rate:g}/s'] = await run_step(args, rate, f'{prefix}-{step}-')
+    finally:
+        await stop_udp_server(transport)
+        if not args.keep:
+            async with db._acquire('ingest') as connection:
+                deleted = await connection.execute(
+                    "DELETE FROM location_data WHERE device_id LIKE $1", f'{prefix}-%'
+                )
+            print(f"🧹 Filas de prueba eliminadas: {deleted}")
+        await db.close_connection_pool()
+
+    report('udp_ingest', {
+        'rates': args.rate,
+        'duration_s': args.duration,
+        'devices': args.devices,
+        'drain_s': args.drain,
+        'ingest_pool_max': int(os.getenv('DB_INGEST_POOL_MAX_SIZE', 4)),
+    }, operations, args.output)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prueba de carga de la ingesta UDP')
+    parser.add_argument('--rate', type=float, nargs='+', default=[100, 500, 1000], help='datagramas/s (un escalón por tasa)')
+    parser.add_argument('--duration', type=float, default=10, help='segundos de envío por escalón')
+    parser.add_argument('--devices', type=int, default=50, help='dispositivos simulados')
+    parser.add_argument('--drain', type=float, default=10, help='segundos máximos de espera tras el envío')
+    parser.add_argument('--port', type=int, default=int(os.getenv('LOAD_UDP_PORT', 16001)), help='puerto UDP del servidor')
+    parser.add_argument('--keep', action='store_true', help='no borrar las filas de prueba')
+    parser.add_argument('--output', help='archivo JSON Lines al que agregar el resultado')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -1,46 +1,530 @@
+import asyncio
 import asyncpg
+import functools
 import os
 import json
+import math
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
 
+from archive import read_archived
+from metrics import Counter, Histogram
+from profiling import add_phase, phase, phase_total
+
 
 load_dotenv()
 
-class Database:
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'Latencia de los métodos de Database', ('method',))
+DB_QUERY_ROWS = Counter('db_query_rows_total', 'Filas devueltas o escritas por método de Database', ('method',))
+DB_QUERY_ERRORS = Counter('db_query_errors_total', 'Errores por método de Database', ('method',))
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, bool):
+        return int(result)
+    return 0 if result is None else 1
+
+
+def _param_shape(value):
+    """Describe un parámetro sin exponer su valor (tipo y tamaño)"""
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, dict):
+        return f"dict[{len(value)}]"
+    if isinstance(value, str):
+        return f"str[{len(value)}]"
+    return type(value).__name__
+
+
+def instrumented(method):
+    """Registra latencia, filas y errores de un método de consulta de Database"""
+    name = method.__name__
+    labels = (name,)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        pool_before = phase_total('pool')
+        try:
+            result = await method(self, *args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.inc(labels=labels)
+            raise
+        elapsed = time.perf_counter() - start
+        rows = _row_count(result)
+        DB_QUERY_SECONDS.observe(elapsed, labels=labels)
+        DB_QUERY_ROWS.inc(rows, labels=labels)
+        # La espera por conexión ya se contó en la fase 'pool'
+        add_phase('db', elapsed - (phase_total('pool') - pool_before))
+        if elapsed >= self.slow_query_threshold and random.random() < self.slow_query_sample_rate:
+            self.slow_queries.append({
+                'query': name,
+                'params': [_param_shape(arg) for arg in args]
+                          + [f"{key}={_param_shape(value)}" for key, value in kwargs.items()],
+                'duration_ms': round(elapsed * 1000, 2),
+                'rows': rows,
+                'at': datetime.now().isoformat(),
+            })
+        return result
+
+    return wrapper
+
+# Consultas calientes. asyncpg invalida los objetos PreparedStatement al devolver la
+# conexión al pool, así que se reutilizan a través de la caché de sentencias preparadas
+# de cada conexión (statement_cache_size), que persiste entre adquisiciones y se
+# vuelve a preparar sola si cambia el esquema
+HOT_QUERIES = {
+    'insert_location': """
+        INSERT INTO location_data
+        (latitude, longitude, timestamp_value, accuracy, altitude, speed, provider, device_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+        ON CONFLICT DO NOTHING
+        RETURNING id, latitude, longitude, timestamp_value, created_at, device_id,
+                  -- La subconsulta no ve la fila recién insertada: compara con las ya guardadas
+                  NOT EXISTS (
+                      SELECT 1 FROM location_data l
+                      WHERE l.device_id = $8 AND l.timestamp_value > $3
+                  ) AS is_latest;
+    """,
+    # "Última" posición = la de mayor timestamp_value (a igual tiempo, la insertada después):
+    # un lote sin conexión que llega tarde no reemplaza a la posición actual
+    'latest_location': """
+        SELECT latitude, longitude, timestamp_value, created_at, device_id
+        FROM location_data
+        ORDER BY timestamp_value DESC, id DESC
+        LIMIT 1;
+    """,
+    'latest_location_by_device': """
+        SELECT latitude, longitude, timestamp_value, created_at, device_id
+        FROM location_data
+        WHERE device_id = $1
+        ORDER BY timestamp_value DESC, id DESC
+        LIMIT 1;
+    """,
+    'latest_by_devices': """
+        SELECT DISTINCT ON (device_id)
+            latitude, longitude, timestamp_value, created_at, device_id
+        FROM location_data
+        WHERE device_id IS NOT NULL
+        ORDER BY device_id, timestamp_value DESC, id DESC;
+    """,
+    'locations_by_range': """
+        SELECT latitude, longitude, timestamp_value, created_at, device_id
+        FROM location_data
+        WHERE timestamp_value >= $1 AND timestamp_value <= $2
+        ORDER BY timestamp_value ASC;
+    """,
+    'locations_by_range_device': """
+        SELECT latitude, longitude, timestamp_value, created_at, device_id
+        FROM location_data
+        WHERE timestamp_value >= $1 AND timestamp_value <= $2 AND device_id = $3
+        ORDER BY timestamp_value ASC;
+    """,
+    'archive_files_by_range': """
+        SELECT path, device_id FROM location_archive
+        WHERE max_time >= $1 AND min_time <= $2
+        ORDER BY min_time;
+    """,
+    'archive_files_by_range_device': """
+        SELECT path, device_id FROM location_archive
+        WHERE max_time >= $1 AND min_time <= $2 AND device_id = $3
+        ORDER BY min_time;
+    """,
+}
+
+
+# Campos de una geocerca que invalidan sus estadísticas de visitas al cambiar
+GEOFENCE_AREA_FIELDS = ('min_lat', 'max_lat', 'min_lng', 'max_lng', 'device_ids')
+
+# Dispositivos más cercanos a ($1 lat, $2 lng) con posiciones entre $3 y $4 (ms): se
+# recorren los device_id a saltos (índice 005) y, para cada uno, el KNN geodésico
+# (<-> sobre geography, índice 007) da su punto más cercano. $5 límite, $6 radio en metros
+NEAREST_LOCATIONS = """
+    WITH RECURSIVE devices AS (
+        (SELECT device_id FROM location_data WHERE device_id IS NOT NULL ORDER BY device_id LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT t.device_id FROM location_data t
+            WHERE t.device_id > devices.device_id
+            ORDER BY t.device_id LIMIT 1
+        )
+        FROM devices
+        WHERE devices.device_id IS NOT NULL
+    )
+    SELECT nearest.*
+    FROM devices
+    CROSS JOIN LATERAL (
+        SELECT latitude, longitude, timestamp_value, created_at, device_id,
+               ST_Distance(
+                   ST_SetSRID(ST_Point(longitude, latitude), 4326)::geography,
+                   ST_SetSRID(ST_Point($2, $1), 4326)::geography
+               ) AS distance_m
+        FROM location_data
+        WHERE device_id = devices.device_id
+        AND timestamp_value BETWEEN $3 AND $4
+        ORDER BY ST_SetSRID(ST_Point(longitude, latitude), 4326)::geography
+                 <-> ST_SetSRID(ST_Point($2, $1), 4326)::geography
+        LIMIT 1
+    ) AS nearest
+    WHERE $6::double precision IS NULL OR nearest.distance_m <= $6
+    ORDER BY nearest.distance_m
+    LIMIT $5;
+"""
+
+# Filas de un tile: rango de tiempo ($1, $2), dispositivos ($3, opcional) y caja ($4-$7)
+TILE_FILTERS = """
+    timestamp_value BETWEEN $1 AND $2
+    AND ($3::text[] IS NULL OR device_id = ANY($3::text[]))
+    AND ST_SetSRID(ST_Point(longitude, latitude), 4326) && ST_MakeEnvelope($4, $5, $6, $7, 4326)
+"""
+
+# Marca de agua de un tile: suma de los contadores de cambios (location_changes, ver
+# create_table) de los días ($1-$2) y celdas de 1 grado (latitud $3-$4, longitud $5-$6)
+# que cubre. Los contadores solo crecen, así que la suma cambia con cualquier fila que
+# entre o salga de esos días y celdas, y leerla es un rango de la clave primaria
+TILE_WATERMARK = """
+    SELECT COALESCE(sum(version), 0)::bigint FROM location_changes
+    WHERE day BETWEEN $1 AND $2 AND lat_cell BETWEEN $3 AND $4 AND lng_cell BETWEEN $5 AND $6;
+"""
+
+# Días que se recuerdan las claves de idempotencia de los lotes de /api/location/bulk
+INGEST_BATCH_KEY_DAYS = float(os.getenv('INGEST_BATCH_KEY_DAYS', 7))
+
+# Lote en staging -> location_data, sin las posiciones repetidas dentro del lote ni las
+# que ya estaban (mismo device_id y timestamp_value; índice único de la migración 009).
+# Se inserta en orden de tiempo y se devuelve la fila más nueva de cada dispositivo, con
+# el total insertado y si es más nueva que todas las que ya estaban guardadas (is_latest)
+BULK_INSERT = """
+    WITH batch AS (
+        SELECT DISTINCT ON (device_id, timestamp_value) *
+        FROM ingest_staging
+        ORDER BY device_id, timestamp_value, ord
+    ), inserted AS (
+        INSERT INTO location_data
+        (latitude, longitude, timestamp_value, accuracy, altitude, speed, provider, device_id)
+        SELECT latitude, longitude, timestamp_value, accuracy, altitude, speed, provider, device_id
+        FROM batch
+        ORDER BY timestamp_value, ord
+        ON CONFLICT DO NOTHING
+        RETURNING id, latitude, longitude, timestamp_value, created_at, device_id
+    ), newest AS (
+        SELECT DISTINCT ON (device_id) *, count(*) OVER () AS inserted_count
+        FROM inserted
+        ORDER BY device_id, timestamp_value DESC, id DESC
+    )
+    -- Las subconsultas no ven las filas de este mismo INSERT: comparan con las anteriores
+    SELECT *, NOT EXISTS (
+        SELECT 1 FROM location_data l
+        WHERE l.device_id = newest.device_id AND l.timestamp_value > newest.timestamp_value
+    ) AS is_latest
+    FROM newest;
+"""
+
+# Rollups del historial de detecciones: segundos del intervalo -> tabla
+DETECTION_ROLLUP_TABLES = {60: 'detection_rollup_minute', 3600: 'detection_rollup_hour'}
+
+# Suma un lote ya agregado (un arreglo por columna) a un rollup
+DETECTION_ROLLUP_UPSERT = """
+    INSERT INTO {table} AS r (device_id, bucket, samples, count_sum, count_min, count_max)
+    SELECT * FROM unnest($1::text[], $2::timestamptz[], $3::int[], $4::bigint[], $5::int[], $6::int[])
+    ON CONFLICT (device_id, bucket) DO UPDATE SET
+        samples = r.samples + EXCLUDED.samples,
+        count_sum = r.count_sum + EXCLUDED.count_sum,
+        count_min = LEAST(r.count_min, EXCLUDED.count_min),
+        count_max = GREATEST(r.count_max, EXCLUDED.count_max);
+"""
+
+
+def _detection_rollup(rows, seconds):
+    """Agrega un lote de detecciones por (dispositivo, intervalo) en arreglos por columna"""
+    buckets = {}
+    for device_id, detected_at, person_count, _ in rows:
+        epoch = detected_at.timestamp()
+        key = (device_id, datetime.fromtimestamp(epoch - epoch % seconds, tz=detected_at.tzinfo))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [1, person_count, person_count, person_count]
+        else:
+            bucket[0] += 1
+            bucket[1] += person_count
+            bucket[2] = min(bucket[2], person_count)
+            bucket[3] = max(bucket[3], person_count)
+    columns = ([], [], [], [], [], [])
+    for (device_id, bucket_start), (samples, total, low, high) in buckets.items():
+        for column, value in zip(columns, (device_id, bucket_start, samples, total, low, high)):
+            column.append(value)
+    return columns
+
+
+async def _with_archived(rows, files, **filters):
+    """Filas de location_data más las de los archivos del manifiesto, en orden de tiempo"""
+    with phase('archive'):
+        rows.extend(await read_archived([(file['path'], file['device_id']) for file in files], **filters))
+    rows.sort(key=lambda row: row['timestamp_value'])
+    return rows
+
+
+class PoolStats:
+    """Contadores de un pool: espera al adquirir, timeouts y conexiones en uso"""
+
     def __init__(self):
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds):
+        self.acquires += 1
+        self.wait_total += seconds
+        if seconds > self.wait_max:
+            self.wait_max = seconds
+
+
+class Replica:
+    """Réplica de lectura: pool propio y último retraso de replicación medido"""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
         self.pool = None
+        self.lag = None  # segundos; None mientras no esté disponible
 
-    async def init_connection_pool(self):
-        """Inicializa el pool de conexiones"""
-        self.pool = await asyncpg.create_pool(
+    @property
+    def label(self):
+        parts = urlsplit(self.dsn)
+        return f"{parts.hostname}:{parts.port or 5432}"
+
+
+# Retraso de la réplica en segundos. Si ya reprodujo todo lo recibido y sigue recibiendo
+# WAL del primario el retraso es 0, aunque el primario lleve tiempo sin escribir; un
+# servidor que no es réplica también cuenta como 0. Una réplica cuyo walreceiver no está
+# en 'streaming' (desconectada del primario) tiene retraso infinito aunque haya
+# reproducido todo lo que recibió. Sin pg_read_all_stats el estado se ve NULL y solo se
+# comprueba que el walreceiver exista. Si aún no ha reproducido ninguna transacción el
+# retraso es desconocido
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (
+        SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming' OR status IS NULL
+    ) THEN 'Infinity'::float8
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(
+        EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+        'Infinity'::float8
+    )
+END;
+"""
+
+
+class Database:
+    def __init__(self):
+        self.pool = None          # Lecturas del API y escrituras de geocercas
+        self.ingest_pool = None   # Inserciones del servidor UDP
+        self.pool_stats = {'read': PoolStats(), 'ingest': PoolStats(), 'replica': PoolStats()}
+        self.acquire_timeout = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 10))
+        # Réplicas de lectura opcionales: DB_REPLICA_DSNS=postgresql://...,postgresql://...
+        self.replicas = [
+            Replica(dsn.strip())
+            for dsn in os.getenv('DB_REPLICA_DSNS', '').split(',')
+            if dsn.strip()
+        ]
+        self.replica_max_lag = float(os.getenv('DB_REPLICA_MAX_LAG_MS', 1000)) / 1000
+        self.replica_check_interval = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 2))
+        self._replica_index = 0
+        self._replica_monitor = None
+        # Registro muestreado de consultas lentas (ver get_slow_queries)
+        self.slow_query_threshold = float(os.getenv('DB_SLOW_QUERY_MS', 200)) / 1000
+        self.slow_query_sample_rate = float(os.getenv('DB_SLOW_QUERY_SAMPLE_RATE', 1.0))
+        self.slow_queries = deque(maxlen=int(os.getenv('DB_SLOW_QUERY_LOG_SIZE', 200)))
+
+    def _connect_kwargs(self):
+        """Parámetros de conexión comunes a todos los pools"""
+        ssl = os.getenv('DB_SSL', 'require')
+        return dict(
             host=os.getenv('DB_HOST'),
             port=int(os.getenv('DB_PORT', 5432)),
             database=os.getenv('DB_NAME'),
             user=os.getenv('DB_USER'),
             password=os.getenv('DB_PASSWORD'),
-            ssl='require'
+            ssl=None if ssl == 'disable' else ssl,
+            # 0 desactiva las sentencias preparadas (p. ej. detrás de PgBouncer en modo transacción)
+            statement_cache_size=int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100)),
+            init=self._init_connection
+        )
+
+    async def init_connection_pool(self):
+        """Inicializa los pools de conexiones (lecturas e ingesta por separado)"""
+        # Pools separados: una consulta de rango lenta no puede dejar sin conexiones a la ingesta
+        self.pool = await asyncpg.create_pool(
+            min_size=int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            **self._connect_kwargs()
+        )
+        self.ingest_pool = await asyncpg.create_pool(
+            min_size=int(os.getenv('DB_INGEST_POOL_MIN_SIZE', 1)),
+            max_size=int(os.getenv('DB_INGEST_POOL_MAX_SIZE', 4)),
+            **self._connect_kwargs()
         )
         print("Pool de conexiones PostgreSQL inicializado")
 
+        if self.replicas:
+            for replica in self.replicas:
+                await self._connect_replica(replica)
+                if replica.lag is None:
+                    print(f"Réplica {replica.label} no disponible, se usará el primario")
+            self._replica_monitor = asyncio.create_task(self._monitor_replicas())
+            print(f"Réplicas de lectura configuradas: {len(self.replicas)}")
+
+    async def _connect_replica(self, replica):
+        """Crea el pool de una réplica y mide su retraso; si falla queda fuera de servicio"""
+        kwargs = self._connect_kwargs()
+        for key in ('host', 'port', 'database', 'user', 'password'):
+            kwargs.pop(key)
+        if 'sslmode' in replica.dsn:
+            kwargs.pop('ssl')
+        try:
+            if replica.pool is None:
+                replica.pool = await asyncpg.create_pool(
+                    dsn=replica.dsn,
+                    min_size=int(os.getenv('DB_REPLICA_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_REPLICA_POOL_MAX_SIZE', 10)),
+                    **kwargs
+                )
+            lag = await replica.pool.fetchval(REPLICA_LAG_QUERY, timeout=self.acquire_timeout)
+            replica.lag = float(lag)
+        except Exception as e:
+            if replica.lag is not None:
+                print(f"Réplica {replica.label} fuera de servicio: {e}")
+            replica.lag = None
+
+    async def _monitor_replicas(self):
+        """Actualiza periódicamente el retraso de cada réplica"""
+        while True:
+            await asyncio.sleep(self.replica_check_interval)
+            await asyncio.gather(*(self._connect_replica(r) for r in self.replicas))
+
+    async def _init_connection(self, connection):
+        """Configura cada conexión nueva del pool"""
+        # Mientras location_data conserve columnas DECIMAL (antes de la migración 003),
+        # se decodifican directamente a float en lugar de crear decimal.Decimal por campo
+        await connection.set_type_codec(
+            'numeric',
+            schema='pg_catalog',
+            encoder=str,
+            decoder=float,
+            format='text'
+        )
+
+    def _select_pool(self, lane):
+        """Elige el pool para un carril.
+
+        - ``ingest``: pool de ingesta del primario.
+        - ``read``: pool de lecturas del primario.
+        - ``replica``: historial y analítica; cualquier réplica disponible.
+        - ``fresh``: lecturas de "lo último"; solo réplicas con retraso menor a
+          DB_REPLICA_MAX_LAG_MS, si no el primario.
+        """
+        if lane == 'ingest':
+            return self.ingest_pool, 'ingest'
+        if lane in ('replica', 'fresh') and self.replicas:
+            max_lag = self.replica_max_lag if lane == 'fresh' else float('inf')
+            # Retraso infinito: desconectada del primario o sin nada reproducido; no recibe lecturas
+            candidates = [r for r in self.replicas if r.lag is not None and math.isfinite(r.lag) and r.lag <= max_lag]
+            if candidates:
+                self._replica_index = (self._replica_index + 1) % len(candidates)
+                return candidates[self._replica_index].pool, 'replica'
+        return self.pool, 'read'
+
+    @asynccontextmanager
+    async def _acquire(self, lane='read'):
+        """Adquiere una conexión del pool del carril indicado registrando la espera"""
+        pool, stats_key = self._select_pool(lane)
+        stats = self.pool_stats[stats_key]
+        start = time.perf_counter()
+        try:
+            connection = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            add_phase('pool', time.perf_counter() - start)
+            raise
+        waited = time.perf_counter() - start
+        stats.record_wait(waited)
+        add_phase('pool', waited)
+        try:
+            yield connection
+        finally:
+            await pool.release(connection)
+
+    async def _run_hot(self, connection, name, method, *args):
+        """Ejecuta una consulta de HOT_QUERIES reutilizando su sentencia preparada"""
+        return await getattr(connection, method)(HOT_QUERIES[name], *args)
+
+    def get_pool_stats(self):
+        """Estado de los pools: tamaño, conexiones en uso, espera y timeouts"""
+        pools = {
+            'read': [self.pool],
+            'ingest': [self.ingest_pool],
+            'replica': [r.pool for r in self.replicas],
+        }
+        result = {}
+        for lane, stats in self.pool_stats.items():
+            lane_pools = [pool for pool in pools[lane] if pool]
+            size = sum(pool.get_size() for pool in lane_pools)
+            idle = sum(pool.get_idle_size() for pool in lane_pools)
+            result[lane] = {
+                'size': size,
+                'max_size': sum(pool.get_max_size() for pool in lane_pools),
+                'in_use': size - idle,
+                'idle': idle,
+                'acquires': stats.acquires,
+                'acquire_timeouts': stats.timeouts,
+                'wait_total_ms': round(stats.wait_total * 1000, 3),
+                'wait_avg_ms': round(stats.wait_total * 1000 / stats.acquires, 3) if stats.acquires else 0.0,
+                'wait_max_ms': round(stats.wait_max * 1000, 3),
+            }
+        result['replicas'] = [
+            {
+                'replica': replica.label,
+                'available': replica.lag is not None,
+                'lag_ms': round(replica.lag * 1000, 1) if replica.lag not in (None, float('inf')) else None,
+            }
+            for replica in self.replicas
+        ]
+        return result
+
+    def get_slow_queries(self):
+        """Consultas lentas muestreadas, de la más reciente a la más antigua"""
+        return list(reversed(self.slow_queries))
+
     async def close_connection_pool(self):
         """Cierra el pool de conexiones"""
-        if self.pool:
-            await self.pool.close()
-            print("Pool de conexiones cerrado")
+        if self._replica_monitor:
+            self._replica_monitor.cancel()
+        for pool in [self.pool, self.ingest_pool] + [r.pool for r in self.replicas]:
+            if pool:
+                await pool.close()
+        print("Pool de conexiones cerrado")
 
     async def create_table(self):
         """Crea la tabla si no existe y añade la columna device_id si no existe"""
-        async with self.pool.acquire() as connection:
+        async with self._acquire() as connection:
             # Crear la tabla si no existe
             await connection.execute("""
                 CREATE TABLE IF NOT EXISTS location_data (
                     id SERIAL PRIMARY KEY,
-                    latitude DECIMAL(10, 8) NOT NULL,
-                    longitude DECIMAL(11, 8) NOT NULL,
+                    latitude DOUBLE PRECISION NOT NULL,
+                    longitude DOUBLE PRECISION NOT NULL,
                     timestamp_value BIGINT NOT NULL,
-                    accuracy DECIMAL(8, 2),
-                    altitude DECIMAL(8, 2),
-                    speed DECIMAL(8, 2),
+                    accuracy DOUBLE PRECISION,
+                    altitude DOUBLE PRECISION,
+                    speed DOUBLE PRECISION,
                     provider VARCHAR(50),
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
@@ -53,15 +537,119 @@ class Database:
             """)
             print("Tabla location_data verificada/creada y actualizada con device_id")
 
-    async def insert_location(self, data):
-        """Inserta una nueva ubicación"""
-        query = """
-        INSERT INTO location_data
-        (latitude, longitude, timestamp_value, accuracy, altitude, speed, provider, device_id)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-        RETURNING id;
-        """
+            # Los ids salen de location_data_next_id(), que da a la transacción su xid antes del
+            # nextval: una fila con id menor que otra ya visible es de una transacción con xid
+            # anterior a esa lectura (el id seguro de geofence_stats.py depende de esto)
+            await connection.execute("""
+                CREATE OR REPLACE FUNCTION location_data_next_id() RETURNS bigint
+                LANGUAGE plpgsql VOLATILE AS $$
+                BEGIN
+                    PERFORM pg_current_xact_id();
+                    RETURN nextval('location_data_id_seq');
+                END;
+                $$;
+            """)
+            id_default = await connection.fetchval("""
+                SELECT pg_get_expr(d.adbin, d.adrelid)
+                FROM pg_attrdef d
+                JOIN pg_attribute a ON a.attrelid = d.adrelid AND a.attnum = d.adnum
+                WHERE d.adrelid = 'location_data'::regclass AND a.attname = 'id';
+            """)
+            if id_default != 'location_data_next_id()':
+                await connection.execute("ALTER TABLE location_data ALTER COLUMN id SET DEFAULT location_data_next_id();")
+
+            # Contadores de cambios por día (UTC) y celda de 1 grado para la marca de agua de los
+            # tiles (TILE_WATERMARK). Los suben triggers por sentencia sobre las filas insertadas,
+            # borradas o cambiadas, así que cuentan la ingesta UDP, los lotes de /api/location/bulk
+            # y el borrado de archive.py en la misma transacción que la escritura. El valor inicial
+            # da igual (solo importa que cambie), por eso no se rellenan con los datos existentes;
+            # las filas no se borran nunca para que la suma de un rango no pueda repetirse
+            async with connection.transaction():
+                await connection.execute("""
+                    CREATE TABLE IF NOT EXISTS location_changes (
+                        day BIGINT NOT NULL,
+                        lat_cell INTEGER NOT NULL,
+                        lng_cell INTEGER NOT NULL,
+                        version BIGINT NOT NULL,
+                        PRIMARY KEY (day, lat_cell, lng_cell)
+                    );
 
+                    CREATE OR REPLACE FUNCTION location_changes_bump() RETURNS trigger
+                    LANGUAGE plpgsql AS $$
+                    BEGIN
+                        -- En orden de clave, para que dos lotes no se bloqueen en orden cruzado
+                        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                            INSERT INTO location_changes AS c (day, lat_cell, lng_cell, version)
+                            SELECT DISTINCT floor(timestamp_value / 86400000.0)::bigint,
+                                   LEAST(GREATEST(floor(latitude), -91), 90)::int,
+                                   LEAST(GREATEST(floor(longitude), -181), 180)::int, 1
+                            FROM new_rows
+                            ORDER BY 1, 2, 3
+                            ON CONFLICT (day, lat_cell, lng_cell) DO UPDATE SET version = c.version + 1;
+                        END IF;
+                        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                            INSERT INTO location_changes AS c (day, lat_cell, lng_cell, version)
+                            SELECT DISTINCT floor(timestamp_value / 86400000.0)::bigint,
+                                   LEAST(GREATEST(floor(latitude), -91), 90)::int,
+                                   LEAST(GREATEST(floor(longitude), -181), 180)::int, 1
+                            FROM old_rows
+                            ORDER BY 1, 2, 3
+                            ON CONFLICT (day, lat_cell, lng_cell) DO UPDATE SET version = c.version + 1;
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$;
+                """)
+                triggers = {row['tgname'] for row in await connection.fetch("""
+                    SELECT tgname FROM pg_trigger
+                    WHERE tgrelid = 'location_data'::regclass AND tgname LIKE 'location_changes_%';
+                """)}
+                # Solo si faltan: crear un trigger bloquea location_data
+                for event, transition in (('insert', 'NEW TABLE AS new_rows'),
+                                          ('delete', 'OLD TABLE AS old_rows'),
+                                          ('update', 'OLD TABLE AS old_rows NEW TABLE AS new_rows')):
+                    if f'location_changes_{event}' not in triggers:
+                        await connection.execute(f"""
+                            CREATE TRIGGER location_changes_{event}
+                            AFTER {event.upper()} ON location_data
+                            REFERENCING {transition}
+                            FOR EACH STATEMENT EXECUTE FUNCTION location_changes_bump();
+                        """)
+
+            # Claves de idempotencia de los lotes de /api/location/bulk y su resultado
+            await connection.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_batches (
+                    key VARCHAR(255) PRIMARY KEY,
+                    result JSONB,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+
+            # Manifiesto del historial archivado (archive.py): un archivo por fila con sus
+            # rangos de tiempo y coordenadas, para leer solo los que puede tocar una consulta
+            await connection.execute("""
+                CREATE TABLE IF NOT EXISTS location_archive (
+                    path TEXT PRIMARY KEY,
+                    device_id VARCHAR(255),
+                    min_time BIGINT NOT NULL,
+                    max_time BIGINT NOT NULL,
+                    min_lat DOUBLE PRECISION NOT NULL,
+                    max_lat DOUBLE PRECISION NOT NULL,
+                    min_lng DOUBLE PRECISION NOT NULL,
+                    max_lng DOUBLE PRECISION NOT NULL,
+                    rows INTEGER NOT NULL,
+                    bytes BIGINT NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                CREATE INDEX IF NOT EXISTS idx_location_archive_device_time
+                    ON location_archive (device_id, max_time);
+            """)
+
+    @instrumented
+    async def insert_location(self, data):
+        """Inserta una nueva ubicación y devuelve la fila guardada (id y columnas de posición)
+        con ``is_latest``: False si el dispositivo ya tenía una posición más nueva.
+        None si ya estaba guardada (mismo deviceId y time, índice de la migración 009)"""
         values = [
             data.get('lat'),
             data.get('lon'),
@@ -73,48 +661,93 @@ class Database:
             data.get('deviceId')
         ]
 
-        async with self.pool.acquire() as connection:
-            record = await connection.fetchrow(query, *values)
-            return record['id']
+        async with self._acquire('ingest') as connection:
+            record = await self._run_hot(connection, 'insert_location', 'fetchrow', *values)
+            return dict(record) if record else None
+
+    @instrumented
+    async def bulk_insert_locations(self, records, idempotency_key=None):
+        """Carga un lote de registros normalizados (orden de ingest.FIX_COLUMNS) con COPY
+        en una sola transacción.
+
+        Devuelve ``(replayed, result, latest)``: si la clave ya se usó, ``replayed`` es True
+        y ``result`` es lo que devolvió el lote original; si no, ``result`` cuenta las
+        posiciones recibidas, insertadas y repetidas y ``latest`` son las filas que quedan
+        como última posición de cada dispositivo.
+        """
+        async with self._acquire('ingest') as connection:
+            async with connection.transaction():
+                if idempotency_key is not None:
+                    # Un reintento concurrente con la misma clave espera aquí a que este termine
+                    claimed = await connection.fetchval("""
+                        INSERT INTO ingest_batches (key) VALUES ($1)
+                        ON CONFLICT (key) DO NOTHING
+                        RETURNING true;
+                    """, idempotency_key)
+                    if not claimed:
+                        result = await connection.fetchval(
+                            "SELECT result FROM ingest_batches WHERE key = $1;", idempotency_key
+                        )
+                        return True, json.loads(result), []
+
+                await connection.execute("""
+                    CREATE TEMP TABLE ingest_staging (
+                        latitude DOUBLE PRECISION,
+                        longitude DOUBLE PRECISION,
+                        timestamp_value BIGINT,
+                        accuracy DOUBLE PRECISION,
+                        altitude DOUBLE PRECISION,
+                        speed DOUBLE PRECISION,
+                        provider VARCHAR(50),
+                        device_id VARCHAR(255),
+                        ord SERIAL
+                    ) ON COMMIT DROP;
+                """)
+                await connection.copy_records_to_table(
+                    'ingest_staging',
+                    records=records,
+                    columns=('latitude', 'longitude', 'timestamp_value', 'accuracy',
+                             'altitude', 'speed', 'provider', 'device_id')
+                )
+                newest = [dict(row) for row in await connection.fetch(BULK_INSERT)]
+                inserted = newest[0]['inserted_count'] if newest else 0
+                latest = []
+                for row in newest:
+                    del row['inserted_count']
+                    # Un lote atrasado no reemplaza a una posición más nueva ya guardada
+                    if row.pop('is_latest'):
+                        latest.append(row)
+                result = {'received': len(records), 'inserted': inserted, 'duplicates': len(records) - inserted}
+
+                if idempotency_key is not None:
+                    await connection.execute(
+                        "UPDATE ingest_batches SET result = $2::jsonb WHERE key = $1;",
+                        idempotency_key, json.dumps(result)
+                    )
+                    await connection.execute(
+                        "DELETE FROM ingest_batches WHERE created_at < now() - make_interval(secs => $1);",
+                        INGEST_BATCH_KEY_DAYS * 86400
+                    )
+                return False, result, latest
 
+    @instrumented
     async def get_latest_location(self, device_id=None):
         """Obtiene la última ubicación, opcionalmente filtrada por device_id"""
-        if device_id:
-            query = """
-            SELECT latitude, longitude, timestamp_value, created_at, device_id
-            FROM location_data
-            WHERE device_id = $1
-            ORDER BY id DESC
-            LIMIT 1;
-            """
-            async with self.pool.acquire() as connection:
-                record = await connection.fetchrow(query, device_id)
-                return dict(record) if record else None
-        else:
-            query = """
-            SELECT latitude, longitude, timestamp_value, created_at, device_id
-            FROM location_data
-            ORDER BY id DESC
-            LIMIT 1;
-            """
-            async with self.pool.acquire() as connection:
-                record = await connection.fetchrow(query)
-                return dict(record) if record else None
+        async with self._acquire('fresh') as connection:
+            if device_id:
+                record = await self._run_hot(connection, 'latest_location_by_device', 'fetchrow', device_id)
+            else:
+                record = await self._run_hot(connection, 'latest_location', 'fetchrow')
+            return dict(record) if record else None
 
+    @instrumented
     async def get_latest_location_by_devices(self):
         """Obtiene la última ubicación de cada dispositivo único"""
-        query = """
-        SELECT DISTINCT ON (device_id) 
-            latitude, longitude, timestamp_value, created_at, device_id
-        FROM location_data
-        WHERE device_id IS NOT NULL
-        ORDER BY device_id, id DESC;
-        """
-        
-        async with self.pool.acquire() as connection:
-            records = await connection.fetch(query)
+        async with self._acquire('fresh') as connection:
+            records = await self._run_hot(connection, 'latest_by_devices', 'fetch')
             return [dict(record) for record in records]
 
+    @instrumented
     async def get_all_locations(self, limit=100, device_id=None):
         """Obtiene todas las ubicaciones con límite, opcionalmente filtradas por device_id"""
         if device_id:
@@ -124,7 +757,7 @@ class Database:
             ORDER BY id DESC
             LIMIT $2;
             """
-            async with self.pool.acquire() as connection:
+            async with self._acquire('fresh') as connection:
                 records = await connection.fetch(query, device_id, limit)
                 return [dict(record) for record in records]
         else:
@@ -133,33 +766,34 @@ class Database:
             ORDER BY id DESC
             LIMIT $1;
             """
-            async with self.pool.acquire() as connection:
+            async with self._acquire('fresh') as connection:
                 records = await connection.fetch(query, limit)
                 return [dict(record) for record in records]
 
+    @instrumented
     async def get_locations_by_range(self, start_time, end_time, device_id=None):
-        """Obtiene ubicaciones por rango de fechas, opcionalmente filtradas por device_id"""
-        if device_id:
-            query = """
-            SELECT latitude, longitude, timestamp_value, created_at, device_id
-            FROM location_data
-            WHERE timestamp_value >= $1 AND timestamp_value <= $2 AND device_id = $3
-            ORDER BY timestamp_value ASC;
-            """
-            async with self.pool.acquire() as connection:
-                records = await connection.fetch(query, start_time, end_time, device_id)
-                return [dict(record) for record in records]
-        else:
-            query = """
-            SELECT latitude, longitude, timestamp_value, created_at, device_id
-            FROM location_data
-            WHERE timestamp_value >= $1 AND timestamp_value <= $2
-            ORDER BY timestamp_value ASC;
-            """
-            async with self.pool.acquire() as connection:
-                records = await connection.fetch(query, start_time, end_time)
-                return [dict(record) for record in records]
+        """Obtiene ubicaciones por rango de fechas, opcionalmente filtradas por device_id.
+        Incluye las del historial archivado que caen en el rango"""
+        async with self._acquire('replica') as connection:
+            # Misma instantánea para la tabla y el manifiesto: el archivador mueve las filas
+            # de una al otro en una sola transacción
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                if device_id:
+                    records = await self._run_hot(
+                        connection, 'locations_by_range_device', 'fetch', start_time, end_time, device_id
+                    )
+                    files = await self._run_hot(
+                        connection, 'archive_files_by_range_device', 'fetch', start_time, end_time, device_id
+                    )
+                else:
+                    records = await self._run_hot(connection, 'locations_by_range', 'fetch', start_time, end_time)
+                    files = await self._run_hot(connection, 'archive_files_by_range', 'fetch', start_time, end_time)
+        rows = [dict(record) for record in records]
+        if files:
+            rows = await _with_archived(rows, files, start_time=start_time, end_time=end_time)
+        return rows
 
+    @instrumented
     async def get_all_device_ids(self):
         """Obtiene todos los device_id únicos disponibles"""
         query = """
@@ -168,10 +802,11 @@ class Database:
         WHERE device_id IS NOT NULL
         ORDER BY device_id;
         """
-        async with self.pool.acquire() as connection:
+        async with self._acquire('replica') as connection:
             records = await connection.fetch(query)
             return [record['device_id'] for record in records]
 
+    @instrumented
     async def get_locations_in_area(self, min_lat, max_lat, min_lng, max_lng, device_id):
         """Obtiene ubicaciones de un dispositivo dentro de un área rectangular"""
         query = """
@@ -183,10 +818,11 @@ class Database:
         ORDER BY timestamp_value ASC;
         """
         
-        async with self.pool.acquire() as connection:
+        async with self._acquire('replica') as connection:
             records = await connection.fetch(query, device_id, min_lat, max_lat, min_lng, max_lng)
             return [dict(record) for record in records]
         
+    @instrumented
     async def get_locations_in_polygon(self, polygon_points, device_id):
         """Obtiene ubicaciones de un dispositivo dentro de un polígono usando PostGIS"""
         # Convertir [[lat, lng], ...] a formato WKT: POLYGON((lng lat, lng lat, ...))
@@ -207,16 +843,168 @@ class Database:
         ORDER BY timestamp_value ASC;
         """
     
-        async with self.pool.acquire() as connection:
-            records = await connection.fetch(query, device_id, polygon_wkt)
-            return [dict(record) for record in records]    
-    
-        
+        # Archivos del dispositivo cuyo rectángulo toca el del polígono
+        lats = [lat for lat, _ in polygon_points]
+        lngs = [lng for _, lng in polygon_points]
+        files_query = """
+        SELECT path, device_id FROM location_archive
+        WHERE device_id = $1
+        AND max_lat >= $2 AND min_lat <= $3
+        AND max_lng >= $4 AND min_lng <= $5
+        ORDER BY min_time;
+        """
+
+        async with self._acquire('replica') as connection:
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                records = await connection.fetch(query, device_id, polygon_wkt)
+                files = await connection.fetch(files_query, device_id, min(lats), max(lats), min(lngs), max(lngs))
+        rows = [dict(record) for record in records]
+        if files:
+            rows = await _with_archived(rows, files, polygon=polygon_points)
+        return rows
+
+    @instrumented
+    async def get_nearest_locations(self, lat, lng, start_time, end_time, limit, radius_m=None):
+        """Dispositivos más cercanos a un punto dentro de una ventana de tiempo (ms).
+
+        Cada dispositivo aparece una vez, con su posición más cercana de la ventana y
+        ``distance_m`` en metros (ver NEAREST_LOCATIONS). El resultado es exacto sin
+        importar cuántas filas tenga cada dispositivo junto al punto.
+        """
+        async with self._acquire('replica') as connection:
+            records = await connection.fetch(NEAREST_LOCATIONS, lat, lng, start_time, end_time, limit, radius_m)
+        return [dict(record) for record in records]
+
+    @instrumented
+    async def get_location_horizon(self):
+        """(último id visible de location_data, xmin, xmax) de una misma instantánea. Una fila
+        con id menor puede seguir sin confirmar mientras alguna transacción con xid < xmax
+        siga abierta, es decir, hasta que el xmin de una instantánea posterior llegue a xmax.
+        Vale porque location_data_next_id() (create_table) asigna el xid antes que el id"""
+        query = """
+        SELECT COALESCE(MAX(id), 0) AS max_id,
+               pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin,
+               pg_snapshot_xmax(pg_current_snapshot())::text::bigint AS xmax
+        FROM location_data;
+        """
+        async with self._acquire() as connection:
+            record = await connection.fetchrow(query)
+            return record['max_id'], record['xmin'], record['xmax']
+
+    @staticmethod
+    def _tile_filter_args(bounds, start_time, end_time, device_ids):
+        west, south, east, north = bounds
+        return [start_time, end_time, device_ids or None, west, south, east, north]
+
+    @staticmethod
+    def _tile_watermark_args(bounds, start_time, end_time):
+        west, south, east, north = bounds
+        return [start_time // 86400000, end_time // 86400000,
+                math.floor(south), math.floor(north), math.floor(west), math.floor(east)]
+
+    @instrumented
+    async def get_tile_watermark(self, bounds, start_time, end_time):
+        """Marca de agua de los datos de un tile: suma de los contadores de cambios de los días
+        y celdas de 1 grado que cubren su rango y su caja (TILE_WATERMARK).
+
+        Cambia si entra una fila al rango aunque sea tarde o con un id menor que otros ya
+        vistos (un lote confirmado después), y si archive.py borra filas del rango. No mira
+        el filtro de dispositivos: un cambio de otro dispositivo en esas celdas también la
+        cambia, lo que solo cuesta recalcular el tile.
+        """
+        async with self._acquire('replica') as connection:
+            watermark = await connection.fetchval(TILE_WATERMARK, *self._tile_watermark_args(bounds, start_time, end_time))
+        return str(watermark)
+    @instrumented
+    async def get_tile_cells(self, z, x, y, grid, metric, bounds, start_time, end_time, device_ids=None, max_gap_ms=None):
+        """Agregado por celda de un tile Web Mercator: (marca de agua, [{'row', 'col', 'value'}]).
+
+        ``metric`` 'count' cuenta puntos; 'dwell' suma los segundos hasta el punto
+        siguiente del mismo dispositivo dentro del tile (los huecos mayores a
+        ``max_gap_ms`` no suman). El filtro por caja usa el índice GiST de la migración 004.
+        La marca de agua (como get_tile_watermark) se lee en la misma instantánea que las celdas.
+        """
+        if metric == 'dwell':
+            source = """
+                SELECT latitude, longitude,
+                       LEAD(timestamp_value) OVER (PARTITION BY device_id ORDER BY timestamp_value)
+                           - timestamp_value AS gap
+                FROM location_data
+                WHERE {filters}
+            """
+            value = "SUM(CASE WHEN gap <= $12::bigint THEN gap ELSE 0 END) / 1000.0"
+        else:
+            source = "SELECT latitude, longitude FROM location_data WHERE {filters}"
+            value = "COUNT(*)"
+        # Columna y fila de la celda: coordenadas de mundo de Web Mercator (tiles de 2^z) menos el tile, por grid
+        query = f"""
+        SELECT row, col, ({value})::float8 AS value
+        FROM (
+            SELECT LEAST(GREATEST(floor(((longitude + 180) / 360 * $8::float8 - $9::float8) * $11::int)::int, 0),
+                         $11::int - 1) AS col,
+                   LEAST(GREATEST(floor(((1 - ln(tan(radians(latitude)) + 1 / cos(radians(latitude))) / pi()) / 2
+                                         * $8::float8 - $10::float8) * $11::int)::int, 0), $11::int - 1) AS row,
+                   *
+            FROM ({source.format(filters=TILE_FILTERS)}) points
+        ) cells
+        GROUP BY row, col
+        HAVING ({value}) > 0;
+        """
+        filter_args = self._tile_filter_args(bounds, start_time, end_time, device_ids)
+        args = filter_args + [2 ** z, x, y, grid]
+        if metric == 'dwell':
+            args.append(max_gap_ms)
+        async with self._acquire('replica') as connection:
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                watermark = await connection.fetchval(TILE_WATERMARK, *self._tile_watermark_args(bounds, start_time, end_time))
+                records = await connection.fetch(query, *args)
+        return str(watermark), [dict(record) for record in records]
+
+    @instrumented
+    async def get_track_columns(self, device_id, start_time, end_time, limit):
+        """Pista de un dispositivo como columnas (timestamps, latitudes, longitudes) ordenadas por tiempo.
+
+        Una sola fila con un arreglo por columna: asyncpg decodifica los arreglos en C y
+        el llamador los pasa a NumPy sin construir un dict por punto. A lo sumo ``limit`` puntos.
+        """
+        query = """
+        SELECT COALESCE(array_agg(timestamp_value ORDER BY timestamp_value), '{}') AS timestamps,
+               COALESCE(array_agg(latitude ORDER BY timestamp_value), '{}') AS latitudes,
+               COALESCE(array_agg(longitude ORDER BY timestamp_value), '{}') AS longitudes
+        FROM (
+            SELECT timestamp_value, latitude, longitude
+            FROM location_data
+            WHERE device_id = $1 AND timestamp_value BETWEEN $2 AND $3
+            ORDER BY timestamp_value
+            LIMIT $4
+        ) track;
+        """
+        async with self._acquire('replica') as connection:
+            record = await connection.fetchrow(query, device_id, start_time, end_time, limit)
+            return record['timestamps'], record['latitudes'], record['longitudes']
+
+    @instrumented
+    async def get_replay_page(self, device_id, after_time, after_id, end_time, limit):
+        """Página de la pista de un dispositivo posterior a (after_time, after_id), en orden de tiempo"""
+        query = """
+        SELECT id, latitude, longitude, timestamp_value, speed, created_at, device_id
+        FROM location_data
+        WHERE device_id = $1
+        AND (timestamp_value, id) > ($2, $3)
+        AND timestamp_value <= $4
+        ORDER BY timestamp_value, id
+        LIMIT $5;
+        """
+        async with self._acquire('replica') as connection:
+            records = await connection.fetch(query, device_id, after_time, after_id, end_time, limit)
+            return [dict(record) for record in records]
+
             # ==================== GEOFENCES ====================
     
+    @instrumented
     async def create_geofence(self, geofence_data: dict, journeys: list = None):
         """Crea una nueva geocerca con POSTGIS y opcionalmente añade journeys"""
-        async with self.pool.acquire() as connection:
+        async with self._acquire() as connection:
             async with connection.transaction():
                 if 'polygon' in geofence_data and geofence_data['polygon']:
                     polygon_points = geofence_data['polygon']
@@ -280,6 +1068,7 @@ class Database:
                 result['journey_count'] = len(journeys) if journeys else 0
                 return result
 
+    @instrumented
     async def get_all_geofences(self, created_by: str = None, is_active: bool = None):
         """Obtiene todas las geocercas"""
         conditions = []
@@ -306,13 +1095,14 @@ class Database:
         ORDER BY g.created_at DESC;
         """
         
-        async with self.pool.acquire() as connection:
+        async with self._acquire('fresh') as connection:
             records = await connection.fetch(query, *params)
             return [dict(record) for record in records]
 
+    @instrumented
     async def get_geofence_by_id(self, geofence_id: int):
         """Obtiene una geocerca por ID con sus journeys"""
-        async with self.pool.acquire() as connection:
+        async with self._acquire('fresh') as connection:
             # Obtener geocerca
             geofence_query = """
             SELECT * FROM geofences WHERE id = $1;
@@ -344,6 +1134,7 @@ class Database:
             
             return result
 
+    @instrumented
     async def update_geofence(self, geofence_id: int, update_data: dict):
         """Actualiza una geocerca"""
         query = """
@@ -361,7 +1152,7 @@ class Database:
         RETURNING *;
         """
         
-        async with self.pool.acquire() as connection:
+        async with self._acquire() as connection:
             record = await connection.fetchrow(
                 query,
                 update_data.get('name'),
@@ -374,8 +1165,13 @@ class Database:
                 update_data.get('is_active'),
                 geofence_id
             )
+            if record and any(update_data.get(key) is not None for key in GEOFENCE_AREA_FIELDS):
+                # Cambió el área o los dispositivos: las estadísticas se recalculan desde el principio
+                for table in ('geofence_stats_progress', 'geofence_stats_daily', 'geofence_visit_state'):
+                    await connection.execute(f"DELETE FROM {table} WHERE geofence_id = $1;", geofence_id)
             return dict(record) if record else None
 
+    @instrumented
     async def delete_geofence(self, geofence_id: int):
         """Elimina una geocerca permanentemente (hard delete)"""
         query = """
@@ -383,8 +1179,331 @@ class Database:
         WHERE id = $1
         RETURNING id;
         """
-        async with self.pool.acquire() as connection:
+        async with self._acquire() as connection:
             result = await connection.fetchrow(query, geofence_id)
             return result is not None
 
+    # ==================== ESTADÍSTICAS DE GEOCERCAS ====================
+
+    @instrumented
+    async def get_geofence_stats_targets(self):
+        """Geocercas activas con su polígono (GeoJSON), dispositivos y marca de agua de estadísticas
+        (None si todavía no empezó el backfill)"""
+        query = """
+        SELECT g.id, g.min_lat, g.max_lat, g.min_lng, g.max_lng, g.device_ids,
+               ST_AsGeoJSON(g.polygon_geom) AS polygon,
+               p.last_id
+        FROM geofences g
+        LEFT JOIN geofence_stats_progress p ON p.geofence_id = g.id
+        WHERE g.is_active
+        ORDER BY g.id;
+        """
+        async with self._acquire() as connection:
+            records = await connection.fetch(query)
+            geofences = [dict(record) for record in records]
+            for geofence in geofences:
+                if geofence['polygon']:
+                    geofence['polygon'] = json.loads(geofence['polygon'])
+            return geofences
+
+    @instrumented
+    async def get_location_batch(self, after_id, upto_id, device_ids, limit):
+        """Posiciones de ``device_ids`` con after_id < id <= upto_id, en orden de id"""
+        query = """
+        SELECT id, latitude, longitude, timestamp_value, device_id
+        FROM location_data
+        WHERE id > $1 AND id <= $2 AND device_id = ANY($3::text[])
+        ORDER BY id
+        LIMIT $4;
+        """
+        async with self._acquire() as connection:
+            records = await connection.fetch(query, after_id, upto_id, device_ids, limit)
+            return [dict(record) for record in records]
+
+    @instrumented
+    async def get_device_history(self, device_id, since, upto_id):
+        """Posiciones de un dispositivo con timestamp >= since (todas con None): las de
+        location_data con id <= upto_id y los archivos del historial que pueden tenerlas,
+        leídos en la misma instantánea"""
+        query = """
+        SELECT latitude, longitude, timestamp_value
+        FROM location_data
+        WHERE device_id = $1 AND ($2::bigint IS NULL OR timestamp_value >= $2) AND id <= $3;
+        """
+        files_query = """
+        SELECT path, device_id FROM location_archive
+        WHERE device_id = $1 AND ($2::bigint IS NULL OR max_time >= $2)
+        ORDER BY min_time;
+        """
+        async with self._acquire() as connection:
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                records = await connection.fetch(query, device_id, since, upto_id)
+                files = await connection.fetch(files_query, device_id, since)
+        return [dict(record) for record in records], [dict(file) for file in files]
+
+    @instrumented
+    async def get_geofence_visit_states(self, geofence_ids):
+        """{(geofence_id, device_id): (visit_start, last_seen)} de las visitas abiertas"""
+        query = """
+        SELECT geofence_id, device_id, visit_start, last_seen
+        FROM geofence_visit_state
+        WHERE geofence_id = ANY($1::int[]);
+        """
+        async with self._acquire() as connection:
+            records = await connection.fetch(query, geofence_ids)
+            return {(r['geofence_id'], r['device_id']): (r['visit_start'], r['last_seen']) for r in records}
+
+    @instrumented
+    async def apply_geofence_stats(self, geofence_ids, after_id, upto_id, days, states, replaced=()):
+        """Suma un lote a geofence_stats_daily, guarda las visitas abiertas y mueve la marca de
+        agua de ``geofence_ids`` de after_id (None: sin marca todavía) a upto_id, en una
+        transacción. ``replaced`` [(geofence_id, device_id, día), ...] borra antes los días
+        desde ese que ``days`` trae recalculados. Si la marca de agua de alguna ya no es
+        after_id (otro proceso o un reinicio) no aplica nada y devuelve False"""
+        async with self._acquire() as connection:
+            try:
+                async with connection.transaction():
+                    if after_id is None:
+                        moved = await connection.fetch("""
+                            INSERT INTO geofence_stats_progress (geofence_id, last_id)
+                            SELECT unnest($1::int[]), $2
+                            ON CONFLICT (geofence_id) DO NOTHING
+                            RETURNING geofence_id;
+                        """, geofence_ids, upto_id)
+                    else:
+                        moved = await connection.fetch("""
+                            UPDATE geofence_stats_progress SET last_id = $3
+                            WHERE geofence_id = ANY($1::int[]) AND last_id = $2
+                            RETURNING geofence_id;
+                        """, geofence_ids, after_id, upto_id)
+                    if len(moved) != len(geofence_ids):
+                        raise _WatermarkMoved()
+                    if replaced:
+                        await connection.executemany("""
+                            DELETE FROM geofence_stats_daily
+                            WHERE geofence_id = $1 AND device_id = $2 AND day >= $3;
+                        """, replaced)
+                    await connection.executemany("""
+                        INSERT INTO geofence_stats_daily AS s
+                        (geofence_id, device_id, day, visits, dwell_ms, first_seen, last_seen)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7)
+                        ON CONFLICT (geofence_id, device_id, day) DO UPDATE SET
+                            visits = s.visits + EXCLUDED.visits,
+                            dwell_ms = s.dwell_ms + EXCLUDED.dwell_ms,
+                            first_seen = LEAST(s.first_seen, EXCLUDED.first_seen),
+                            last_seen = GREATEST(s.last_seen, EXCLUDED.last_seen);
+                    """, days)
+                    await connection.executemany("""
+                        INSERT INTO geofence_visit_state (geofence_id, device_id, visit_start, last_seen)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (geofence_id, device_id) DO UPDATE SET
+                            visit_start = EXCLUDED.visit_start,
+                            last_seen = EXCLUDED.last_seen;
+                    """, states)
+            except _WatermarkMoved:
+                return False
+            return True
+
+    @instrumented
+    async def reset_geofence_stats(self, geofence_id):
+        """Borra las estadísticas de una geocerca para que se vuelvan a calcular desde el principio"""
+        async with self._acquire() as connection:
+            async with connection.transaction():
+                for table in ('geofence_stats_progress', 'geofence_stats_daily', 'geofence_visit_state'):
+                    await connection.execute(f"DELETE FROM {table} WHERE geofence_id = $1;", geofence_id)
+
+    @instrumented
+    async def get_geofence_stats(self, geofence_id, start_day=None, end_day=None, device_id=None):
+        """Filas diarias de estadísticas de una geocerca (días UTC inclusivos) y su marca de agua;
+        None si la geocerca no existe"""
+        query = """
+        SELECT device_id, day, visits, dwell_ms, first_seen, last_seen
+        FROM geofence_stats_daily
+        WHERE geofence_id = $1
+          AND ($2::date IS NULL OR day >= $2)
+          AND ($3::date IS NULL OR day <= $3)
+          AND ($4::text IS NULL OR device_id = $4)
+        ORDER BY device_id, day;
+        """
+        async with self._acquire('replica') as connection:
+            geofence = await connection.fetchrow("""
+                SELECT g.id, p.last_id
+                FROM geofences g
+                LEFT JOIN geofence_stats_progress p ON p.geofence_id = g.id
+                WHERE g.id = $1;
+            """, geofence_id)
+            if geofence is None:
+                return None
+            records = await connection.fetch(query, geofence_id, start_day, end_day, device_id)
+            return {'last_id': geofence['last_id'], 'days': [dict(record) for record in records]}
+
+    # ==================== DETECCIONES ====================
+
+    async def create_detection_tables(self):
+        """Crea las tablas del historial de detecciones y sus rollups si no existen"""
+        async with self._acquire() as connection:
+            await connection.execute("""
+                CREATE TABLE IF NOT EXISTS detection_events (
+                    device_id VARCHAR(255) NOT NULL,
+                    detected_at TIMESTAMPTZ NOT NULL,
+                    person_count INTEGER NOT NULL,
+                    source VARCHAR(100)
+                );
+                CREATE INDEX IF NOT EXISTS idx_detection_events_device_time
+                    ON detection_events (device_id, detected_at);
+            """)
+            for table in DETECTION_ROLLUP_TABLES.values():
+                await connection.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        device_id VARCHAR(255) NOT NULL,
+                        bucket TIMESTAMPTZ NOT NULL,
+                        samples INTEGER NOT NULL,
+                        count_sum BIGINT NOT NULL,
+                        count_min INTEGER NOT NULL,
+                        count_max INTEGER NOT NULL,
+                        PRIMARY KEY (device_id, bucket)
+                    );
+                """)
+            print("Tablas del historial de detecciones verificadas/creadas")
+
+    @instrumented
+    async def write_detections(self, rows):
+        """Guarda un lote de detecciones (device_id, detected_at, person_count, source) con COPY
+        y suma el lote a los rollups por minuto y por hora en la misma transacción"""
+        async with self._acquire('ingest') as connection:
+            async with connection.transaction():
+                await connection.copy_records_to_table(
+                    'detection_events',
+                    records=rows,
+                    columns=('device_id', 'detected_at', 'person_count', 'source')
+                )
+                for seconds, table in DETECTION_ROLLUP_TABLES.items():
+                    await connection.execute(
+                        DETECTION_ROLLUP_UPSERT.format(table=table),
+                        *_detection_rollup(rows, seconds)
+                    )
+
+    @instrumented
+    async def get_detection_series(self, start, end, resolution, source, device_ids=None):
+        """Conteos por dispositivo e intervalo de ``resolution`` segundos entre start y end.
+
+        ``source`` es 'raw', 'minute' u 'hour' (ver detection_history.series_source).
+        """
+        if source == 'raw':
+            table, time_column = 'detection_events', 'detected_at'
+            aggregates = """
+                COUNT(*)::int AS samples,
+                AVG(person_count)::float8 AS avg_count,
+                MIN(person_count) AS min_count,
+                MAX(person_count) AS max_count
+            """
+        else:
+            table, time_column = DETECTION_ROLLUP_TABLES[60 if source == 'minute' else 3600], 'bucket'
+            aggregates = """
+                SUM(samples)::int AS samples,
+                SUM(count_sum)::float8 / SUM(samples) AS avg_count,
+                MIN(count_min) AS min_count,
+                MAX(count_max) AS max_count
+            """
+        query = f"""
+        SELECT device_id,
+               to_timestamp(floor(extract(epoch FROM {time_column}) / $3) * $3) AS bucket,
+               {aggregates}
+        FROM {table}
+        WHERE {time_column} >= $1 AND {time_column} < $2
+          AND ($4::text[] IS NULL OR device_id = ANY($4::text[]))
+        GROUP BY 1, 2
+        ORDER BY 1, 2;
+        """
+        async with self._acquire('replica') as connection:
+            records = await connection.fetch(query, start, end, resolution, device_ids or None)
+            return [dict(record) for record in records]
+
+    # ==================== HISTORIAL ARCHIVADO ====================
+
+    @instrumented
+    async def get_archive_candidates(self, cutoff, device_id=None):
+        """Grupos (dispositivo, mes UTC) con filas anteriores a ``cutoff`` (ms) y cuántas tienen"""
+        query = """
+        SELECT device_id,
+               (EXTRACT(EPOCH FROM month) * 1000)::bigint AS start_time,
+               (EXTRACT(EPOCH FROM month + interval '1 month') * 1000)::bigint AS end_time,
+               COUNT(*) AS rows
+        FROM (
+            SELECT device_id,
+                   date_trunc('month', to_timestamp(timestamp_value / 1000.0) AT TIME ZONE 'UTC') AS month
+            FROM location_data
+            WHERE timestamp_value < $1 AND ($2::text IS NULL OR device_id = $2)
+        ) old
+        GROUP BY device_id, month
+        ORDER BY month, device_id;
+        """
+        async with self._acquire() as connection:
+            records = await connection.fetch(query, cutoff, device_id)
+            return [dict(record) for record in records]
+
+    @instrumented
+    async def get_archive_columns(self, device_id, start_time, end_time):
+        """Filas de un dispositivo (``None``: sin device_id) en [start_time, end_time) como
+        un arreglo por columna, en orden de tiempo"""
+        device_filter = 'device_id IS NULL' if device_id is None else 'device_id = $3'
+        query = f"""
+        SELECT COALESCE(array_agg(id ORDER BY timestamp_value, id), '{{}}') AS id,
+               COALESCE(array_agg(latitude ORDER BY timestamp_value, id), '{{}}') AS latitude,
+               COALESCE(array_agg(longitude ORDER BY timestamp_value, id), '{{}}') AS longitude,
+               COALESCE(array_agg(timestamp_value ORDER BY timestamp_value, id), '{{}}') AS timestamp_value,
+               COALESCE(array_agg(accuracy ORDER BY timestamp_value, id), '{{}}') AS accuracy,
+               COALESCE(array_agg(altitude ORDER BY timestamp_value, id), '{{}}') AS altitude,
+               COALESCE(array_agg(speed ORDER BY timestamp_value, id), '{{}}') AS speed,
+               COALESCE(array_agg(provider ORDER BY timestamp_value, id), '{{}}') AS provider,
+               COALESCE(array_agg(created_at ORDER BY timestamp_value, id), '{{}}') AS created_at
+        FROM location_data
+        WHERE timestamp_value >= $1 AND timestamp_value < $2 AND {device_filter};
+        """
+        args = (start_time, end_time) if device_id is None else (start_time, end_time, device_id)
+        async with self._acquire() as connection:
+            return dict(await connection.fetchrow(query, *args))
+
+    @instrumented
+    async def commit_archive_file(self, entry, start_time, end_time, max_id):
+        """Registra un archivo en el manifiesto y borra de location_data las filas que contiene,
+        en una transacción. Si el borrado no coincide con las filas del archivo (p. ej. llegó una
+        fila con id menor después de leer) no se hace nada y devuelve False"""
+        device_filter = 'device_id IS NULL' if entry['device_id'] is None else 'device_id = $4'
+        delete = f"""
+        DELETE FROM location_data
+        WHERE timestamp_value >= $1 AND timestamp_value < $2 AND id <= $3 AND {device_filter};
+        """
+        args = (start_time, end_time, max_id) if entry['device_id'] is None else (start_time, end_time, max_id, entry['device_id'])
+        async with self._acquire() as connection:
+            try:
+                async with connection.transaction():
+                    await connection.execute("""
+                        INSERT INTO location_archive
+                        (path, device_id, min_time, max_time, min_lat, max_lat, min_lng, max_lng, rows, bytes)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10);
+                    """, entry['path'], entry['device_id'], entry['min_time'], entry['max_time'],
+                        entry['min_lat'], entry['max_lat'], entry['min_lng'], entry['max_lng'],
+                        entry['rows'], entry['bytes'])
+                    status = await connection.execute(delete, *args)
+                    if int(status.split()[-1]) != entry['rows']:
+                        raise _ArchiveMismatch()
+            except _ArchiveMismatch:
+                return False
+            return True
+
+    async def vacuum_locations(self):
+        """VACUUM ANALYZE de location_data tras archivar (no puede ir en una transacción)"""
+        async with self._acquire() as connection:
+            await connection.execute("VACUUM ANALYZE location_data;")
+
+
+class _ArchiveMismatch(Exception):
+    pass
+
+
+class _WatermarkMoved(Exception):
+    pass
+
+
 db = Database()
\ No newline at end of file
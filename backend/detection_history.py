@@ -0,0 +1,138 @@
+"""
+Historial de detecciones de personas (ocupación por cámara).
+Cada detección recibida por la señalización se publica en el hub como 'detection';
+el proceso que hace la ingesta (main.py en modo embebido, el de ingesta con
+run.py --split) las acumula y cada DETECTION_FLUSH_MS las escribe en lote con COPY
+en detection_events. En la misma transacción se actualizan los rollups por minuto
+y por hora, así las series de semanas se leen de tablas pequeñas.
+
+Variables de entorno:
+  DETECTION_HISTORY=1           0 = no guardar historial
+  DETECTION_FLUSH_MS=1000       intervalo máximo entre escrituras
+  DETECTION_FLUSH_MAX=5000      detecciones acumuladas que fuerzan una escritura inmediata
+  DETECTION_BUFFER_MAX=100000   máximo en memoria si la base de datos no responde (se descartan las más viejas)
+  DETECTION_MAX_BUCKETS=5000    intervalos por dispositivo que puede pedir una consulta
+"""
+
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from live import hub
+from metrics import Counter, Gauge
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DETECTION_HISTORY = os.getenv('DETECTION_HISTORY', '1') == '1'
+DETECTION_FLUSH_MS = float(os.getenv('DETECTION_FLUSH_MS', 1000))
+DETECTION_FLUSH_MAX = int(os.getenv('DETECTION_FLUSH_MAX', 5000))
+DETECTION_BUFFER_MAX = int(os.getenv('DETECTION_BUFFER_MAX', 100000))
+DETECTION_MAX_BUCKETS = int(os.getenv('DETECTION_MAX_BUCKETS', 5000))
+
+DETECTION_ROWS = Counter('detection_history_rows_total', 'Detecciones del historial por resultado', ('outcome',))
+DETECTION_FLUSHES = Counter('detection_history_flushes_total', 'Escrituras en lote del historial', ('outcome',))
+DETECTION_BUFFERED = Gauge('detection_history_buffered', 'Detecciones en memoria pendientes de escribir')
+
+_RESOLUTION = re.compile(r'^(\d+)([smhd])$')
+_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_resolution(text):
+    """'30s', '5m', '1h', '1d' -> segundos"""
+    match = _RESOLUTION.match(text or '')
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Resolución inválida: {text!r} (usar p. ej. 30s, 5m, 1h, 1d)")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+
+def series_source(resolution):
+    """Tabla de la que sale una serie: el rollup más grueso que divide la resolución"""
+    if resolution % 3600 == 0:
+        return 'hour'
+    if resolution % 60 == 0:
+        return 'minute'
+    return 'raw'
+
+
+class DetectionWriter:
+    """Acumula las detecciones del hub y las escribe en lote con ``db.write_detections``"""
+
+    def __init__(self, db, flush_ms=DETECTION_FLUSH_MS, flush_max=DETECTION_FLUSH_MAX,
+                 buffer_max=DETECTION_BUFFER_MAX):
+        self.db = db
+        self.interval = flush_ms / 1000
+        self.flush_max = flush_max
+        self.buffer_max = buffer_max
+        self.buffer = []
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    async def start(self):
+        hub.subscribe('detection', self._on_detection)
+        self._task = asyncio.create_task(self._run())
+
+    def _on_detection(self, payload):
+        device_id = payload.get('deviceId')
+        try:
+            person_count = int(payload.get('personCount'))
+        except (TypeError, ValueError):
+            person_count = None
+        if not device_id or person_count is None or person_count < 0:
+            DETECTION_ROWS.inc(labels=('invalid',))
+            return
+        # Hora de llegada al servidor: los relojes de los clientes no son confiables
+        self.buffer.append((str(device_id), datetime.now(timezone.utc), person_count, payload.get('source')))
+        if len(self.buffer) > self.buffer_max:
+            DETECTION_ROWS.inc(len(self.buffer) - self.buffer_max, labels=('dropped',))
+            del self.buffer[:len(self.buffer) - self.buffer_max]
+        DETECTION_BUFFERED.set(len(self.buffer))
+        if len(self.buffer) >= self.flush_max:
+            self._wake.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await self.db.write_detections(batch)
+        except asyncio.CancelledError:
+            # Cancelado a mitad de la escritura: el lote vuelve al buffer
+            self.buffer = (batch + self.buffer)[-self.buffer_max:]
+            DETECTION_BUFFERED.set(len(self.buffer))
+            raise
+        except Exception as e:
+            # Se reintenta en la próxima escritura, delante de lo que llegó mientras tanto
+            logger.error("❌ Error guardando %d detecciones: %s", len(batch), e)
+            DETECTION_FLUSHES.inc(labels=('error',))
+            self.buffer = (batch + self.buffer)[-self.buffer_max:]
+            DETECTION_BUFFERED.set(len(self.buffer))
+            return
+        DETECTION_BUFFERED.set(len(self.buffer))
+        DETECTION_FLUSHES.inc(labels=('ok',))
+        DETECTION_ROWS.inc(len(batch), labels=('written',))
+
+    async def stop(self):
+        hub.unsubscribe('detection', self._on_detection)
+        if self._task:
+            # Se deja terminar la escritura en curso en lugar de cancelarla
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,108 @@
+"""
+Reparto de detecciones de personas (evento 'detection-update').
+Cada dispositivo tiene su sala de Socket.IO; solo sus suscriptores reciben sus
+detecciones. Las actualizaciones se agrupan a una tasa máxima por dispositivo
+(gana el último valor) y, en modo solo-cambios, se omiten las que repiten personCount.
+
+Variables de entorno:
+  DETECTION_MAX_RATE=2        actualizaciones/s por dispositivo (0 = sin límite)
+  DETECTION_CHANGE_ONLY=0     1 = no reenviar un personCount igual al último enviado
+"""
+
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DETECTION_MAX_RATE = float(os.getenv('DETECTION_MAX_RATE', 2))
+DETECTION_CHANGE_ONLY = os.getenv('DETECTION_CHANGE_ONLY', '0') == '1'
+
+# Sala con las detecciones de todos los dispositivos (panel del mapa)
+ALL_DEVICES_ROOM = 'detections:*'
+
+DETECTION_UPDATES = Counter('detection_updates_total', 'Detecciones recibidas por resultado', ('outcome',))
+
+
+def device_room(device_id):
+    return f'detections:{device_id}'
+
+
+class _DeviceState:
+    __slots__ = ('last_emit', 'last_count', 'pending', 'timer')
+
+    def __init__(self):
+        self.last_emit = float('-inf')
+        self.last_count = None
+        self.pending = None
+        self.timer = None
+
+
+class DetectionThrottle:
+    """Limita y agrupa las detecciones de cada dispositivo antes de emitirlas.
+
+    ``emit(device_id, payload)`` es la corrutina que entrega la actualización.
+    """
+
+    def __init__(self, emit, max_rate=DETECTION_MAX_RATE, change_only=DETECTION_CHANGE_ONLY):
+        self.emit = emit
+        self.interval = 1 / max_rate if max_rate > 0 else 0
+        self.change_only = change_only
+        self.devices = {}
+        # Emisiones diferidas en curso: el loop solo guarda referencias débiles a las tareas
+        self._tasks = set()
+
+    async def submit(self, device_id, payload):
+        """Emite ya si se puede; si no, deja la detección pendiente reemplazando la anterior"""
+        state = self.devices.get(device_id)
+        if state is None:
+            state = self.devices[device_id] = _DeviceState()
+
+        loop = asyncio.get_running_loop()
+        if state.timer is None and loop.time() - state.last_emit >= self.interval:
+            await self._emit(device_id, state, payload)
+            return
+
+        if state.pending is not None:
+            DETECTION_UPDATES.inc(labels=('coalesced',))
+        state.pending = payload
+        if state.timer is None:
+            state.timer = loop.call_at(state.last_emit + self.interval, self._flush, device_id)
+
+    def _flush(self, device_id):
+        state = self.devices.get(device_id)
+        if state is None:
+            return
+        state.timer = None
+        payload, state.pending = state.pending, None
+        if payload is not None:
+            task = asyncio.create_task(self._emit(device_id, state, payload))
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._emitted(device_id, done))
+
+    def _emitted(self, device_id, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Error emitiendo detección de %s: %s", device_id, task.exception())
+
+    async def _emit(self, device_id, state, payload):
+        count = payload.get('personCount')
+        if self.change_only and count == state.last_count:
+            DETECTION_UPDATES.inc(labels=('unchanged',))
+            return
+        state.last_emit = asyncio.get_running_loop().time()
+        state.last_count = count
+        DETECTION_UPDATES.inc(labels=('emitted',))
+        await self.emit(device_id, payload)
+
+    def forget(self, device_id):
+        """Descarta el estado de un dispositivo (p. ej. cuando su broadcaster se va)"""
+        state = self.devices.pop(device_id, None)
+        if state is not None and state.timer is not None:
+            state.timer.cancel()
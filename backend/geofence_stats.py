@@ -0,0 +1,299 @@
+"""
+Estadísticas de visitas y permanencia por geocerca, dispositivo y día (UTC), en la
+tabla geofence_stats_daily. Se actualizan de forma incremental: cada
+GEOFENCE_STATS_INTERVAL_S el proceso que hace la ingesta lee las posiciones nuevas
+de location_data (id mayor que la marca de agua de cada geocerca) y suma a cada día
+las visitas y la permanencia que aportan. Solo lee hasta un id seguro: los ids se
+asignan al insertar y se confirman después, así que el MAX(id) visible puede tener por
+debajo filas de transacciones todavía abiertas. Cada transacción obtiene su xid antes
+de tomar un id (default location_data_next_id(), ver Database.create_table), así que
+toda fila con id menor que ese máximo es de una transacción con xid menor que el xmax
+de la instantánea en que se leyó. El máximo se usa recién cuando terminaron todas esas
+transacciones (xmin de una instantánea posterior >= ese xmax), normalmente en la
+lectura siguiente; una transacción muy larga lo retrasa.
+
+Una geocerca nueva, editada o reiniciada no tiene marca de agua y se rellena (backfill)
+con el mismo proceso, sin frenar a las que ya están al día: primero el historial
+archivado de sus dispositivos (archive.py) y después location_data por lotes de id.
+
+Una visita sigue el mismo criterio que /api/location/area-records: posiciones del
+dispositivo dentro del polígono separadas por no más de GEOFENCE_VISIT_GAP_S. La
+permanencia de una visita es el tiempo entre su primera y su última posición y se
+suma al día de cada posición; la visita cuenta en el día en que empieza. La visita
+abierta de cada (geocerca, dispositivo) se guarda en geofence_visit_state, así una
+visita que cruza dos lotes se sigue contando como una sola.
+
+Lo que aporta una posición a su día depende solo de ella y de la anterior dentro de la
+geocerca. Si un lote trae posiciones anteriores a la última procesada del dispositivo
+(p. ej. un lote sin conexión), sus días desde el de la más antigua se recalculan desde
+cero con location_data y el historial archivado, en la misma transacción que mueve la
+marca de agua.
+
+Limitaciones: una fila que se archiva antes de que la procese el updater (atraso mayor
+que ARCHIVE_AFTER_DAYS) solo se cuenta si un recálculo o un backfill cubre su día.
+
+Variables de entorno:
+  GEOFENCE_STATS_INTERVAL_S=30   intervalo entre actualizaciones (0 = desactivado)
+  GEOFENCE_STATS_BATCH=50000     posiciones leídas por lote
+  GEOFENCE_VISIT_GAP_S=300       hueco que separa dos visitas
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, time, timezone
+
+from dotenv import load_dotenv
+
+from archive import read_archived
+from area_index import Area
+from metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEOFENCE_STATS_INTERVAL_S = float(os.getenv('GEOFENCE_STATS_INTERVAL_S', 30))
+GEOFENCE_STATS_BATCH = int(os.getenv('GEOFENCE_STATS_BATCH', 50000))
+GEOFENCE_VISIT_GAP_S = float(os.getenv('GEOFENCE_VISIT_GAP_S', 300))
+
+GEOFENCE_STATS_POINTS = Counter(
+    'geofence_stats_points_total', 'Posiciones evaluadas para las estadísticas de geocercas', ('outcome',)
+)
+
+
+def geofence_area(geofence):
+    """Área de una geocerca: su polígono (GeoJSON de polygon_geom) o, si no tiene, el rectángulo"""
+    if geofence.get('polygon'):
+        # GeoJSON usa (lng, lat); el anillo viene cerrado (último vértice = primero)
+        ring = geofence['polygon']['coordinates'][0][:-1]
+        return Area.from_polygon((lat, lng) for lng, lat in ring)
+    return Area(geofence['min_lat'], geofence['min_lng'], geofence['max_lat'], geofence['max_lng'])
+
+
+def utc_day(timestamp):
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).date()
+
+
+def day_start(day):
+    """Inicio (ms) de un día UTC"""
+    return int(datetime.combine(day, time.min, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def accumulate(state, timestamps, gap_ms, days):
+    """Suma a ``days`` {día: [visitas, permanencia_ms, primera, última]} las posiciones dentro
+    de la geocerca de un dispositivo (``timestamps`` ordenados y no anteriores a last_seen) y devuelve el nuevo estado
+    (visit_start, last_seen) de su visita abierta"""
+    visit_start, last_seen = state
+    for timestamp in timestamps:
+        day = days.get(utc_day(timestamp))
+        if day is None:
+            day = days[utc_day(timestamp)] = [0, 0, timestamp, timestamp]
+        if last_seen is not None and timestamp - last_seen <= gap_ms:
+            day[1] += timestamp - last_seen
+        else:
+            day[0] += 1
+            visit_start = timestamp
+        day[2] = min(day[2], timestamp)
+        day[3] = max(day[3], timestamp)
+        last_seen = timestamp
+    return visit_start, last_seen
+
+
+class GeofenceStatsUpdater:
+    """Actualiza geofence_stats_daily cada ``interval`` segundos"""
+
+    def __init__(self, db, interval=GEOFENCE_STATS_INTERVAL_S, batch=GEOFENCE_STATS_BATCH,
+                 gap_s=GEOFENCE_VISIT_GAP_S):
+        self.db = db
+        self.interval = interval
+        self.batch = batch
+        self.gap_ms = gap_s * 1000
+        self._task = None
+        # Id hasta el que ya no puede aparecer ninguna fila y (id, xmax) a la espera de serlo
+        self._head = 0
+        self._candidate = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.run_once():
+                    # Backfill pendiente: siguiente lote sin esperar
+                    await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Error actualizando estadísticas de geocercas: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Procesa un lote por cada marca de agua distinta; True si alguna geocerca quedó atrasada"""
+        geofences = await self.db.get_geofence_stats_targets()
+        if not geofences:
+            return False
+        head = await self._safe_head()
+        pending = [geofence for geofence in geofences if geofence['last_id'] is None]
+        if pending:
+            await self._backfill_archive(pending)
+        groups = defaultdict(list)
+        for geofence in geofences:
+            if geofence['last_id'] is not None and geofence['last_id'] < head:
+                groups[geofence['last_id']].append(geofence)
+
+        # Tras el historial archivado siguen los lotes de location_data
+        behind = bool(pending)
+        for after_id, group in groups.items():
+            device_ids = sorted({device_id for geofence in group for device_id in geofence['device_ids']})
+            rows = await self.db.get_location_batch(after_id, head, device_ids, self.batch)
+            # Con un lote completo puede haber más filas hasta head
+            upto = rows[-1]['id'] if len(rows) == self.batch else head
+            behind = behind or upto < head
+            await self._apply(group, rows, after_id, upto)
+        return behind
+
+    async def _safe_head(self):
+        max_id, xmin, xmax = await self.db.get_location_horizon()
+        if self._candidate is None and max_id > self._head:
+            self._candidate = (max_id, xmax)
+        if self._candidate is not None and xmin >= self._candidate[1]:
+            # Terminaron las transacciones abiertas cuando se leyó el candidato
+            self._head = self._candidate[0]
+            self._candidate = None
+        return self._head
+
+    async def _backfill_archive(self, group):
+        """Primer paso del backfill: el historial archivado de los dispositivos, con la marca
+        de agua en 0 para que siga location_data"""
+        days, states = [], []
+        for device_id in sorted({device_id for geofence in group for device_id in geofence['device_ids']}):
+            geofences = [geofence for geofence in group if device_id in geofence['device_ids']]
+            device_days, device_states = await self._recompute(device_id, geofences, None, 0)
+            days.extend(device_days)
+            states.extend(device_states)
+        if not await self.db.apply_geofence_stats([geofence['id'] for geofence in group], None, 0, days, states):
+            logger.warning("⚠️ Marca de agua de geocercas cambiada durante el backfill del historial archivado")
+
+    async def _recompute(self, device_id, geofences, since, upto):
+        """Días (desde el de ``since``; todos con None) y visita abierta de ``device_id`` en
+        ``geofences``, calculados desde cero con sus posiciones de location_data hasta el id
+        ``upto`` y las del historial archivado"""
+        first_day = None if since is None else utc_day(since)
+        # Lo que aporta la primera posición del día depende de la anterior solo si está a
+        # menos de un hueco de visita
+        start = None if since is None else day_start(first_day) - self.gap_ms
+        rows, files = await self.db.get_device_history(device_id, start, upto)
+        areas = [(geofence['id'], geofence_area(geofence)) for geofence in geofences]
+        inside = {geofence_id: [] for geofence_id, _ in areas}
+
+        def collect(points):
+            for point in points:
+                for geofence_id, area in areas:
+                    if area.contains(point['latitude'], point['longitude']):
+                        inside[geofence_id].append(point['timestamp_value'])
+
+        collect(rows)
+        for file in files:
+            # De a un archivo: solo quedan en memoria los timestamps dentro de las geocercas
+            collect(await read_archived([(file['path'], file['device_id'])], start_time=start))
+
+        days, states = [], []
+        for geofence_id, timestamps in inside.items():
+            if not timestamps:
+                continue
+            timestamps.sort()
+            per_day = {}
+            visit_start, last_seen = accumulate((None, None), timestamps, self.gap_ms, per_day)
+            states.append((geofence_id, device_id, visit_start, last_seen))
+            days.extend(
+                (geofence_id, device_id, day, visits, dwell, first, last)
+                for day, (visits, dwell, first, last) in per_day.items()
+                if first_day is None or day >= first_day
+            )
+        return days, states
+
+    async def _apply(self, group, rows, after_id, upto):
+        by_device = defaultdict(list)
+        for row in rows:
+            by_device[row['device_id']].append(row)
+        for points in by_device.values():
+            points.sort(key=lambda row: row['timestamp_value'])
+
+        states = await self.db.get_geofence_visit_states([geofence['id'] for geofence in group])
+        days, new_states = [], []
+        # Dispositivo -> (geocercas con posiciones atrasadas, la más antigua)
+        late = {}
+        for geofence in group:
+            area = geofence_area(geofence)
+            for device_id in geofence['device_ids']:
+                timestamps = [
+                    point['timestamp_value'] for point in by_device.get(device_id, ())
+                    if area.contains(point['latitude'], point['longitude'])
+                ]
+                if not timestamps:
+                    continue
+                GEOFENCE_STATS_POINTS.inc(len(timestamps), labels=('inside',))
+                state = states.get((geofence['id'], device_id), (None, None))
+                if state[1] is not None and timestamps[0] < state[1]:
+                    GEOFENCE_STATS_POINTS.inc(
+                        sum(1 for timestamp in timestamps if timestamp < state[1]), labels=('late',)
+                    )
+                    late_geofences, since = late.get(device_id, ([], timestamps[0]))
+                    late_geofences.append(geofence)
+                    late[device_id] = (late_geofences, min(since, timestamps[0]))
+                    continue
+                per_day = {}
+                visit_start, last_seen = accumulate(state, timestamps, self.gap_ms, per_day)
+                new_states.append((geofence['id'], device_id, visit_start, last_seen))
+                days.extend(
+                    (geofence['id'], device_id, day, visits, dwell, first, last)
+                    for day, (visits, dwell, first, last) in per_day.items()
+                )
+        replaced = []
+        for device_id, (late_geofences, since) in late.items():
+            # El lote ya está incluido: se leen las filas hasta upto
+            device_days, device_states = await self._recompute(device_id, late_geofences, since, upto)
+            days.extend(device_days)
+            new_states.extend(device_states)
+            replaced.extend((geofence['id'], device_id, utc_day(since)) for geofence in late_geofences)
+        GEOFENCE_STATS_POINTS.inc(len(rows), labels=('read',))
+        applied = await self.db.apply_geofence_stats(
+            [geofence['id'] for geofence in group], after_id, upto, days, new_states, replaced
+        )
+        if not applied:
+            # Otro proceso avanzó o reinició la marca de agua: se descarta este lote
+            logger.warning("⚠️ Marca de agua de geocercas cambiada durante el lote %s-%s", after_id, upto)
+
+
+def summarize(days):
+    """Filas diarias de geofence_stats_daily -> totales por dispositivo"""
+    devices = {}
+    for row in days:
+        total = devices.get(row['device_id'])
+        if total is None:
+            total = devices[row['device_id']] = {
+                'device_id': row['device_id'], 'visits': 0, 'dwell_ms': 0,
+                'first_visit': row['first_seen'], 'last_visit': row['last_seen'],
+            }
+        total['visits'] += row['visits']
+        total['dwell_ms'] += row['dwell_ms']
+        total['first_visit'] = min(total['first_visit'], row['first_seen'])
+        total['last_visit'] = max(total['last_visit'], row['last_seen'])
+    return [
+        {
+            'device_id': total['device_id'],
+            'visits': total['visits'],
+            'total_dwell_s': round(total['dwell_ms'] / 1000, 1),
+            'avg_dwell_s': round(total['dwell_ms'] / 1000 / total['visits'], 1) if total['visits'] else 0.0,
+            'first_visit': total['first_visit'],
+            'last_visit': total['last_visit'],
+        }
+        for total in devices.values()
+    ]
@@ -0,0 +1,69 @@
+"""
+Agrupación de candidatos ICE en el relay de señalización.
+Los candidatos de un mismo emisor hacia un mismo destino se acumulan durante
+ICE_BATCH_MS y se reenvían juntos en un solo mensaje 'ice-candidates'.
+
+Variables de entorno:
+  ICE_BATCH_MS=0      ventana de agrupación en ms (0 = desactivado, reenvío inmediato)
+  ICE_BATCH_MAX=20    candidatos por mensaje; al llegar al máximo se envía sin esperar
+"""
+
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ICE_BATCH_MS = float(os.getenv('ICE_BATCH_MS', 0))
+ICE_BATCH_MAX = int(os.getenv('ICE_BATCH_MAX', 20))
+
+
+class IceBatcher:
+    """Búfer de candidatos por (emisor, destino).
+
+    ``deliver(sender, target, candidates)`` es la corrutina que los entrega.
+    """
+
+    def __init__(self, deliver, delay_ms=ICE_BATCH_MS, max_batch=ICE_BATCH_MAX):
+        self.deliver = deliver
+        self.delay = delay_ms / 1000
+        self.max_batch = max_batch
+        self.pending = {}   # (sender, target) -> [candidatos]
+        self.timers = {}    # (sender, target) -> TimerHandle
+        self._tasks = set()  # entregas por vencimiento en curso (el loop no las retiene)
+
+    async def add(self, sender, target, candidates):
+        key = (sender, target)
+        batch = self.pending.setdefault(key, [])
+        batch.extend(candidates)
+        if len(batch) >= self.max_batch:
+            await self.flush(sender, target)
+        elif key not in self.timers:
+            self.timers[key] = asyncio.get_running_loop().call_later(self.delay, self._expire, key)
+
+    def _expire(self, key):
+        self.timers.pop(key, None)
+        candidates = self.pending.pop(key, None)
+        if candidates:
+            task = asyncio.create_task(self.deliver(key[0], key[1], candidates))
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._delivered(key, done))
+
+    def _delivered(self, key, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Error reenviando candidatos ICE de %s a %s: %s", key[0], key[1], task.exception())
+
+    async def flush(self, sender, target):
+        """Entrega ya lo acumulado (p. ej. antes de reenviar un offer/answer del mismo par)"""
+        key = (sender, target)
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        candidates = self.pending.pop(key, None)
+        if candidates:
+            await self.deliver(sender, target, candidates)
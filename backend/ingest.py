@@ -0,0 +1,261 @@
+"""
+Ingesta de posiciones compartida por UDP (udp_server.py) y por lotes HTTP
+(POST /api/location/bulk): normalización, descarte de duplicados y publicación
+en el hub ('position': caché de últimas posiciones, áreas en vivo, ...).
+
+Un duplicado es una posición con el mismo (deviceId, time) que otra ya recibida.
+location_data tiene un índice único sobre esas columnas (migración 009) y las dos vías
+insertan con ON CONFLICT DO NOTHING, así que un duplicado no se guarda aunque llegue
+por UDP y por HTTP o a procesos distintos. Además cada proceso recuerda las últimas
+INGEST_DEDUP_SIZE recibidas por UDP para descartar reenvíos sin ir a la base.
+
+Formatos del lote HTTP (cuerpo opcionalmente con Content-Encoding: gzip):
+  application/x-ndjson       un JSON por línea con el formato de los datagramas UDP
+                             (lat, lon, time, acc, alt, spd, prov, deviceId)
+  application/octet-stream   binario de un dispositivo: b'PTB1', uint16 + deviceId UTF-8,
+                             uint8 + prov UTF-8 y registros little-endian de 36 bytes
+                             (lat f64, lon f64, time i64, acc f32, alt f32, spd f32; NaN = nulo)
+
+Variables de entorno:
+  INGEST_DEDUP_SIZE=100000        (deviceId, time) recordados por proceso
+  INGEST_BULK_MAX_FIXES=200000    posiciones por lote
+  INGEST_BULK_MAX_BYTES=67108864  bytes del lote ya descomprimido
+"""
+
+import math
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+import orjson
+from dotenv import load_dotenv
+
+from live import hub
+from metrics import Counter
+
+load_dotenv()
+
+INGEST_DEDUP_SIZE = int(os.getenv('INGEST_DEDUP_SIZE', 100_000))
+INGEST_BULK_MAX_FIXES = int(os.getenv('INGEST_BULK_MAX_FIXES', 200_000))
+INGEST_BULK_MAX_BYTES = int(os.getenv('INGEST_BULK_MAX_BYTES', 64 * 1024 * 1024))
+
+# Columnas de location_data en el orden de los registros de normalize_fix
+FIX_COLUMNS = ('latitude', 'longitude', 'timestamp_value', 'accuracy', 'altitude', 'speed', 'provider', 'device_id')
+
+BINARY_MAGIC = b'PTB1'
+BINARY_RECORD = struct.Struct('<ddqfff')
+# Errores de validación que se devuelven al cliente (el resto solo se cuentan)
+MAX_REPORTED_ERRORS = 20
+
+INGEST_FIXES = Counter('ingest_fixes_total', 'Posiciones recibidas por vía y resultado', ('source', 'outcome'))
+
+
+class InvalidFix(ValueError):
+    pass
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def _number(message, key, required=False):
+    value = message.get(key)
+    if value is None or value == '':
+        if required:
+            raise InvalidFix(f"Falta {key}")
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidFix(f"{key} no es numérico: {value!r}") from None
+    if not math.isfinite(number):
+        if required:
+            raise InvalidFix(f"{key} no es finito")
+        return None
+    return number
+
+
+def normalize_fix(message):
+    """Mensaje con el formato de la app -> registro en el orden de FIX_COLUMNS; InvalidFix si no sirve"""
+    if not isinstance(message, dict):
+        raise InvalidFix("Se esperaba un objeto JSON")
+    latitude = _number(message, 'lat', required=True)
+    longitude = _number(message, 'lon', required=True)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidFix(f"Coordenadas fuera de rango: {latitude}, {longitude}")
+    timestamp = _number(message, 'time', required=True)
+    if timestamp <= 0:
+        raise InvalidFix(f"time inválido: {timestamp}")
+    device_id = message.get('deviceId')
+    device_id = str(device_id).strip()[:255] if device_id is not None else ''
+    provider = message.get('prov')
+    return (
+        latitude,
+        longitude,
+        int(timestamp),
+        _number(message, 'acc'),
+        _number(message, 'alt'),
+        _number(message, 'spd'),
+        str(provider)[:50] if provider is not None else None,
+        device_id or None,
+    )
+
+
+def as_message(record):
+    """Registro normalizado -> dict que recibe Database.insert_location"""
+    latitude, longitude, timestamp, accuracy, altitude, speed, provider, device_id = record
+    return {'lat': latitude, 'lon': longitude, 'time': timestamp, 'acc': accuracy,
+            'alt': altitude, 'spd': speed, 'prov': provider, 'deviceId': device_id}
+
+
+class RecentFixes:
+    """(deviceId, time) de las últimas posiciones aceptadas, con descarte LRU"""
+
+    def __init__(self, size=INGEST_DEDUP_SIZE):
+        self.size = size
+        self.keys = OrderedDict()
+
+    def seen(self, device_id, timestamp):
+        """True si ya se aceptó; si no, la registra"""
+        key = (device_id, timestamp)
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            return True
+        self.keys[key] = None
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+        return False
+
+    def forget(self, device_id, timestamp):
+        """Para que un reintento de una posición que no se pudo guardar no cuente como repetida"""
+        self.keys.pop((device_id, timestamp), None)
+
+
+recent_fixes = RecentFixes()
+
+
+def publish_position(row):
+    """Publica una fila insertada (sin id) para la caché y los consumidores en vivo de todos los procesos"""
+    position = {key: value for key, value in row.items() if key != 'id'}
+    position['created_at'] = position['created_at'].isoformat()
+    hub.publish('position', position)
+
+
+class BatchParser:
+    """Lee un lote HTTP por trozos: descomprime, separa y normaliza sin cargarlo entero.
+
+    ``feed(chunk)`` devuelve los registros completos de ese trozo; ``finish()`` los que
+    quedan. Las posiciones inválidas se cuentan (y las primeras se describen en ``errors``).
+    """
+
+    def __init__(self, content_type, gzipped, max_fixes=INGEST_BULK_MAX_FIXES, max_bytes=INGEST_BULK_MAX_BYTES):
+        self.binary = content_type == 'application/octet-stream'
+        self.decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+        self.max_fixes = max_fixes
+        self.max_bytes = max_bytes
+        self.buffer = b''
+        self.total_bytes = 0
+        self.position = 0        # línea (NDJSON) o registro (binario) actual, para los errores
+        self.received = 0
+        self.invalid = 0
+        self.errors = []
+        self.header = None       # (deviceId, prov) del formato binario
+
+    def feed(self, chunk):
+        if self.decompressor is not None:
+            # Límite de salida por llamada: un gzip malicioso no puede inflar sin control
+            chunk = self.decompressor.decompress(chunk, self.max_bytes - self.total_bytes + 1)
+            if self.decompressor.unconsumed_tail:
+                raise BatchTooLarge(f"Lote mayor a {self.max_bytes} bytes descomprimido")
+        return self._take(chunk)
+
+    def finish(self):
+        records = []
+        if self.decompressor is not None:
+            if not self.decompressor.eof:
+                raise InvalidFix("gzip incompleto")
+            records = self._take(self.decompressor.flush())
+        if self.buffer.strip():
+            if self.binary:
+                self._reject(InvalidFix(f"{len(self.buffer)} bytes sobrantes al final"))
+            else:
+                records.extend(self._parse_line(self.buffer))
+        self.buffer = b''
+        return records
+
+    def _take(self, data):
+        self.total_bytes += len(data)
+        if self.total_bytes > self.max_bytes:
+            raise BatchTooLarge(f"Lote mayor a {self.max_bytes} bytes descomprimido")
+        self.buffer += data
+        return self._binary() if self.binary else self._lines()
+
+    def _reject(self, error):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'position': self.position, 'error': str(error)})
+
+    def _accept(self, record):
+        self.received += 1
+        if self.received > self.max_fixes:
+            raise BatchTooLarge(f"Lote con más de {self.max_fixes} posiciones")
+        return record
+
+    def _parse_line(self, line):
+        self.position += 1
+        if not line.strip():
+            return []
+        try:
+            return [self._accept(normalize_fix(orjson.loads(line)))]
+        except (orjson.JSONDecodeError, InvalidFix) as e:
+            self._reject(e)
+            return []
+
+    def _lines(self):
+        *lines, self.buffer = self.buffer.split(b'\n')
+        records = []
+        for line in lines:
+            records.extend(self._parse_line(line))
+        return records
+
+    def _binary(self):
+        if self.header is None:
+            self.header = self._binary_header()
+            if self.header is None:
+                return []
+        device_id, provider = self.header
+        usable = len(self.buffer) - len(self.buffer) % BINARY_RECORD.size
+        records = []
+        for latitude, longitude, timestamp, accuracy, altitude, speed in BINARY_RECORD.iter_unpack(self.buffer[:usable]):
+            self.position += 1
+            try:
+                records.append(self._accept(normalize_fix({
+                    'lat': latitude, 'lon': longitude, 'time': timestamp, 'acc': accuracy,
+                    'alt': altitude, 'spd': speed, 'prov': provider, 'deviceId': device_id,
+                })))
+            except InvalidFix as e:
+                self._reject(e)
+        self.buffer = self.buffer[usable:]
+        return records
+
+    def _binary_header(self):
+        if len(self.buffer) < 6:
+            return None
+        if self.buffer[:4] != BINARY_MAGIC:
+            raise InvalidFix("Formato binario desconocido (se esperaba PTB1)")
+        device_length = int.from_bytes(self.buffer[4:6], 'little')
+        provider_at = 6 + device_length
+        if len(self.buffer) < provider_at + 1:
+            return None
+        provider_length = self.buffer[provider_at]
+        end = provider_at + 1 + provider_length
+        if len(self.buffer) < end:
+            return None
+        try:
+            device_id = self.buffer[6:provider_at].decode()
+            provider = self.buffer[provider_at + 1:end].decode() or None
+        except UnicodeDecodeError:
+            raise InvalidFix("deviceId o prov no son UTF-8") from None
+        self.buffer = self.buffer[end:]
+        return device_id, provider
@@ -0,0 +1,112 @@
+"""
+Estado en vivo del proceso: bus de eventos local y caché de últimas posiciones.
+En modo de un solo proceso todo se publica aquí directamente; en modo dividido
+(run.py --split) local_channel reenvía los eventos entre ingesta, señalización y API.
+La caché mantiene además un índice de rejilla para las consultas por área (area_index.py).
+"""
+
+import logging
+from collections import defaultdict
+
+from area_index import AreaWatchers, GridIndex
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Publicación/suscripción en memoria por tema ('position', 'detection', ...)"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._sinks = []
+
+    def subscribe(self, topic, callback):
+        """Registra ``callback(payload)`` para un tema"""
+        self._subscribers[topic].append(callback)
+
+    def unsubscribe(self, topic, callback):
+        if callback in self._subscribers.get(topic, ()):
+            self._subscribers[topic].remove(callback)
+
+    def add_sink(self, sink):
+        """Registra ``sink(topic, payload)``, que recibe todo lo publicado en este proceso"""
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    def publish(self, topic, payload, forward=True):
+        """Entrega el evento a los suscriptores locales y, si ``forward``, a los sinks"""
+        for callback in self._subscribers.get(topic, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Error en suscriptor de %s", topic)
+        if forward:
+            for sink in self._sinks:
+                sink(topic, payload)
+
+
+class LatestPositions:
+    """Última posición de cada dispositivo (misma semántica que ORDER BY timestamp_value DESC, id DESC)"""
+
+    def __init__(self):
+        self.positions = {}
+        self.index = GridIndex()
+        self.primed = False
+
+    def prime(self, positions):
+        """Reemplaza el contenido con la foto de la base de datos (arranque o reconexión)"""
+        self.positions = {
+            position['device_id']: position
+            for position in positions
+            if position.get('device_id') is not None
+        }
+        self.index.clear()
+        for device_id, position in self.positions.items():
+            self._index(device_id, position)
+        self.primed = True
+
+    def update(self, position):
+        """Guarda la posición salvo que la de la caché sea más nueva; True si la guardó"""
+        device_id = position.get('device_id')
+        if device_id is None:
+            return False
+        current = self.positions.get(device_id)
+        if current is not None and current.get('timestamp_value', 0) > position.get('timestamp_value', 0):
+            return False
+        self.positions[device_id] = position
+        self._index(device_id, position)
+        return True
+
+    def _index(self, device_id, position):
+        try:
+            self.index.move(device_id, float(position['latitude']), float(position['longitude']))
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def get(self, device_id):
+        return self.positions.get(device_id)
+
+    def all(self):
+        """Posiciones ordenadas por device_id, como get_latest_location_by_devices"""
+        return [self.positions[device_id] for device_id in sorted(self.positions)]
+
+    def in_area(self, area):
+        """Posiciones dentro de un area_index.Area, ordenadas por device_id"""
+        return [self.positions[device_id] for device_id in sorted(self.index.query(area))]
+
+    def nearest(self, lat, lng, limit, radius_m=None):
+        """Posiciones de los dispositivos más cercanos al punto, con ``distance_m``"""
+        return [
+            {**self.positions[device_id], 'distance_m': round(distance, 2)}
+            for distance, device_id in self.index.nearest(lat, lng, limit, radius_m)
+        ]
+
+
+hub = EventHub()
+latest_positions = LatestPositions()
+area_watchers = AreaWatchers(latest_positions)
+hub.subscribe('position', latest_positions.update)
+hub.subscribe('position', area_watchers.on_position)
@@ -0,0 +1,140 @@
+"""
+Canal local entre procesos (socket Unix, una línea JSON por evento).
+El proceso de ingesta abre el servidor; señalización y los workers del API se
+conectan como clientes. Cada evento publicado en el EventHub de un proceso llega
+a los EventHub de todos los demás.
+"""
+
+import asyncio
+import logging
+import os
+
+import orjson
+from dotenv import load_dotenv
+
+from live import hub
+from metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PATH = os.getenv('LOCAL_CHANNEL_PATH', '/tmp/location-tracker.sock')
+# Un cliente que no lee no debe hacer crecer la memoria: por encima de este búfer se descarta
+MAX_CLIENT_BUFFER = int(os.getenv('LOCAL_CHANNEL_MAX_BUFFER', 4 * 1024 * 1024))
+
+CHANNEL_DROPPED = Counter('local_channel_dropped_total', 'Eventos descartados por clientes lentos del canal local')
+
+
+def _encode(topic, payload):
+    return orjson.dumps({'topic': topic, 'payload': payload}) + b'\n'
+
+
+def _send(writer, line):
+    """Escribe sin bloquear; descarta si el otro extremo va atrasado"""
+    if writer.transport.is_closing():
+        return
+    if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+        CHANNEL_DROPPED.inc()
+        return
+    writer.write(line)
+
+
+async def _read_events(reader, on_event):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        try:
+            message = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            logger.warning("Mensaje inválido en el canal local")
+            continue
+        on_event(message['topic'], message['payload'], line)
+
+
+class ChannelServer:
+    """Servidor del canal local; reenvía cada evento a todos los clientes salvo al emisor"""
+
+    def __init__(self, path=CHANNEL_PATH):
+        self.path = path
+        self.server = None
+        self.clients = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle_client, path=self.path)
+        hub.add_sink(self._forward)
+        logger.info("Canal local escuchando en %s", self.path)
+
+    def _forward(self, topic, payload, exclude=None, line=None):
+        line = line or _encode(topic, payload)
+        for writer in self.clients:
+            if writer is not exclude:
+                _send(writer, line)
+
+    async def _handle_client(self, reader, writer):
+        self.clients.add(writer)
+        try:
+            def on_event(topic, payload, line):
+                hub.publish(topic, payload, forward=False)
+                self._forward(topic, payload, exclude=writer, line=line)
+
+            await _read_events(reader, on_event)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def stop(self):
+        hub.remove_sink(self._forward)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ChannelClient:
+    """Cliente del canal local; se reconecta solo si el servidor se reinicia"""
+
+    def __init__(self, path=CHANNEL_PATH, on_connect=None):
+        self.path = path
+        self.on_connect = on_connect  # corrutina opcional tras cada (re)conexión
+        self.writer = None
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        hub.add_sink(self._send)
+
+    def _send(self, topic, payload):
+        if self.writer is not None:
+            _send(self.writer, _encode(topic, payload))
+
+    async def _run(self):
+        delay = 0.1
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+                logger.info("Conectado al canal local %s", self.path)
+                delay = 0.1
+                if self.on_connect:
+                    await self.on_connect()
+                await _read_events(reader, lambda topic, payload, line: hub.publish(topic, payload, forward=False))
+            except (ConnectionError, FileNotFoundError, asyncio.IncompleteReadError):
+                pass
+            self.writer = None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    async def stop(self):
+        hub.remove_sink(self._send)
+        if self._task:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
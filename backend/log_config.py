@@ -0,0 +1,139 @@
+"""
+Logging asíncrono y estructurado.
+Los handlers solo encolan el LogRecord; un hilo (QueueListener) lo formatea como JSON
+y escribe en stdout, así el event loop nunca se bloquea escribiendo en la tubería de PM2.
+
+Variables de entorno:
+  LOG_LEVEL=INFO                               nivel por defecto
+  LOG_LEVELS=udp.ingest=DEBUG,socketio=INFO    nivel por categoría (logger)
+  LOG_FORMAT=json|text
+  LOG_HOT_PATH_RATE=20                         mensajes/s por categoría del camino caliente
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_LEVELS = {
+    'socketio': 'WARNING',
+    'engineio': 'WARNING',
+}
+
+# Atributos estándar de LogRecord; el resto (extra=...) se incluye como campos
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Una línea JSON por registro con los campos de ``extra``"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class HotPathLogger(logging.LoggerAdapter):
+    """Logger del camino caliente con token bucket: ``rate`` mensajes/s (ráfagas de ``burst``).
+
+    Descarta en isEnabledFor, antes de crear el LogRecord, así un mensaje suprimido
+    cuesta casi lo mismo que uno de un nivel deshabilitado. Los descartados se cuentan
+    y el siguiente que pasa lleva ``suppressed``. WARNING o superior nunca se descarta.
+    """
+
+    def __init__(self, logger, rate, burst=None):
+        super().__init__(logger, {})
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.suppressed = 0
+
+    def isEnabledFor(self, level):
+        if not self.logger.isEnabledFor(level):
+            return False
+        if level >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self.suppressed += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def process(self, msg, kwargs):
+        if self.suppressed:
+            kwargs['extra'] = {**kwargs.get('extra', {}), 'suppressed': self.suppressed}
+            self.suppressed = 0
+        return msg, kwargs
+
+
+def hot_path_logger(name):
+    """Logger limitado por tasa (LOG_HOT_PATH_RATE mensajes/s) para eventos por mensaje"""
+    return HotPathLogger(logging.getLogger(name), float(os.getenv('LOG_HOT_PATH_RATE', 20)))
+
+
+class EnqueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el hilo del llamador; lo hace el listener"""
+
+    def prepare(self, record):
+        return record
+
+
+def _parse_levels(value):
+    levels = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Configura el logging del proceso (idempotente)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json') == 'json':
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(EnqueueHandler(log_queue))
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    levels = {**DEFAULT_LEVELS, **_parse_levels(os.getenv('LOG_LEVELS', ''))}
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
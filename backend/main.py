@@ -1,30 +1,109 @@
 import asyncio
 import os
 import json
-from datetime import datetime
+import time
+import zlib
+from datetime import date, datetime, timezone
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import List, Optional
 
 
+from area_index import AREA_HEARTBEAT_S, Area, distance_m
 from database import Database
+from geofence_stats import GEOFENCE_STATS_INTERVAL_S, GeofenceStatsUpdater, summarize
+from ingest import INGEST_FIXES, BatchParser, BatchTooLarge, InvalidFix, publish_position
+from detection_history import (
+    DETECTION_HISTORY, DETECTION_MAX_BUCKETS, DetectionWriter, parse_resolution, series_source
+)
+from serializers import RecordsResponse, dumps
+from trip_analytics import ANALYTICS_MAX_POINTS, analyze
+from replay import REPLAY_MAX_DEVICES, REPLAY_MAX_SPEED, ReplaySession
+from tiles import (
+    TILE_DWELL_MAX_GAP_S, TILE_GRID, TILE_REQUESTS, tile_bounds, tile_cache, tile_key, validate_tile
+)
+from live import area_watchers, latest_positions
+from local_channel import ChannelClient
+from log_config import setup_logging
+from profiling import PROFILING_ENABLED, ServerTimingMiddleware, capture_cpu_profile, phase
+import metrics
 from udp_server import start_udp_server, stop_udp_server
 from webrtc_server import start_webrtc_server
 from models import (
-    LocationData, LocationResponse, AllLocationsResponse, 
-    HealthResponse, ErrorResponse, InternalErrorResponse,
-    GeofenceCreate, GeofenceResponse, GeofenceJourney, GeofenceWithJourneys
+    LocationData, LocationResponse, AllLocationsResponse, NearestLocationResponse,
+    HealthResponse, ErrorResponse, InternalErrorResponse, DetectionBucketResponse,
+    GeofenceCreate, GeofenceResponse, GeofenceJourney, GeofenceWithJourneys, GeofenceStatsResponse
 )
 
 # Cargar variables de entorno
 load_dotenv()
+setup_logging()
 
 # Inicializar base de datos
 db = Database()
 
+HTTP_REQUESTS = metrics.Counter('http_requests_total', 'Peticiones HTTP por ruta', ('method', 'route', 'status'))
+HTTP_REQUEST_SECONDS = metrics.Histogram('http_request_duration_seconds', 'Latencia HTTP por ruta', ('method', 'route'))
+
+
+def _pool_metric(field):
+    """Lee un campo de db.get_pool_stats() para cada pool al exportar"""
+    def collect():
+        stats = db.get_pool_stats()
+        return {(lane,): stats[lane][field] for lane in ('read', 'ingest', 'replica')}
+    return collect
+
+
+def _replica_lag():
+    return {
+        (replica['replica'],): replica['lag_ms'] / 1000
+        for replica in db.get_pool_stats()['replicas']
+        if replica['lag_ms'] is not None
+    }
+
+
+metrics.Gauge('db_pool_connections', 'Conexiones abiertas por pool', ('pool',), callback=_pool_metric('size'))
+metrics.Gauge('db_pool_connections_in_use', 'Conexiones en uso por pool', ('pool',), callback=_pool_metric('in_use'))
+metrics.Counter('db_pool_acquires_total', 'Conexiones adquiridas por pool', ('pool',), callback=_pool_metric('acquires'))
+metrics.Counter('db_pool_acquire_timeouts_total', 'Timeouts al adquirir conexión', ('pool',), callback=_pool_metric('acquire_timeouts'))
+metrics.Counter('db_pool_acquire_wait_seconds_total', 'Tiempo total esperando conexión', ('pool',),
+                callback=lambda: {labels: value / 1000 for labels, value in _pool_metric('wait_total_ms')().items()})
+metrics.Gauge('db_replica_lag_seconds', 'Retraso de replicación medido por réplica', ('replica',), callback=_replica_lag)
+
+
+class HTTPMetricsMiddleware:
+    """Middleware ASGI que mide latencia y conteo de peticiones por plantilla de ruta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # La plantilla (/api/geofences/{geofence_id}) mantiene acotado el número de series
+            route = scope.get('route')
+            labels = (scope['method'], route.path if route else 'unmatched')
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, labels=labels)
+            HTTP_REQUESTS.inc(labels=labels + (str(status),))
+
 # Modelo para el request de guardar geocerca
 class GeofenceSaveRequest(BaseModel):
     """Request para guardar geocerca con journeys"""
@@ -51,20 +130,54 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(HTTPMetricsMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
 
 # Variables globales para el servidor UDP
 udp_transport = None
 udp_protocol = None
 webrtc_runner = None
+channel_client = None
+detection_writer = None
+geofence_stats_updater = None
+
+# Con run.py --split la ingesta UDP y WebRTC corren en sus propios procesos y este
+# proceso solo sirve el API (puede haber varios workers)
+EMBEDDED_SERVICES = os.getenv('EMBEDDED_SERVICES', '1') == '1'
+NEAREST_MAX_LIMIT = int(os.getenv('NEAREST_MAX_LIMIT', 500))
+
+
+async def prime_latest_positions():
+    """Carga la caché de últimas posiciones desde la base de datos"""
+    latest_positions.prime(await db.get_latest_location_by_devices())
+    area_watchers.resync()
 
 @app.on_event("startup")
 async def startup_event():
     """Eventos al iniciar la aplicación"""
-    global udp_transport, udp_protocol, webrtc_runner
+    global udp_transport, udp_protocol, webrtc_runner, channel_client, detection_writer, geofence_stats_updater
 
     try:
         await db.init_connection_pool()
+        if not EMBEDDED_SERVICES:
+            # Las posiciones nuevas llegan por el canal local desde el proceso de ingesta;
+            # la caché se carga al (re)conectar, antes de leer eventos, por si se perdió alguno.
+            # Mientras no haya canal las consultas van a la base de datos.
+            channel_client = ChannelClient(on_connect=prime_latest_positions)
+            await channel_client.start()
+            print(f"HTTP API (worker {os.getpid()}) escuchando en puerto {os.getenv('HTTP_PORT', 3001)}")
+            return
+
         await db.create_table()
+        await prime_latest_positions()
+        if DETECTION_HISTORY:
+            await db.create_detection_tables()
+            detection_writer = DetectionWriter(db)
+            await detection_writer.start()
+        if GEOFENCE_STATS_INTERVAL_S > 0:
+            geofence_stats_updater = GeofenceStatsUpdater(db)
+            await geofence_stats_updater.start()
         udp_transport, udp_protocol = await start_udp_server(db)  # ✅ Pasa db aquí
         
         # 🔧 CAMBIO: Puerto correcto 8081
@@ -84,10 +197,16 @@ async def startup_event():
 async def shutdown_event():
     """Eventos al cerrar la aplicación"""
     global udp_transport, webrtc_runner
+    if channel_client:
+        await channel_client.stop()
     if udp_transport:
         await stop_udp_server(udp_transport)
     if webrtc_runner:
         await webrtc_runner.cleanup()
+    if detection_writer:
+        await detection_writer.stop()
+    if geofence_stats_updater:
+        await geofence_stats_updater.stop()
     await db.close_connection_pool()
 
 @app.get("/api/location/latest", response_model=LocationResponse)
@@ -97,7 +216,7 @@ async def get_latest_location(device_id: str = Query(None, description="ID del d
         result = await db.get_latest_location(device_id=device_id)
         if not result:
             raise HTTPException(status_code=404, detail="No hay datos disponibles")
-        return LocationResponse(**result)
+        return RecordsResponse(result)
     except HTTPException:
         raise
     except Exception as e:
@@ -108,16 +227,123 @@ async def get_latest_location(device_id: str = Query(None, description="ID del d
 async def get_latest_by_devices():
     """Endpoint para obtener la última ubicación de CADA dispositivo"""
     try:
-        results = await db.get_latest_location_by_devices()
+        # La caché se mantiene con cada inserción; la base de datos solo si aún no está cargada
+        if latest_positions.primed:
+            results = latest_positions.all()
+        else:
+            results = await db.get_latest_location_by_devices()
         if not results:
             raise HTTPException(status_code=404, detail="No hay datos disponibles")
-        return [LocationResponse(**result) for result in results]
+        return RecordsResponse(results)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error obteniendo últimas ubicaciones por dispositivo: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
+def _parse_area(bbox, polygon):
+    try:
+        return Area.parse(bbox, polygon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/live/devices-in-area", response_model=list[LocationResponse])
+async def get_devices_in_area(
+    bbox: str = Query(None, description="minLat,minLng,maxLat,maxLng"),
+    polygon: str = Query(None, description="Vértices lat,lng separados por ';'")
+):
+    """Última ubicación de los dispositivos que están ahora dentro del rectángulo o polígono"""
+    area = _parse_area(bbox, polygon)
+    try:
+        # El índice de rejilla solo recorre las celdas del área; sin caché se filtra la foto de la base de datos
+        if latest_positions.primed:
+            results = latest_positions.in_area(area)
+        else:
+            results = [
+                position for position in await db.get_latest_location_by_devices()
+                if area.contains(position['latitude'], position['longitude'])
+            ]
+        return RecordsResponse(results)
+    except Exception as e:
+        print(f"Error obteniendo dispositivos en el área: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+@app.get("/api/location/nearest", response_model=list[NearestLocationResponse])
+async def get_nearest_devices(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    limit: int = Query(default=10, ge=1, le=NEAREST_MAX_LIMIT),
+    radius_m: float = Query(None, gt=0, description="Distancia máxima en metros (opcional)"),
+    minutes: float = Query(None, gt=0, description="Ventana histórica: últimos N minutos"),
+    startDate: datetime = Query(None, description="Ventana histórica: inicio en ISO 8601"),
+    endDate: datetime = Query(None, description="Ventana histórica: fin en ISO 8601 (por defecto ahora)")
+):
+    """Los dispositivos más cercanos a un punto, del más cercano al más lejano, con distance_m.
+
+    Sin ventana se usa la última posición de cada dispositivo (índice en memoria); con
+    minutes o startDate, la posición más cercana de cada dispositivo en esa ventana (KNN en PostGIS).
+    """
+    try:
+        if minutes is None and startDate is None:
+            if latest_positions.primed:
+                return RecordsResponse(latest_positions.nearest(lat, lng, limit, radius_m))
+            results = []
+            for position in await db.get_latest_location_by_devices():
+                distance = distance_m(lat, lng, position['latitude'], position['longitude'])
+                if radius_m is None or distance <= radius_m:
+                    results.append({**position, 'distance_m': round(distance, 2)})
+            results.sort(key=lambda row: row['distance_m'])
+            return RecordsResponse(results[:limit])
+
+        end_time = int((endDate.timestamp() if endDate else time.time()) * 1000)
+        start_time = end_time - int(minutes * 60000) if minutes is not None else int(startDate.timestamp() * 1000)
+        if end_time <= start_time:
+            raise HTTPException(status_code=400, detail="endDate debe ser posterior a startDate")
+        results = await db.get_nearest_locations(lat, lng, start_time, end_time, limit, radius_m)
+        return RecordsResponse(results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error obteniendo dispositivos cercanos: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+
+async def _area_events(watch):
+    """Stream SSE de una suscripción: 'snapshot' al abrir y luego 'enter', 'move' y 'leave'"""
+    try:
+        yield b'event: snapshot\ndata: ' + dumps(area_watchers.snapshot(watch)) + b'\n\n'
+        while True:
+            try:
+                event, payload = await asyncio.wait_for(watch.queue.get(), AREA_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+                continue
+            if event == 'snapshot':
+                payload = area_watchers.snapshot(watch)
+            yield b'event: ' + event.encode() + b'\ndata: ' + dumps(payload) + b'\n\n'
+    finally:
+        area_watchers.remove(watch)
+
+
+@app.get("/api/live/devices-in-area/stream")
+async def stream_devices_in_area(
+    bbox: str = Query(None, description="minLat,minLng,maxLat,maxLng"),
+    polygon: str = Query(None, description="Vértices lat,lng separados por ';'")
+):
+    """Server-Sent Events con los dispositivos que entran, se mueven o salen del área"""
+    area = _parse_area(bbox, polygon)
+    try:
+        watch = area_watchers.add(area)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StreamingResponse(
+        _area_events(watch),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/location/all", response_model=list[AllLocationsResponse])
 async def get_all_locations(
     limit: int = Query(default=100, ge=1, le=1000),
@@ -126,7 +352,7 @@ async def get_all_locations(
     """Endpoint para obtener todos los registros, opcionalmente filtrados por device_id"""
     try:
         results = await db.get_all_locations(limit, device_id=device_id)
-        return [AllLocationsResponse(**result) for result in results]
+        return RecordsResponse(results)
     except Exception as e:
         print(f"Error obteniendo registros: {e}")
         raise HTTPException(status_code=500, detail="Error interno del servidor")
@@ -143,7 +369,7 @@ async def get_location_range(
         end_time = int(endDate.timestamp() * 1000)
 
         results = await db.get_locations_by_range(start_time, end_time, device_id=device_id)
-        return [LocationResponse(**result) for result in results]
+        return RecordsResponse(results)
 
     except Exception as e:
         print(f"Error obteniendo registros por rango: {e}")
@@ -152,6 +378,54 @@ async def get_location_range(
             detail="Error interno del servidor"
         )
 
+BULK_CONTENT_TYPES = ('application/x-ndjson', 'application/octet-stream')
+
+@app.post("/api/location/bulk")
+async def bulk_ingest(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="Clave del lote; un reintento con la misma clave no duplica filas"),
+):
+    """Carga un lote de posiciones guardadas sin conexión (NDJSON o binario, opcionalmente gzip).
+
+    El cuerpo se descomprime y valida por trozos a medida que llega; las posiciones válidas
+    se guardan con COPY en una sola transacción, sin repetidas, y la última de cada
+    dispositivo se publica igual que las que llegan por UDP. Formatos en ingest.py.
+    """
+    content_type = request.headers.get('content-type', 'application/x-ndjson').split(';')[0].strip().lower()
+    if content_type not in BULK_CONTENT_TYPES:
+        raise HTTPException(status_code=415, detail=f"Content-Type debe ser uno de {', '.join(BULK_CONTENT_TYPES)}")
+    encoding = request.headers.get('content-encoding', 'identity').strip().lower()
+    if encoding not in ('identity', 'gzip'):
+        raise HTTPException(status_code=415, detail="Content-Encoding debe ser gzip o identity")
+
+    parser = BatchParser(content_type, gzipped=encoding == 'gzip')
+    records = []
+    try:
+        with phase('parse'):
+            async for chunk in request.stream():
+                records.extend(parser.feed(chunk))
+            records.extend(parser.finish())
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (InvalidFix, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=f"Lote ilegible: {e}")
+    INGEST_FIXES.inc(parser.invalid, labels=('bulk', 'invalid'))
+
+    try:
+        replayed, result, latest = await db.bulk_insert_locations(records, idempotency_key)
+    except Exception as e:
+        print(f"Error cargando lote de posiciones: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+    if not replayed:
+        INGEST_FIXES.inc(result['inserted'], labels=('bulk', 'inserted'))
+        INGEST_FIXES.inc(result['duplicates'], labels=('bulk', 'duplicate'))
+        for row in latest:
+            publish_position(row)
+    return RecordsResponse(
+        {**result, 'invalid': parser.invalid, 'errors': parser.errors},
+        headers={'Idempotent-Replayed': 'true'} if replayed else None,
+    )
+
 @app.get("/api/devices", response_model=list[str])
 async def get_devices():
     """Endpoint para obtener todos los device_id únicos"""
@@ -163,6 +437,245 @@ async def get_devices():
         raise HTTPException(status_code=500, detail="Error interno del servidor")
 
 
+@app.get("/api/detections/series", response_model=list[DetectionBucketResponse])
+async def get_detection_series(
+    startDate: datetime = Query(..., description="Fecha de inicio en formato ISO 8601"),
+    endDate: datetime = Query(..., description="Fecha de fin en formato ISO 8601"),
+    resolution: str = Query(default="5m", description="Tamaño del intervalo: 30s, 5m, 1h, 1d, ..."),
+    device_id: Optional[List[str]] = Query(None, description="Dispositivos (opcional, se puede repetir)")
+):
+    """Conteo de personas por dispositivo en intervalos de la resolución pedida.
+
+    Resoluciones en horas salen del rollup por hora, en minutos del rollup por minuto y
+    las de segundos de las detecciones individuales.
+    """
+    try:
+        seconds = parse_resolution(resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start, end = (value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (startDate, endDate))
+    if end <= start:
+        raise HTTPException(status_code=400, detail="endDate debe ser posterior a startDate")
+    # Intervalos alineados a la resolución
+    start = datetime.fromtimestamp(start.timestamp() - start.timestamp() % seconds, tz=timezone.utc)
+    if (end - start).total_seconds() / seconds > DETECTION_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Demasiados intervalos; máximo {DETECTION_MAX_BUCKETS} por dispositivo"
+        )
+    try:
+        results = await db.get_detection_series(start, end, seconds, series_source(seconds), device_id)
+        return RecordsResponse(results)
+    except Exception as e:
+        print(f"Error obteniendo serie de detecciones: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@app.get("/api/analytics/trips")
+async def get_trip_analytics(
+    device_id: str = Query(..., description="ID del dispositivo"),
+    startDate: datetime = Query(..., description="Fecha de inicio en formato ISO 8601"),
+    endDate: datetime = Query(..., description="Fecha de fin en formato ISO 8601"),
+    tz_offset_minutes: int = Query(default=0, ge=-840, le=840, description="Desfase de la hora local para agrupar por día")
+):
+    """Distancia, tiempo en movimiento, paradas, trips y perfil de velocidades de un dispositivo.
+
+    Resumen del rango, desglose por día y listas de paradas y trips (ver trip_analytics.py).
+    """
+    start_time = int(startDate.timestamp() * 1000)
+    end_time = int(endDate.timestamp() * 1000)
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="endDate debe ser posterior a startDate")
+    try:
+        timestamps, latitudes, longitudes = await db.get_track_columns(
+            device_id, start_time, end_time, ANALYTICS_MAX_POINTS + 1
+        )
+        if len(timestamps) > ANALYTICS_MAX_POINTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Demasiados puntos en el rango; máximo {ANALYTICS_MAX_POINTS}"
+            )
+        # Cálculo en un hilo: NumPy libera el GIL y el event loop sigue atendiendo
+        with phase('analytics'):
+            result = await asyncio.to_thread(analyze, timestamps, latitudes, longitudes, tz_offset_minutes)
+        return RecordsResponse({'device_id': device_id, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error calculando analítica de recorridos: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+def _replay_session(device_id, startDate, endDate, speed):
+    if not device_id or len(device_id) > REPLAY_MAX_DEVICES:
+        raise HTTPException(status_code=400, detail=f"Se requieren entre 1 y {REPLAY_MAX_DEVICES} device_id")
+    if not 0 < speed <= REPLAY_MAX_SPEED:
+        raise HTTPException(status_code=400, detail=f"speed debe estar entre 0 y {REPLAY_MAX_SPEED:g}")
+    start_time = int(startDate.timestamp() * 1000)
+    end_time = int(endDate.timestamp() * 1000)
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="endDate debe ser posterior a startDate")
+    return ReplaySession(db, list(dict.fromkeys(device_id)), start_time, end_time, speed)
+
+
+def _replay_control(session, message):
+    """Mensajes del cliente: seek (time en ms), speed (value), pause y resume"""
+    action = message.get('action')
+    if action == 'seek':
+        session.seek(float(message['time']))
+    elif action == 'speed':
+        speed = float(message['value'])
+        if not 0 < speed <= REPLAY_MAX_SPEED:
+            raise ValueError(f"speed debe estar entre 0 y {REPLAY_MAX_SPEED:g}")
+        session.set_speed(speed)
+    elif action == 'pause':
+        session.pause()
+    elif action == 'resume':
+        session.resume()
+    else:
+        raise ValueError(f"Acción desconocida: {action!r}")
+
+
+@app.websocket("/api/replay/ws")
+async def replay_websocket(
+    websocket: WebSocket,
+    device_id: List[str] = Query(...),
+    startDate: datetime = Query(...),
+    endDate: datetime = Query(...),
+    speed: float = Query(default=1.0)
+):
+    """Reproducción de varios dispositivos en orden de tiempo, controlable por mensajes.
+
+    Servidor -> cliente: {"type": "fixes", "time", "fixes": [...]}, {"type": "clock", "time", "paused"}
+    y {"type": "end", "time"}. Cliente -> servidor: {"action": "seek", "time": ms},
+    {"action": "speed", "value": x}, {"action": "pause"} y {"action": "resume"}.
+    """
+    try:
+        session = _replay_session(device_id, startDate, endDate, speed)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    await websocket.accept()
+
+    async def send(kind, data):
+        await websocket.send_text(dumps({'type': kind, **data}).decode())
+
+    async def play():
+        try:
+            await session.run(send)
+        except Exception as e:
+            print(f"Error en la reproducción: {e}")
+            await websocket.close(code=1011)
+
+    player = asyncio.create_task(play())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            try:
+                _replay_control(session, message)
+            except (KeyError, TypeError, ValueError) as e:
+                await send('error', {'detail': str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        player.cancel()
+
+
+@app.get("/api/replay/stream")
+async def replay_stream(
+    device_id: List[str] = Query(..., description="Dispositivos (se puede repetir)"),
+    startDate: datetime = Query(..., description="Inicio de la ventana en ISO 8601"),
+    endDate: datetime = Query(..., description="Fin de la ventana en ISO 8601"),
+    speed: float = Query(default=1.0, description="Multiplicador de velocidad"),
+    position: int = Query(None, alias="from", description="Instante (ms) desde el que reproducir; seek reconectando")
+):
+    """Misma reproducción que /api/replay/ws como Server-Sent Events, sin mensajes de control"""
+    session = _replay_session(device_id, startDate, endDate, speed)
+    if position is not None:
+        session.seek(position)
+    events = asyncio.Queue(maxsize=1)
+
+    async def send(kind, data):
+        await events.put(b'event: ' + kind.encode() + b'\ndata: ' + dumps(data) + b'\n\n')
+
+    async def stream():
+        player = asyncio.create_task(session.run(send))
+        try:
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({getter, player}, return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    player.result()   # error de la reproducción: cierra el stream
+                yield getter.result()
+        finally:
+            player.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/tiles/{z}/{x}/{y}")
+async def get_density_tile(
+    z: int,
+    x: int,
+    y: int,
+    startDate: datetime = Query(..., description="Fecha de inicio en formato ISO 8601"),
+    endDate: datetime = Query(..., description="Fecha de fin en formato ISO 8601"),
+    metric: str = Query(default="count", description="count (puntos) o dwell (segundos de permanencia)"),
+    grid: int = Query(default=TILE_GRID, description="Celdas por lado del tile"),
+    device_id: Optional[List[str]] = Query(None, description="Dispositivos (opcional, se puede repetir)"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Tile de densidad z/x/y: valor por celda de una rejilla grid x grid sobre el tile.
+
+    Devuelve {z, x, y, grid, metric, max, cells: [[fila, columna, valor], ...]} con solo
+    las celdas con datos (fila 0 = norte). Los tiles se guardan en disco por tile,
+    filtro y marca de agua de sus días y celdas, que también es el ETag (304 si no cambió).
+    """
+    try:
+        validate_tile(z, x, y, grid, metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start_time = int(startDate.timestamp() * 1000)
+    end_time = int(endDate.timestamp() * 1000)
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="endDate debe ser posterior a startDate")
+    try:
+        bounds = tile_bounds(z, x, y)
+        watermark = await db.get_tile_watermark(bounds, start_time, end_time)
+        key = tile_key(z, x, y, grid, metric, start_time, end_time, device_id, watermark)
+        # El navegador revalida siempre: la marca de agua cambia si llegan filas tarde al rango
+        headers = {"Cache-Control": "no-cache", "ETag": f'"{key}"'}
+        if if_none_match == headers["ETag"]:
+            TILE_REQUESTS.inc(labels=('not_modified',))
+            return Response(status_code=304, headers=headers)
+
+        content = await tile_cache.get(key)
+        if content is not None:
+            TILE_REQUESTS.inc(labels=('cache',))
+            return Response(content, media_type="application/json", headers={**headers, "X-Tile-Cache": "hit"})
+
+        watermark, cells = await db.get_tile_cells(
+            z, x, y, grid, metric, bounds, start_time, end_time, device_id,
+            max_gap_ms=int(TILE_DWELL_MAX_GAP_S * 1000)
+        )
+        # Se guarda con la marca de agua de la instantánea que leyó las celdas
+        key = tile_key(z, x, y, grid, metric, start_time, end_time, device_id, watermark)
+        headers["ETag"] = f'"{key}"'
+        with phase('serialize'):
+            content = dumps({
+                'z': z, 'x': x, 'y': y, 'grid': grid, 'metric': metric,
+                'max': max((cell['value'] for cell in cells), default=0),
+                'cells': [[cell['row'], cell['col'], cell['value']] for cell in cells],
+            })
+        await tile_cache.put(key, content)
+        TILE_REQUESTS.inc(labels=('computed',))
+        return Response(content, media_type="application/json", headers={**headers, "X-Tile-Cache": "miss"})
+    except Exception as e:
+        print(f"Error generando tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
 @app.post("/api/location/area-records")
 async def get_area_records(request: AreaSearchRequest):
     """Endpoint para obtener recorridos de un dispositivo dentro de un polígono"""
@@ -172,41 +685,42 @@ async def get_area_records(request: AreaSearchRequest):
         if not results:
             return []
         
-        # Separar en recorridos basados en diferencia de tiempo de 5 minutos
-        journeys = []
-        current_journey = []
+        with phase('journeys'):
+            # Separar en recorridos basados en diferencia de tiempo de 5 minutos
+            journeys = []
+            current_journey = []
         
-        for i, point in enumerate(results):
-            if i == 0:
-                current_journey.append(point)
-            else:
-                prev_time = results[i-1]['timestamp_value']
-                curr_time = point['timestamp_value']
-                time_diff = curr_time - prev_time
-                
-                # Si la diferencia es mayor a 5 minutos (300000 ms), es un nuevo recorrido
-                if time_diff > 300000:
-                    if current_journey:
-                        journeys.append(current_journey)
-                    current_journey = [point]
-                else:
+            for i, point in enumerate(results):
+                if i == 0:
                     current_journey.append(point)
+                else:
+                    prev_time = results[i-1]['timestamp_value']
+                    curr_time = point['timestamp_value']
+                    time_diff = curr_time - prev_time
+                
+                    # Si la diferencia es mayor a 5 minutos (300000 ms), es un nuevo recorrido
+                    if time_diff > 300000:
+                        if current_journey:
+                            journeys.append(current_journey)
+                        current_journey = [point]
+                    else:
+                        current_journey.append(point)
         
-        # Agregar el último recorrido
-        if current_journey:
-            journeys.append(current_journey)
+            # Agregar el último recorrido
+            if current_journey:
+                journeys.append(current_journey)
         
-        # Formatear respuesta
-        formatted_journeys = []
-        for idx, journey in enumerate(journeys):
-            formatted_journeys.append({
-                'journey_id': idx,
-                'points': journey,
-                'start_time': journey[0]['timestamp_value'],
-                'end_time': journey[-1]['timestamp_value']
-            })
+            # Formatear respuesta
+            formatted_journeys = []
+            for idx, journey in enumerate(journeys):
+                formatted_journeys.append({
+                    'journey_id': idx,
+                    'points': journey,
+                    'start_time': journey[0]['timestamp_value'],
+                    'end_time': journey[-1]['timestamp_value']
+                })
         
-        return formatted_journeys
+        return RecordsResponse(formatted_journeys)
     
     except Exception as e:
         print(f"Error obteniendo recorridos por área: {e}")
@@ -314,6 +828,42 @@ async def delete_geofence(geofence_id: int):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Error eliminando geocerca")
 
+@app.get("/api/geofences/{geofence_id}/stats", response_model=GeofenceStatsResponse)
+async def get_geofence_stats(
+    geofence_id: int,
+    startDate: Optional[date] = Query(None, description="Primer día (UTC) incluido"),
+    endDate: Optional[date] = Query(None, description="Último día (UTC) incluido"),
+    device_id: Optional[str] = Query(None, description="ID del dispositivo (opcional)"),
+    by_day: bool = Query(False, description="Incluir el detalle por día")
+):
+    """Visitas, permanencia total y media y primera/última visita por dispositivo.
+
+    Sale de la tabla de estadísticas que mantiene geofence_stats.py; no lee el historial.
+    """
+    try:
+        stats = await db.get_geofence_stats(geofence_id, startDate, endDate, device_id)
+    except Exception as e:
+        print(f"Error obteniendo estadísticas de geocerca: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Geocerca no encontrada")
+    return RecordsResponse({
+        'geofence_id': geofence_id,
+        'updated_through_id': stats['last_id'],
+        'devices': summarize(stats['days']),
+        'days': stats['days'] if by_day else None,
+    })
+
+@app.post("/api/geofences/{geofence_id}/stats/backfill", status_code=202)
+async def backfill_geofence_stats(geofence_id: int):
+    """Borra las estadísticas de una geocerca; el proceso de ingesta las recalcula por lotes"""
+    try:
+        await db.reset_geofence_stats(geofence_id)
+    except Exception as e:
+        print(f"Error reiniciando estadísticas de geocerca: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+    return {"message": "Estadísticas reiniciadas; se recalculan en segundo plano"}
+
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """Endpoint de health check """
@@ -322,6 +872,37 @@ async def health_check():
         timestamp=datetime.now().isoformat()
     )
 
+@app.get("/api/health/db")
+async def db_pool_health():
+    """Estado de los pools de conexiones: en uso, espera al adquirir y timeouts"""
+    return db.get_pool_stats()
+
+@app.get("/api/debug/slow-queries", include_in_schema=False)
+async def get_slow_queries():
+    """Consultas lentas muestreadas por la capa Database (requiere PROFILING_ENABLED=1)"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Perfilado deshabilitado")
+    return db.get_slow_queries()
+
+@app.get("/api/debug/profile", response_class=PlainTextResponse, include_in_schema=False)
+async def cpu_profile(
+    seconds: float = Query(default=5, gt=0, le=60, description="Duración del perfil en segundos"),
+    sort: str = Query(default="cumulative", pattern="^(cumulative|tottime|calls|ncalls)$"),
+    limit: int = Query(default=50, ge=1, le=500)
+):
+    """Captura un perfil de CPU del proceso durante unos segundos (requiere PROFILING_ENABLED=1)"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Perfilado deshabilitado")
+    try:
+        return await capture_cpu_profile(seconds, sort=sort, limit=limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Métricas de ingesta, base de datos, HTTP y WebRTC en formato Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Iniciar servidor (debe estar al FINAL)
 if __name__ == "__main__":
     import uvicorn
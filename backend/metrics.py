@@ -0,0 +1,131 @@
+"""
+Métricas en formato de texto de Prometheus.
+Contadores, gauges e histogramas mínimos pensados para el camino caliente: todo corre
+en el event loop, así que cada observación es una suma sobre un dict sin locks.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+
+# Buckets por defecto en segundos (1 ms .. 10 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = list(zip(labelnames, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="{_escape(value)}"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class _SimpleMetric(_Metric):
+    """Métrica de un valor por serie; con ``callback`` se calcula al exportar ({labels: valor})"""
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.values = defaultdict(float)
+        self.callback = callback
+
+    def render(self):
+        lines = self._header()
+        values = self.values
+        if self.callback:
+            try:
+                values = self.callback()
+            except Exception:
+                values = {}
+        for labels, value in values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_SimpleMetric):
+    """Contador monótono; ``labels`` es una tupla en el orden de ``labelnames``"""
+    kind = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] += amount
+
+
+class Gauge(_SimpleMetric):
+    """Valor instantáneo que puede subir y bajar"""
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def inc(self, amount=1, labels=()):
+        self.values[labels] += amount
+
+    def dec(self, amount=1, labels=()):
+        self.values[labels] -= amount
+
+
+class Histogram(_Metric):
+    """Histograma con buckets fijos; guarda conteos por bucket y acumula al exportar"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [conteos por bucket (+Inf al final), suma, total]
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = self._header()
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.labelnames, labels, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{label_text} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+def render():
+    """Exporta todas las métricas registradas en formato de texto de Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,90 @@
+-- Migración en línea de las columnas numéricas de location_data a DOUBLE PRECISION
+-- Se ejecuta con psql en autocommit (NO envolver en una transacción):
+--   psql "$DATABASE_URL" -f migrations/003_location_data_double_precision.sql
+-- Ningún paso reescribe la tabla completa ni mantiene bloqueos largos:
+-- las columnas nuevas se rellenan por lotes y el intercambio final solo toca el catálogo.
+
+SET lock_timeout = '5s';
+
+-- 1. Columnas nuevas (solo catálogo, sin reescritura)
+ALTER TABLE location_data
+    ADD COLUMN IF NOT EXISTS latitude_dp DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS longitude_dp DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS accuracy_dp DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS altitude_dp DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS speed_dp DOUBLE PRECISION;
+
+-- 2. Mantener sincronizadas las filas nuevas mientras dura el relleno
+CREATE OR REPLACE FUNCTION location_data_sync_dp() RETURNS trigger AS $$
+BEGIN
+    NEW.latitude_dp := NEW.latitude;
+    NEW.longitude_dp := NEW.longitude;
+    NEW.accuracy_dp := NEW.accuracy;
+    NEW.altitude_dp := NEW.altitude;
+    NEW.speed_dp := NEW.speed;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_location_data_sync_dp ON location_data;
+CREATE TRIGGER trg_location_data_sync_dp
+    BEFORE INSERT OR UPDATE OF latitude, longitude, accuracy, altitude, speed ON location_data
+    FOR EACH ROW EXECUTE FUNCTION location_data_sync_dp();
+
+-- 3. Relleno por lotes de id, con COMMIT por lote para liberar bloqueos de fila
+CREATE OR REPLACE PROCEDURE location_data_backfill_dp(batch_size INTEGER DEFAULT 10000)
+LANGUAGE plpgsql AS $$
+DECLARE
+    current_id INTEGER;
+    max_id INTEGER;
+BEGIN
+    SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) INTO current_id, max_id FROM location_data;
+    WHILE current_id <= max_id LOOP
+        UPDATE location_data
+        SET latitude_dp = latitude,
+            longitude_dp = longitude,
+            accuracy_dp = accuracy,
+            altitude_dp = altitude,
+            speed_dp = speed
+        WHERE id >= current_id AND id < current_id + batch_size
+          AND latitude_dp IS NULL;
+        current_id := current_id + batch_size;
+        COMMIT;
+    END LOOP;
+END;
+$$;
+
+CALL location_data_backfill_dp(10000);
+
+-- 4. NOT NULL sin escaneo bajo bloqueo exclusivo: CHECK NOT VALID + VALIDATE
+ALTER TABLE location_data DROP CONSTRAINT IF EXISTS location_data_latitude_dp_not_null;
+ALTER TABLE location_data DROP CONSTRAINT IF EXISTS location_data_longitude_dp_not_null;
+ALTER TABLE location_data
+    ADD CONSTRAINT location_data_latitude_dp_not_null CHECK (latitude_dp IS NOT NULL) NOT VALID;
+ALTER TABLE location_data
+    ADD CONSTRAINT location_data_longitude_dp_not_null CHECK (longitude_dp IS NOT NULL) NOT VALID;
+ALTER TABLE location_data VALIDATE CONSTRAINT location_data_latitude_dp_not_null;
+ALTER TABLE location_data VALIDATE CONSTRAINT location_data_longitude_dp_not_null;
+
+-- 5. Intercambio de columnas en una transacción corta (solo catálogo)
+BEGIN;
+DROP TRIGGER trg_location_data_sync_dp ON location_data;
+ALTER TABLE location_data DROP COLUMN latitude;
+ALTER TABLE location_data DROP COLUMN longitude;
+ALTER TABLE location_data DROP COLUMN accuracy;
+ALTER TABLE location_data DROP COLUMN altitude;
+ALTER TABLE location_data DROP COLUMN speed;
+ALTER TABLE location_data RENAME COLUMN latitude_dp TO latitude;
+ALTER TABLE location_data RENAME COLUMN longitude_dp TO longitude;
+ALTER TABLE location_data RENAME COLUMN accuracy_dp TO accuracy;
+ALTER TABLE location_data RENAME COLUMN altitude_dp TO altitude;
+ALTER TABLE location_data RENAME COLUMN speed_dp TO speed;
+-- PostgreSQL 12+ usa el CHECK validado para evitar el escaneo de SET NOT NULL
+ALTER TABLE location_data ALTER COLUMN latitude SET NOT NULL;
+ALTER TABLE location_data ALTER COLUMN longitude SET NOT NULL;
+ALTER TABLE location_data DROP CONSTRAINT location_data_latitude_dp_not_null;
+ALTER TABLE location_data DROP CONSTRAINT location_data_longitude_dp_not_null;
+COMMIT;
+
+DROP FUNCTION IF EXISTS location_data_sync_dp();
+DROP PROCEDURE IF EXISTS location_data_backfill_dp(INTEGER);
@@ -0,0 +1,17 @@
+-- Índice espacial de location_data para las consultas de dispositivos cercanos (KNN con <->)
+-- Se ejecuta con psql en autocommit (CREATE INDEX CONCURRENTLY no admite transacciones):
+--   psql "$DATABASE_URL" -f migrations/004_location_data_knn_index.sql
+-- Índice de expresión: no agrega columnas ni reescribe la tabla. La expresión debe
+-- coincidir exactamente con la de las consultas (ST_SetSRID(ST_Point(longitude, latitude), 4326)),
+-- que es la misma que ya usa la búsqueda por polígono.
+-- timestamp_value como segunda columna (btree_gist) permite descartar dentro del índice
+-- las ramas fuera de la ventana de tiempo mientras se recorren los vecinos más cercanos.
+
+CREATE EXTENSION IF NOT EXISTS postgis;
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_location_data_geom_time
+    ON location_data
+    USING gist (ST_SetSRID(ST_Point(longitude, latitude), 4326), timestamp_value);
+
+ANALYZE location_data;
@@ -0,0 +1,12 @@
+-- Índice por dispositivo y tiempo de location_data
+-- Se ejecuta con psql en autocommit (CREATE INDEX CONCURRENTLY no admite transacciones):
+--   psql "$DATABASE_URL" -f migrations/005_location_data_device_time_index.sql
+-- Lo usan los cursores de la reproducción (replay.py), que leen la pista de cada
+-- dispositivo por páginas con (timestamp_value, id) > (último leído): cada página es
+-- un recorrido corto del índice en lugar de un escaneo de la tabla. También sirve a
+-- /api/location/range y a la analítica de recorridos filtradas por device_id.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_location_data_device_time
+    ON location_data (device_id, timestamp_value, id);
+
+ANALYZE location_data;
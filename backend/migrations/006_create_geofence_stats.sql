@@ -0,0 +1,30 @@
+-- Estadísticas incrementales de visitas y permanencia por geocerca (geofence_stats.py)
+--   psql "$DATABASE_URL" -f migrations/006_create_geofence_stats.sql
+
+-- Visitas, permanencia y primera/última posición dentro de la geocerca por dispositivo y día (UTC)
+CREATE TABLE IF NOT EXISTS geofence_stats_daily (
+    geofence_id INTEGER NOT NULL REFERENCES geofences(id) ON DELETE CASCADE,
+    device_id VARCHAR(255) NOT NULL,
+    day DATE NOT NULL,
+    visits INTEGER NOT NULL,
+    dwell_ms BIGINT NOT NULL,
+    first_seen BIGINT NOT NULL,
+    last_seen BIGINT NOT NULL,
+    PRIMARY KEY (geofence_id, device_id, day)
+);
+
+-- Visita abierta de cada (geocerca, dispositivo), para continuarla en el siguiente lote
+CREATE TABLE IF NOT EXISTS geofence_visit_state (
+    geofence_id INTEGER NOT NULL REFERENCES geofences(id) ON DELETE CASCADE,
+    device_id VARCHAR(255) NOT NULL,
+    visit_start BIGINT NOT NULL,
+    last_seen BIGINT NOT NULL,
+    PRIMARY KEY (geofence_id, device_id)
+);
+
+-- Marca de agua (último id de location_data procesado) de cada geocerca;
+-- sin fila la geocerca se rellena desde el principio
+CREATE TABLE IF NOT EXISTS geofence_stats_progress (
+    geofence_id INTEGER PRIMARY KEY REFERENCES geofences(id) ON DELETE CASCADE,
+    last_id BIGINT NOT NULL
+);
@@ -0,0 +1,18 @@
+-- Índice geodésico por dispositivo para /api/location/nearest con ventana de tiempo
+-- Se ejecuta con psql en autocommit (CREATE INDEX CONCURRENTLY no admite transacciones):
+--   psql "$DATABASE_URL" -f migrations/007_location_data_device_geography_index.sql
+-- La consulta recorre los dispositivos (índice 005) y para cada uno pide su punto más
+-- cercano con <-> sobre geography, es decir en metros y no en grados. device_id primero
+-- (btree_gist) limita el recorrido KNN a un dispositivo y timestamp_value descarta las
+-- ramas fuera de la ventana. La expresión debe coincidir con la de la consulta:
+-- ST_SetSRID(ST_Point(longitude, latitude), 4326)::geography.
+-- El índice 004 (geometry) sigue sirviendo a la búsqueda por polígono.
+
+CREATE EXTENSION IF NOT EXISTS postgis;
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_location_data_device_geog_time
+    ON location_data
+    USING gist (device_id, (ST_SetSRID(ST_Point(longitude, latitude), 4326)::geography), timestamp_value);
+
+ANALYZE location_data;
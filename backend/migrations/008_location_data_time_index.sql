@@ -0,0 +1,12 @@
+-- Índice por tiempo de location_data
+-- Se ejecuta con psql en autocommit (CREATE INDEX CONCURRENTLY no admite transacciones):
+--   psql "$DATABASE_URL" -f migrations/008_location_data_time_index.sql
+-- La última posición es la de mayor timestamp_value (a igual tiempo, la de mayor id),
+-- no la última insertada: un lote sin conexión puede llegar después con tiempos viejos.
+-- La última por dispositivo usa el índice 005; la última de todas (sin device_id)
+-- recorre este índice hacia atrás en lugar de la clave primaria.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_location_data_time
+    ON location_data (timestamp_value, id);
+
+ANALYZE location_data;
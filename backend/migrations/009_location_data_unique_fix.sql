@@ -0,0 +1,22 @@
+-- Una sola fila por (device_id, timestamp_value) en location_data
+-- Se ejecuta con psql en autocommit (CREATE INDEX CONCURRENTLY no admite transacciones):
+--   psql "$DATABASE_URL" -f migrations/009_location_data_unique_fix.sql
+-- La ingesta UDP y el lote HTTP insertan con ON CONFLICT DO NOTHING: con este índice una
+-- posición repetida no se guarda aunque llegue por las dos vías o a procesos distintos
+-- (la memoria de duplicados de ingest.py es solo por proceso). Sin el índice los
+-- INSERT siguen funcionando pero no descartan nada.
+-- Primero se borran los duplicados que ya existan (queda la fila de menor id). Si entre
+-- el DELETE y el índice entra otro duplicado, CREATE INDEX CONCURRENTLY falla y deja el
+-- índice inválido: borrarlo (DROP INDEX CONCURRENTLY idx_location_data_device_time_unique)
+-- y volver a ejecutar este archivo.
+
+DELETE FROM location_data newer
+USING location_data older
+WHERE newer.device_id = older.device_id
+AND newer.timestamp_value = older.timestamp_value
+AND newer.id > older.id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_location_data_device_time_unique
+    ON location_data (device_id, timestamp_value);
+
+ANALYZE location_data;
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime
 
 class LocationData(BaseModel):
     """Modelo para datos de ubicación"""
@@ -18,6 +18,10 @@ class LocationResponse(BaseModel):
     created_at: datetime
     device_id: Optional[str] = None # Añadido
 
+class NearestLocationResponse(LocationResponse):
+    """Ubicación de un dispositivo con su distancia al punto consultado"""
+    distance_m: float
+
 class AllLocationsResponse(BaseModel):
     """Respuesta para todas las ubicaciones"""
     id: int
@@ -36,6 +40,15 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: str
 
+class DetectionBucketResponse(BaseModel):
+    """Conteo de personas de un dispositivo en un intervalo"""
+    device_id: str
+    bucket: datetime
+    samples: int
+    avg_count: float
+    min_count: int
+    max_count: int
+
 class ErrorResponse(BaseModel):
     """Respuesta de error"""
     message: str
@@ -71,6 +84,31 @@ class GeofenceResponse(BaseModel):
     is_active: bool
     journey_count: Optional[int] = 0
 
+class GeofenceDeviceStats(BaseModel):
+    """Visitas y permanencia de un dispositivo en una geocerca"""
+    device_id: str
+    visits: int
+    total_dwell_s: float
+    avg_dwell_s: float
+    first_visit: int
+    last_visit: int
+
+class GeofenceDayStats(BaseModel):
+    """Visitas y permanencia de un dispositivo en una geocerca durante un día (UTC)"""
+    device_id: str
+    day: date
+    visits: int
+    dwell_ms: int
+    first_seen: int
+    last_seen: int
+
+class GeofenceStatsResponse(BaseModel):
+    """Estadísticas de una geocerca; updated_through_id es None mientras no se han calculado"""
+    geofence_id: int
+    updated_through_id: Optional[int] = None
+    devices: list[GeofenceDeviceStats]
+    days: Optional[list[GeofenceDayStats]] = None
+
 class GeofenceJourney(BaseModel):
     """Modelo para journey de geocerca"""
     device_id: str
@@ -0,0 +1,278 @@
+"""
+Detección de personas en el servidor (SERVER_DETECTION=1).
+Se suscribe al video de los broadcasters (la publicación del SFU, ver sfu.py), toma
+frames a DETECTION_SAMPLE_FPS y cuenta personas con el detector HOG de OpenCV en un
+pool de procesos. Los conteos salen por el mismo canal 'detection-update' que las
+detecciones de los clientes.
+
+Por defecto solo se decodifican los frames muestreados: el detector recibe los frames
+codificados del SFU y, cuando toca muestrear, analiza el próximo keyframe que envía el
+broadcaster (que no depende de los anteriores). El proceso del pool decodifica ese
+keyframe, lo reduce a escala de grises y lo analiza; el event loop solo mira la
+cabecera de cada frame. Nunca se piden keyframes para muestrear: cada uno es un frame
+grande que sube por la red móvil del teléfono y que el SFU reenvía a todos los viewers.
+La tasa real es la de keyframes del broadcaster (los que piden los viewers nuevos o
+con pérdidas, más los periódicos del codificador) con DETECTION_SAMPLE_FPS como máximo,
+y se publica por dispositivo en server_detection_effective_fps.
+
+Con DETECTION_DECODE_ALL=1 se muestrea a DETECTION_SAMPLE_FPS: aiortc decodifica todos
+los frames del dispositivo en su hilo decodificador (un decodificador persistente por
+dispositivo, fuera del event loop) y se lee el track decodificado; cuesta decodificar
+cada frame. Lo mismo se hace si el SFU no puede interceptar los frames (SFU_SUPPORTED
+False). En ambos casos la reducción a escala de grises se hace en un hilo.
+
+Contrapresión: cada dispositivo tiene como mucho un frame en análisis y el pool como
+mucho uno por proceso. Un frame que llega con el pool ocupado se descarta; nunca se
+encola, así que un conteo nunca describe un frame viejo.
+
+Variables de entorno:
+  SERVER_DETECTION=0          1 = activar la detección en el servidor
+  DETECTION_SAMPLE_FPS=1      frames analizados por segundo y dispositivo (máximo si solo keyframes)
+  DETECTION_DECODE_ALL=0      1 = decodificar todos los frames para cumplir DETECTION_SAMPLE_FPS
+  DETECTION_WORKERS=2         procesos del pool de detección
+  DETECTION_FRAME_WIDTH=640   ancho al que se reduce el frame antes de analizarlo
+  DETECTION_MIN_WEIGHT=0.5    confianza mínima del SVM para contar una persona
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from metrics import Counter, Gauge, Histogram
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SERVER_DETECTION = os.getenv('SERVER_DETECTION', '0') == '1'
+DETECTION_SAMPLE_FPS = float(os.getenv('DETECTION_SAMPLE_FPS', 1))
+DETECTION_DECODE_ALL = os.getenv('DETECTION_DECODE_ALL', '0') == '1'
+DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', 2))
+DETECTION_FRAME_WIDTH = int(os.getenv('DETECTION_FRAME_WIDTH', 640))
+DETECTION_MIN_WEIGHT = float(os.getenv('DETECTION_MIN_WEIGHT', 0.5))
+
+DETECTION_FRAMES = Counter('server_detection_frames_total', 'Frames muestreados por resultado', ('outcome',))
+DETECTION_SECONDS = Histogram('server_detection_seconds', 'Duración del análisis de un frame (envío y espera incluidos)',
+                              buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+DETECTION_EFFECTIVE_FPS = Gauge('server_detection_effective_fps',
+                                'Frames analizados por segundo en los últimos muestreos de cada dispositivo', ('device',))
+
+# Muestreos con los que se calcula la tasa efectiva
+EFFECTIVE_FPS_WINDOW = 10
+
+# Estado de cada proceso del pool
+_hog = None
+
+
+def _init_worker():
+    global _hog
+    import cv2
+
+    # Un hilo por proceso: el paralelismo lo da el pool
+    cv2.setNumThreads(1)
+    _hog = cv2.HOGDescriptor()
+    _hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+
+def count_people(image, min_weight=DETECTION_MIN_WEIGHT):
+    """Personas en una imagen en escala de grises (uint8 HxW); se ejecuta en el pool"""
+    import numpy as np
+
+    if _hog is None:
+        _init_worker()
+    # Sin detecciones OpenCV devuelve una tupla vacía en lugar de un array
+    _, weights = _hog.detectMultiScale(image, winStride=(8, 8), padding=(8, 8), scale=1.05)
+    return int(np.count_nonzero(np.ravel(weights) >= min_weight))
+
+
+# Decodificadores de FFmpeg (PyAV) para los códecs que negocia aiortc
+DECODERS = {'VP8': 'vp8', 'H264': 'h264'}
+
+
+def frame_to_gray(frame, max_width=DETECTION_FRAME_WIDTH):
+    """av.VideoFrame -> ndarray en escala de grises, reducido a max_width de ancho"""
+    if frame.width > max_width:
+        height = round(frame.height * max_width / frame.width) // 2 * 2
+        frame = frame.reformat(width=max_width, height=height, format='gray')
+    else:
+        frame = frame.reformat(format='gray')
+    return frame.to_ndarray()
+
+
+def count_people_in_keyframe(codec_name, data, max_width=DETECTION_FRAME_WIDTH, min_weight=DETECTION_MIN_WEIGHT):
+    """Decodifica un keyframe ensamblado (salida de depayload) y cuenta personas; se ejecuta en el pool"""
+    import av
+
+    decoder = av.CodecContext.create(DECODERS[codec_name], 'r')
+    frames = decoder.decode(av.Packet(data)) + decoder.decode(None)
+    if not frames:
+        raise ValueError(f"El keyframe {codec_name} no produjo imagen")
+    return count_people(frame_to_gray(frames[-1], max_width), min_weight)
+
+
+class PersonDetector:
+    """Muestrea los tracks de video de los broadcasters y publica el conteo de personas.
+
+    ``publish(device_id, person_count, timestamp)`` es la corrutina que lo entrega.
+    """
+
+    def __init__(self, publish, workers=DETECTION_WORKERS, sample_fps=DETECTION_SAMPLE_FPS,
+                 decode_all=DETECTION_DECODE_ALL):
+        self.publish = publish
+        self.workers = workers
+        self.decode_all = decode_all
+        self.interval = 1 / sample_fps if sample_fps > 0 else 0
+        self.pool = None
+        self.in_flight = 0
+        self.busy = set()        # dispositivos con un frame en análisis
+        self.next_sample = {}    # deviceId -> hora del loop del próximo muestreo
+        self.sources = {}        # deviceId -> sfu.PublishedTrack que se muestrea
+        self.samplers = {}       # deviceId -> asyncio.Task que lee su track decodificado
+        self.analyzed = {}       # deviceId -> horas (monotonic) de los últimos análisis
+        self._publishing = set() # publicaciones de conteos en curso (el loop no las retiene)
+
+    def _pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return self.pool
+
+    def watch(self, device_id, published):
+        """Empieza a muestrear el video publicado por el dispositivo (sfu.PublishedTrack)"""
+        self.unwatch(device_id)
+        self.sources[device_id] = published
+        if published.forwarding and published.codec_name in DECODERS and not self.decode_all:
+            published.sampler = lambda codec_name, data, keyframe: self.offer(
+                device_id, published, codec_name, data, keyframe
+            )
+            mode = 'keyframes del broadcaster'
+        else:
+            self.samplers[device_id] = asyncio.create_task(self._read(device_id, published.decoded()))
+            if published.forwarding:
+                # El decodificador empieza a entregar frames con el próximo keyframe
+                published.request_keyframe()
+            mode = 'todos los frames decodificados'
+        logger.info("🧍 Detección en servidor activa para %s (%s)", device_id, mode)
+
+    def unwatch(self, device_id):
+        published = self.sources.pop(device_id, None)
+        if published is not None:
+            published.sampler = None
+            published.stop_decoding()
+        sampler = self.samplers.pop(device_id, None)
+        if sampler is not None:
+            sampler.cancel()
+        self.next_sample.pop(device_id, None)
+        self.analyzed.pop(device_id, None)
+        DETECTION_EFFECTIVE_FPS.values.pop((device_id,), None)
+
+    def _due(self, device_id):
+        return asyncio.get_running_loop().time() >= self.next_sample.get(device_id, 0.0)
+
+    def _claim(self, device_id):
+        """Reserva el análisis de un frame; False si el pool está ocupado"""
+        if device_id in self.busy or self.in_flight >= self.workers:
+            # Pool ocupado: este frame se pierde y se prueba con el siguiente, que será más nuevo
+            DETECTION_FRAMES.inc(labels=('dropped',))
+            return False
+        self.next_sample[device_id] = asyncio.get_running_loop().time() + self.interval
+        self.busy.add(device_id)
+        self.in_flight += 1
+        return True
+
+    def _release(self, device_id):
+        self.busy.discard(device_id)
+        self.in_flight -= 1
+
+    def offer(self, device_id, published, codec_name, data, keyframe):
+        """Un frame codificado del dispositivo: se analiza si es keyframe y toca muestrear.
+        Un frame delta no se puede decodificar suelto y no se piden keyframes: se espera
+        al próximo que envíe el broadcaster"""
+        if not keyframe or not self._due(device_id):
+            return
+        if self._claim(device_id):
+            self._submit(device_id, count_people_in_keyframe, codec_name, data)
+
+    async def _read(self, device_id, track):
+        from aiortc.mediastreams import MediaStreamError
+
+        # Se leen todos los frames para que la cola del track no crezca; solo se analizan algunos
+        while True:
+            try:
+                frame = await track.recv()
+            except MediaStreamError:
+                break
+            if self._due(device_id) and self._claim(device_id):
+                try:
+                    image = await asyncio.to_thread(frame_to_gray, frame)
+                except BaseException:
+                    self._release(device_id)
+                    raise
+                self._submit(device_id, count_people, image)
+        if self.samplers.get(device_id) is asyncio.current_task():
+            del self.samplers[device_id]
+            self.unwatch(device_id)
+
+    def _submit(self, device_id, function, *args):
+        started = time.monotonic()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool(), function, *args)
+        except BrokenProcessPool:
+            # Un proceso del pool murió: se rehace en el próximo frame
+            logger.error("❌ Pool de detección roto; se recrea")
+            self.pool = None
+            self._release(device_id)
+            DETECTION_FRAMES.inc(labels=('failed',))
+            return
+        future.add_done_callback(lambda done: self._done(device_id, time.monotonic() - started, done))
+
+    def _done(self, device_id, elapsed, future):
+        self._release(device_id)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                self.pool = None
+            logger.error("❌ Error detectando personas en %s: %s", device_id, error)
+            DETECTION_FRAMES.inc(labels=('failed',))
+            return
+        DETECTION_FRAMES.inc(labels=('analyzed',))
+        DETECTION_SECONDS.observe(elapsed)
+        self._record_rate(device_id)
+        if device_id in self.next_sample:
+            task = asyncio.create_task(self.publish(device_id, future.result(), int(time.time() * 1000)))
+            self._publishing.add(task)
+            task.add_done_callback(lambda done: self._published(device_id, done))
+
+    def _record_rate(self, device_id):
+        if device_id not in self.sources:
+            return
+        analyzed = self.analyzed.get(device_id)
+        if analyzed is None:
+            analyzed = self.analyzed[device_id] = deque(maxlen=EFFECTIVE_FPS_WINDOW)
+        analyzed.append(time.monotonic())
+        if len(analyzed) > 1 and analyzed[-1] > analyzed[0]:
+            DETECTION_EFFECTIVE_FPS.set((len(analyzed) - 1) / (analyzed[-1] - analyzed[0]), labels=(device_id,))
+
+    def _published(self, device_id, task):
+        self._publishing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Error publicando el conteo de personas de %s: %s", device_id, task.exception())
+
+    async def close(self):
+        for device_id in list(self.sources) + list(self.samplers):
+            self.unwatch(device_id)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,99 @@
+"""
+Perfilado opcional de peticiones (PROFILING_ENABLED=1).
+Cada petición acumula el tiempo por fase (pool, db, serialize, ...) en una ContextVar
+y el middleware lo devuelve en la cabecera Server-Timing.
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED') == '1'
+
+_phases: ContextVar[Optional[dict]] = ContextVar('request_phases', default=None)
+_profile_lock = asyncio.Lock()
+
+
+def add_phase(name, seconds):
+    """Suma tiempo a una fase de la petición actual (no hace nada fuera de una petición perfilada)"""
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+def phase_total(name):
+    """Tiempo acumulado hasta ahora en una fase de la petición actual"""
+    phases = _phases.get()
+    return phases.get(name, 0.0) if phases is not None else 0.0
+
+
+@contextmanager
+def phase(name):
+    """Mide el bloque como parte de la fase ``name``"""
+    if _phases.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """Middleware ASGI que expone las fases de la petición en la cabecera Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                total = time.perf_counter() - start
+                entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in phases.items()]
+                entries.append(f'total;dur={total * 1000:.2f}')
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', ', '.join(entries).encode()))
+                headers.append((b'timing-allow-origin', b'*'))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _phases.reset(token)
+
+
+async def capture_cpu_profile(seconds, sort='cumulative', limit=50):
+    """Perfila el proceso (todo lo que corre en el event loop) durante ``seconds``"""
+    if _profile_lock.locked():
+        raise RuntimeError("Ya hay un perfil en curso")
+    async with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
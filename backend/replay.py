@@ -0,0 +1,204 @@
+"""
+Reproducción acelerada de varios dispositivos (/api/replay/ws y /api/replay/stream).
+Cada dispositivo tiene un cursor que lee su pista por páginas (keyset sobre
+(timestamp_value, id), índice de la migración 005); los cursores se mezclan en orden
+de timestamp con un heap (k-way merge) y las posiciones se envían al ritmo del reloj
+de reproducción, ``speed`` veces más rápido que el tiempo real. En memoria solo hay
+una página por dispositivo, así que el consumo no depende del largo de la ventana.
+
+Un salto (seek) reabre los cursores en el nuevo instante; cambiar la velocidad o
+pausar solo re-ancla el reloj.
+
+Variables de entorno:
+  REPLAY_PAGE_SIZE=500       posiciones por página de cada cursor
+  REPLAY_MAX_DEVICES=50      dispositivos por reproducción
+  REPLAY_MAX_SPEED=3600      multiplicador máximo
+  REPLAY_BATCH_MAX=200       posiciones por mensaje (las que vencen juntas viajan en un solo mensaje)
+  REPLAY_CLOCK_S=1           cada cuánto se envía el reloj mientras no hay posiciones
+"""
+
+import asyncio
+import heapq
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from metrics import Counter, Gauge
+
+load_dotenv()
+
+REPLAY_PAGE_SIZE = int(os.getenv('REPLAY_PAGE_SIZE', 500))
+REPLAY_MAX_DEVICES = int(os.getenv('REPLAY_MAX_DEVICES', 50))
+REPLAY_MAX_SPEED = float(os.getenv('REPLAY_MAX_SPEED', 3600))
+REPLAY_BATCH_MAX = int(os.getenv('REPLAY_BATCH_MAX', 200))
+REPLAY_CLOCK_S = float(os.getenv('REPLAY_CLOCK_S', 1))
+
+REPLAY_SESSIONS = Gauge('replay_sessions', 'Reproducciones abiertas')
+REPLAY_FIXES = Counter('replay_fixes_total', 'Posiciones enviadas por las reproducciones')
+
+
+class DeviceCursor:
+    """Pista de un dispositivo leída por páginas desde un instante"""
+
+    def __init__(self, db, device_id, start_time, end_time, page_size=REPLAY_PAGE_SIZE):
+        self.db = db
+        self.device_id = device_id
+        self.end_time = end_time
+        self.page_size = page_size
+        # Posición del último leído; id -1 incluye las filas con timestamp == start_time
+        self.after = (start_time, -1)
+        self.buffer = deque()
+        self.exhausted = False
+
+    async def next(self):
+        if not self.buffer and not self.exhausted:
+            rows = await self.db.get_replay_page(self.device_id, *self.after, self.end_time, self.page_size)
+            self.exhausted = len(rows) < self.page_size
+            if rows:
+                self.after = (rows[-1]['timestamp_value'], rows[-1]['id'])
+                self.buffer.extend(rows)
+        return self.buffer.popleft() if self.buffer else None
+
+
+class ReplayMerge:
+    """Mezcla en orden de (timestamp, id) de los cursores de cada dispositivo"""
+
+    def __init__(self, db, device_ids, start_time, end_time):
+        self.cursors = [DeviceCursor(db, device_id, start_time, end_time) for device_id in device_ids]
+        self.heap = None
+
+    async def next(self):
+        if self.heap is None:
+            self.heap = []
+            firsts = await asyncio.gather(*(cursor.next() for cursor in self.cursors))
+            for index, row in enumerate(firsts):
+                if row is not None:
+                    self.heap.append((row['timestamp_value'], row['id'], index, row))
+            heapq.heapify(self.heap)
+        if not self.heap:
+            return None
+        _, _, index, row = self.heap[0]
+        following = await self.cursors[index].next()
+        if following is None:
+            heapq.heappop(self.heap)
+        else:
+            heapq.heapreplace(self.heap, (following['timestamp_value'], following['id'], index, following))
+        return row
+
+
+class ReplaySession:
+    """Reloj de reproducción sobre ReplayMerge, con seek, velocidad y pausa.
+
+    ``run(send)`` llama ``await send(tipo, datos)`` con 'fixes', 'clock' y 'end'.
+    """
+
+    def __init__(self, db, device_ids, start_time, end_time, speed=1.0):
+        self.db = db
+        self.device_ids = device_ids
+        self.start_time = start_time
+        self.end_time = end_time
+        self.speed = speed
+        self.paused = False
+        self._changed = asyncio.Event()
+        self._open(start_time)
+
+    def _open(self, position):
+        self.merge = ReplayMerge(self.db, self.device_ids, position, self.end_time)
+        self.generation = getattr(self, 'generation', 0) + 1
+        self.pending = None
+        self._anchor(position)
+
+    def _anchor(self, position):
+        self.anchor_time = position
+        self.anchor_wall = time.monotonic()
+
+    def position(self):
+        """Instante de la reproducción (ms)"""
+        if self.paused:
+            return self.anchor_time
+        return min(self.anchor_time + (time.monotonic() - self.anchor_wall) * 1000 * self.speed, self.end_time)
+
+    def seek(self, position):
+        self._open(max(self.start_time, min(int(position), self.end_time)))
+        self._changed.set()
+
+    def set_speed(self, speed):
+        self._anchor(self.position())
+        self.speed = speed
+        self._changed.set()
+
+    def pause(self):
+        self._anchor(self.position())
+        self.paused = True
+        self._changed.set()
+
+    def resume(self):
+        self.paused = False
+        self._anchor(self.anchor_time)
+        self._changed.set()
+
+    async def _wait(self, seconds):
+        """Duerme hasta ``seconds`` o hasta un cambio de control; True si hubo cambio"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+    async def _next(self):
+        """Siguiente posición de la mezcla actual; None si un seek la reemplazó durante la lectura"""
+        generation = self.generation
+        row = await self.merge.next()
+        if generation != self.generation:
+            return None, False
+        return row, row is None
+
+    async def run(self, send):
+        REPLAY_SESSIONS.inc()
+        try:
+            await self._run(send)
+        finally:
+            REPLAY_SESSIONS.dec()
+
+    async def _run(self, send):
+        while True:
+            if self.paused:
+                await send('clock', {'time': int(self.position()), 'paused': True})
+                await self._wait(None)
+                continue
+            if self.pending is None:
+                self.pending, finished = await self._next()
+                if finished:
+                    await send('end', {'time': self.end_time})
+                    # Queda esperando un seek hacia atrás
+                    await self._wait(None)
+                    continue
+                if self.pending is None:
+                    continue
+
+            delay = (self.pending['timestamp_value'] - self.position()) / 1000 / self.speed
+            if delay > 0:
+                if delay > REPLAY_CLOCK_S:
+                    await send('clock', {'time': int(self.position()), 'paused': False})
+                await self._wait(min(delay, REPLAY_CLOCK_S))
+                continue
+
+            # Todas las posiciones que ya vencieron viajan en un solo mensaje
+            generation = self.generation
+            batch = [self.pending]
+            self.pending = None
+            while len(batch) < REPLAY_BATCH_MAX:
+                row, _ = await self._next()
+                if row is None:
+                    break
+                if row['timestamp_value'] > self.position():
+                    self.pending = row
+                    break
+                batch.append(row)
+            if generation != self.generation:
+                continue
+            REPLAY_FIXES.inc(len(batch))
+            await send('fixes', {'time': int(self.position()), 'fixes': batch})
@@ -1,28 +1,203 @@
 #!/usr/bin/env python3
 """
 Script de inicio para el servidor de ubicaciones
-Ejecutar con: python run.py
+Ejecutar con: python run.py            (un solo proceso: API + UDP + WebRTC)
+         o:   python run.py --split    (supervisor: ingesta, señalización y N workers del API)
+
+En modo --split (o PROCESS_MODE=split) cada servicio corre en su propio proceso:
+  - ingesta: servidor UDP, escritura en PostgreSQL y servidor del canal local
+  - señalización: servidor aiohttp/Socket.IO de WebRTC
+  - API: uvicorn con API_WORKERS workers sin estado
+Las posiciones nuevas y demás eventos en vivo viajan por el canal local (socket Unix).
 """
 
+import asyncio
+import multiprocessing
 import os
+import signal
+import sys
+import time
 import uvicorn
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv()
 
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 10))
+
+
+def _wait_for_signal(stop_event):
+    """Marca stop_event al recibir SIGTERM/SIGINT"""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+
+async def _serve_ingest(ready):
+    """Proceso de ingesta: UDP -> PostgreSQL y servidor del canal local"""
+    from aiohttp import web
+
+    import metrics
+    from database import Database
+    from detection_history import DETECTION_HISTORY, DetectionWriter
+    from geofence_stats import GEOFENCE_STATS_INTERVAL_S, GeofenceStatsUpdater
+    from local_channel import ChannelServer
+    from udp_server import start_udp_server, stop_udp_server
+
+    stop_event = asyncio.Event()
+    _wait_for_signal(stop_event)
+
+    db = Database()
+    await db.init_connection_pool()
+    await db.create_table()
+    # Las detecciones llegan por el canal desde el proceso de señalización
+    writer = None
+    if DETECTION_HISTORY:
+        await db.create_detection_tables()
+        writer = DetectionWriter(db)
+        await writer.start()
+    # Estadísticas de geocercas: un solo actualizador, junto a la ingesta
+    stats_updater = None
+    if GEOFENCE_STATS_INTERVAL_S > 0:
+        stats_updater = GeofenceStatsUpdater(db)
+        await stats_updater.start()
+    channel = ChannelServer()
+    await channel.start()
+    transport, _ = await start_udp_server(db)
+
+    # Las métricas de ingesta se sirven aquí; el API solo ve las de su propio proceso
+    async def metrics_handler(request):
+        return web.Response(text=metrics.render(), content_type='text/plain')
+
+    metrics_app = web.Application()
+    metrics_app.router.add_get('/metrics', metrics_handler)
+    metrics_runner = web.AppRunner(metrics_app)
+    await metrics_runner.setup()
+    await web.TCPSite(metrics_runner, '127.0.0.1', int(os.getenv('INGEST_METRICS_PORT', 9101))).start()
+
+    ready.set()
+    await stop_event.wait()
+
+    await stop_udp_server(transport)
+    await metrics_runner.cleanup()
+    await channel.stop()
+    if writer:
+        await writer.stop()
+    if stats_updater:
+        await stats_updater.stop()
+    await db.close_connection_pool()
+
+
+async def _serve_signaling(ready):
+    """Proceso de señalización WebRTC"""
+    from local_channel import ChannelClient
+    from webrtc_server import start_webrtc_server
+
+    stop_event = asyncio.Event()
+    _wait_for_signal(stop_event)
+
+    channel = ChannelClient()
+    await channel.start()
+    runner = await start_webrtc_server(host='0.0.0.0', port=int(os.getenv('WEBRTC_PORT', 8081)))
+
+    ready.set()
+    await stop_event.wait()
+
+    await runner.cleanup()
+    await channel.stop()
+
+
+def _run_service(name, ready):
+    from log_config import setup_logging
+    setup_logging()
+    service = {'ingest': _serve_ingest, 'signaling': _serve_signaling}[name]
+    asyncio.run(service(ready))
+
+
+def _run_api(host, http_port, workers):
+    # Los workers no abren UDP ni WebRTC y casi no escriben: sin conexiones de ingesta fijas
+    os.environ['EMBEDDED_SERVICES'] = '0'
+    os.environ.setdefault('DB_INGEST_POOL_MIN_SIZE', '0')
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=http_port,
+        workers=workers,
+        log_level="info",
+        access_log=os.getenv('ACCESS_LOG', '0') == '1'
+    )
+
+
+def supervise(host, http_port):
+    """Arranca ingesta, señalización y API en orden y los detiene en orden inverso"""
+    context = multiprocessing.get_context('spawn')
+    workers = int(os.getenv('API_WORKERS', 2))
+    processes = []
+
+    def start(name, target, args, wait_ready=None):
+        process = context.Process(target=target, args=args, name=name)
+        process.start()
+        processes.append(process)
+        if wait_ready is not None and not wait_ready.wait(timeout=60):
+            raise RuntimeError(f"{name} no quedó listo a tiempo")
+        print(f"✅ {name} iniciado (pid {process.pid})")
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    try:
+        # La ingesta abre el canal local, así que va primero
+        ingest_ready = context.Event()
+        start('ingest', _run_service, ('ingest', ingest_ready), ingest_ready)
+        signaling_ready = context.Event()
+        start('signaling', _run_service, ('signaling', signaling_ready), signaling_ready)
+        start('api', _run_api, (host, http_port, workers))
+
+        # Si un proceso muere se detiene todo para que PM2 reinicie el conjunto
+        while not stopping:
+            if any(not process.is_alive() for process in processes):
+                dead = [process.name for process in processes if not process.is_alive()]
+                print(f"❌ Proceso terminado inesperadamente: {', '.join(dead)}")
+                break
+            time.sleep(0.5)
+    finally:
+        for process in reversed(processes):
+            if process.is_alive():
+                process.terminate()
+                process.join(SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        print("🛑 Procesos detenidos")
+
+    if not stopping:
+        sys.exit(1)
+
+
 def main():
     """Función principal para iniciar el servidor"""
     # Obtener configuración de las variables de entorno
     host = os.getenv('HOST', '0.0.0.0')
     http_port = int(os.getenv('HTTP_PORT', 3001))
     reload = os.getenv('ENVIRONMENT') == 'development'
-    
+    split = '--split' in sys.argv or os.getenv('PROCESS_MODE') == 'split'
+
     print("🚀 Iniciando Location Tracker Server...")
     print(f"📡 HTTP API: http://{host}:{http_port}")
     print(f"📡 UDP Server: {host}:{os.getenv('UDP_PORT', 6001)}")
     print(f"🗄️  Database: {os.getenv('DB_HOST')}:{os.getenv('DB_PORT', 5432)}")
-    
+
+    if split:
+        print(f"🧩 Modo multiproceso: ingesta + señalización + {os.getenv('API_WORKERS', 2)} workers del API")
+        supervise(host, http_port)
+        return
+
     # Iniciar el servidor
     uvicorn.run(
         "main:app",
@@ -34,4 +209,4 @@ def main():
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
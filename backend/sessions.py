@@ -0,0 +1,154 @@
+"""
+Registro de sesiones del servidor de señalización WebRTC.
+Mantiene los mapas directos (dispositivo -> sid, viewer -> datos, dispositivo -> viewers)
+y los índices inversos por sid, de modo que registrar, pedir un stream o
+desconectarse cuesta O(1) sin importar cuántas sesiones haya activas.
+"""
+
+import time
+from typing import Dict, Optional, Set
+
+
+class Session:
+    """Lo que un sid tiene registrado (puede ser broadcaster y viewer a la vez)"""
+
+    __slots__ = ('sid', 'device_id', 'viewer_id', 'watching', 'features', 'last_seen')
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.device_id: Optional[str] = None   # dispositivo que transmite
+        self.viewer_id: Optional[str] = None   # id con el que se registró como viewer
+        self.watching: Optional[str] = None    # dispositivo que está viendo
+        self.features: Set[str] = set()        # capacidades anunciadas por el cliente (p. ej. iceBatch)
+        self.last_seen = time.monotonic()
+
+
+class SessionRegistry:
+    """Índices de broadcasters y viewers por dispositivo, viewer y sid"""
+
+    def __init__(self):
+        self.broadcasters: Dict[str, str] = {}          # deviceId -> socketId
+        self.viewers: Dict[str, Dict] = {}              # viewerId -> { socketId, watchingDevice }
+        self.broadcaster_viewers: Dict[str, Set[str]] = {}  # deviceId -> Set[viewerSocketId]
+        self.sessions: Dict[str, Session] = {}          # socketId -> Session
+
+    def _session(self, sid):
+        session = self.sessions.get(sid)
+        if session is None:
+            session = self.sessions[sid] = Session(sid)
+        session.last_seen = time.monotonic()
+        return session
+
+    def touch(self, sid):
+        """Marca actividad de un sid registrado"""
+        session = self.sessions.get(sid)
+        if session is not None:
+            session.last_seen = time.monotonic()
+
+    def add_features(self, sid, features):
+        """Registra capacidades opcionales que el cliente anunció al registrarse"""
+        self._session(sid).features.update(features)
+
+    def supports(self, sid, feature):
+        """Si el sid (conectado a este nodo) anunció la capacidad ``feature``"""
+        session = self.sessions.get(sid)
+        return session is not None and feature in session.features
+
+    def register_broadcaster(self, sid, device_id):
+        """Asocia un dispositivo a su sid; un re-registro desde otro sid reemplaza al anterior.
+
+        Devuelve el dispositivo que este sid transmitía antes si era otro (ya no lo transmite), o None.
+        """
+        previous_sid = self.broadcasters.get(device_id)
+        if previous_sid is not None and previous_sid != sid:
+            previous = self.sessions.get(previous_sid)
+            if previous is not None and previous.device_id == device_id:
+                previous.device_id = None
+                self._drop_if_empty(previous)
+
+        session = self._session(sid)
+        replaced = None
+        if session.device_id is not None and session.device_id != device_id:
+            replaced = session.device_id
+            if self.broadcasters.get(replaced) == sid:
+                del self.broadcasters[replaced]
+                self.broadcaster_viewers.pop(replaced, None)
+        session.device_id = device_id
+        self.broadcasters[device_id] = sid
+        self.broadcaster_viewers.setdefault(device_id, set())
+        return replaced
+
+    def register_viewer(self, sid, viewer_id):
+        """Registra (o vuelve a registrar) un viewer; empieza sin dispositivo asignado"""
+        previous = self.viewers.get(viewer_id)
+        if previous is not None and previous['socketId'] != sid:
+            old_session = self.sessions.get(previous['socketId'])
+            if old_session is not None and old_session.viewer_id == viewer_id:
+                old_session.viewer_id = None
+                self._drop_if_empty(old_session)
+
+        session = self._session(sid)
+        if session.viewer_id is not None and session.viewer_id != viewer_id:
+            self.viewers.pop(session.viewer_id, None)
+        self._unwatch(session)
+        session.viewer_id = viewer_id
+        self.viewers[viewer_id] = {'socketId': sid, 'watchingDevice': None}
+
+    def watch(self, sid, device_id, broadcaster_sid=None):
+        """El sid pasa a ver ``device_id``; devuelve el sid del broadcaster o None.
+
+        ``broadcaster_sid`` permite indicar un broadcaster conectado a otro nodo.
+        """
+        broadcaster_sid = self.broadcasters.get(device_id) or broadcaster_sid
+        if broadcaster_sid is None:
+            return None
+        session = self._session(sid)
+        if session.watching != device_id:
+            self._unwatch(session)
+            session.watching = device_id
+        self.broadcaster_viewers.setdefault(device_id, set()).add(sid)
+        if session.viewer_id is not None:
+            self.viewers[session.viewer_id]['watchingDevice'] = device_id
+        return broadcaster_sid
+
+    def _unwatch(self, session):
+        if session.watching is not None:
+            self._discard_viewer(session.watching, session.sid)
+            session.watching = None
+
+    def _discard_viewer(self, device_id, sid):
+        viewers = self.broadcaster_viewers.get(device_id)
+        if viewers is not None:
+            viewers.discard(sid)
+            # El set de un broadcaster de otro nodo solo vive mientras tenga viewers aquí
+            if not viewers and device_id not in self.broadcasters:
+                del self.broadcaster_viewers[device_id]
+
+    def _drop_if_empty(self, session):
+        if session.device_id is None and session.viewer_id is None and session.watching is None:
+            self.sessions.pop(session.sid, None)
+
+    def remove(self, sid):
+        """Elimina todo lo registrado por un sid y devuelve la Session (o None)"""
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            return None
+        if session.device_id is not None and self.broadcasters.get(session.device_id) == sid:
+            del self.broadcasters[session.device_id]
+            self.broadcaster_viewers.pop(session.device_id, None)
+        if session.viewer_id is not None:
+            viewer = self.viewers.get(session.viewer_id)
+            if viewer is not None and viewer['socketId'] == sid:
+                del self.viewers[session.viewer_id]
+        # session.watching se conserva para poder avisar al broadcaster
+        if session.watching is not None:
+            self._discard_viewer(session.watching, sid)
+        return session
+
+    def stale(self, is_connected, grace):
+        """Sids registrados cuya conexión ya no existe desde hace más de ``grace`` segundos"""
+        cutoff = time.monotonic() - grace
+        return [
+            sid for sid, session in self.sessions.items()
+            if session.last_seen < cutoff and not is_connected(sid)
+        ]
@@ -0,0 +1,439 @@
+"""
+Modo SFU del servidor de video (SFU_MODE=1).
+El broadcaster publica una sola conexión hacia el servidor y el servidor reenvía
+sus frames codificados a la conexión de cada viewer, sin decodificar ni recodificar:
+el teléfono codifica y sube una vez sin importar cuántos viewers haya.
+
+La señalización no cambia. Ante el broadcaster el servidor es un viewer más, con
+id ``sfu:<deviceId>`` (recibe 'viewer-joined' y responde sus offers); ante cada
+viewer es el broadcaster (le envía el offer con ese mismo id como sender).
+
+aiortc siempre decodifica lo que recibe; aquí se sustituye la cola de su hilo
+decodificador por una que entrega los frames ensamblados (ya despaquetizados) a los
+tracks de salida como av.Packet, que RTCRtpSender solo vuelve a paquetizar.
+Depende de detalles internos de aiortc (versión fijada en requirements.txt): la cola
+del decodificador del receptor, su envío de PLI y el pedido de keyframe del sender.
+SFU_INTERNALS se comprueba al importar; si falta alguno, SFU_SUPPORTED es False y
+el servidor vuelve al modo mesh (y el detector lee el track que decodifica aiortc).
+
+Con un detector (person_detector) los frames de video codificados también van a su
+``sampler``, que decodifica solo los keyframes que analiza; con ``decoded()`` además
+vuelven al hilo decodificador de aiortc. Sin SFU_MODE el router se usa solo para eso:
+el servidor es un viewer más del broadcaster y no reenvía a nadie.
+
+Variables de entorno:
+  SFU_VIEWER_QUEUE=30          frames en cola por viewer antes de descartar hasta el próximo keyframe
+  SFU_SUBSCRIBE_TIMEOUT=10     segundos que un viewer espera a que el broadcaster publique
+"""
+
+import asyncio
+import fractions
+import logging
+import os
+import time
+
+import aiortc
+import av
+from aiortc import RTCPeerConnection, RTCRtpReceiver, RTCRtpSender, RTCSessionDescription
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
+from aiortc.sdp import SessionDescription, candidate_from_sdp
+from dotenv import load_dotenv
+
+from metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SFU_PEER_PREFIX = 'sfu:'
+SFU_VIEWER_QUEUE = int(os.getenv('SFU_VIEWER_QUEUE', 30))
+SFU_SUBSCRIBE_TIMEOUT = float(os.getenv('SFU_SUBSCRIBE_TIMEOUT', 10))
+# Como mucho un PLI por track en este intervalo, aunque varios viewers lo pidan
+KEYFRAME_REQUEST_INTERVAL = 0.5
+
+# Atributo (con name mangling) de la cola que alimenta el hilo decodificador del receptor
+DECODER_QUEUE_ATTR = '_RTCRtpReceiver__decoder_queue'
+
+
+def _missing_internals():
+    """Detalles internos de aiortc que usa el SFU y no existen en la versión instalada"""
+    missing = []
+    # La cola se crea en __init__: basta con que el constructor asigne ese nombre
+    if DECODER_QUEUE_ATTR not in RTCRtpReceiver.__init__.__code__.co_names:
+        missing.append(f'RTCRtpReceiver.{DECODER_QUEUE_ATTR}')
+    if not callable(getattr(RTCRtpReceiver, '_send_rtcp_pli', None)):
+        missing.append('RTCRtpReceiver._send_rtcp_pli')
+    if not callable(getattr(RTCRtpSender, '_send_keyframe', None)):
+        missing.append('RTCRtpSender._send_keyframe')
+    return missing
+
+
+SFU_MISSING_INTERNALS = _missing_internals()
+SFU_SUPPORTED = not SFU_MISSING_INTERNALS
+if not SFU_SUPPORTED:
+    logger.warning("⚠️ aiortc %s no tiene %s: el SFU no puede reenviar frames",
+                   getattr(aiortc, '__version__', '?'), ', '.join(SFU_MISSING_INTERNALS))
+
+SFU_FRAMES = Counter('sfu_frames_received_total', 'Frames codificados recibidos de broadcasters', ('kind',))
+SFU_DROPPED = Counter('sfu_viewer_frames_dropped_total', 'Frames descartados por viewers atrasados')
+
+
+def sfu_peer_id(device_id):
+    """Id con el que el SFU aparece en la señalización para un dispositivo"""
+    return f'{SFU_PEER_PREFIX}{device_id}'
+
+
+def is_sfu_peer(peer_id):
+    return isinstance(peer_id, str) and peer_id.startswith(SFU_PEER_PREFIX)
+
+
+def _sdp_text(sdp):
+    # Los navegadores envían {type, sdp}; se acepta también el texto SDP directo
+    return sdp.get('sdp') if isinstance(sdp, dict) else sdp
+
+
+def is_keyframe(codec_name, data):
+    """Si un frame ensamblado (salida de depayload) empieza un GOP"""
+    if codec_name == 'VP8':
+        # Bit 0 de la cabecera del frame VP8: 0 = key frame (RFC 6386, 9.1)
+        return len(data) > 0 and not data[0] & 0x01
+    if codec_name == 'H264':
+        # Flujo Annex-B: IDR (5) o SPS (7)
+        index = data.find(b'\x00\x00\x01')
+        while index != -1 and index + 3 < len(data):
+            if data[index + 3] & 0x1F in (5, 7):
+                return True
+            index = data.find(b'\x00\x00\x01', index + 3)
+        return False
+    return True
+
+
+class _EncodedFrameTap:
+    """Reemplaza la cola del hilo decodificador de un RTCRtpReceiver.
+
+    El receptor hace ``put((codec, JitterFrame))`` por cada frame ensamblado y
+    ``put(None)`` al detenerse; el hilo decodificador hace ``get()``. Los frames
+    van a ``on_frame`` y llegan al decodificador solo con ``decode``; el None
+    siempre, para que el hilo termine.
+    """
+
+    def __init__(self, original, on_frame):
+        self.original = original
+        self.on_frame = on_frame
+        self.decode = False
+
+    def put(self, item):
+        if item is None:
+            self.original.put(None)
+            return
+        self.on_frame(*item)
+        if self.decode:
+            self.original.put(item)
+
+    def get(self, *args, **kwargs):
+        return self.original.get(*args, **kwargs)
+
+
+class ForwardedTrack(MediaStreamTrack):
+    """Track de salida hacia un viewer; entrega los paquetes codificados del broadcaster"""
+
+    def __init__(self, source):
+        super().__init__()
+        self.kind = source.kind
+        self.source = source
+        self.queue = asyncio.Queue(maxsize=SFU_VIEWER_QUEUE)
+        # Un viewer de video solo puede empezar a decodificar en un keyframe
+        self.waiting_keyframe = source.kind == 'video'
+
+    def push(self, packet, keyframe):
+        if self.waiting_keyframe:
+            if not keyframe:
+                return
+            self.waiting_keyframe = False
+        if self.queue.full():
+            # Viewer atrasado: se vacía su cola y se retoma en el próximo keyframe
+            SFU_DROPPED.inc(self.queue.qsize())
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            if self.kind == 'video':
+                self.waiting_keyframe = True
+                self.source.request_keyframe()
+                return
+        self.queue.put_nowait(packet)
+
+    def end(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def recv(self):
+        packet = await self.queue.get()
+        if packet is None:
+            self.stop()
+            raise MediaStreamError
+        return packet
+
+    def stop(self):
+        super().stop()
+        self.source.subscribers.discard(self)
+
+
+class PublishedTrack:
+    """Un track del broadcaster: recibe sus frames codificados y los reparte"""
+
+    def __init__(self, receiver, kind, mime_type):
+        self.receiver = receiver
+        self.kind = kind
+        self.mime_type = mime_type
+        self.codec_name = mime_type.split('/')[-1].upper()
+        self.subscribers = set()
+        # sampler(codec_name, data, keyframe): recibe cada frame codificado (person_detector)
+        self.sampler = None
+        self._last_keyframe_request = 0.0
+        self._pli_tasks = set()  # PLI en envío (el loop solo guarda referencias débiles)
+        original = getattr(receiver, DECODER_QUEUE_ATTR, None) if SFU_SUPPORTED else None
+        if original is None:
+            # Sin la cola interna aiortc decodifica todo y no hay frames que reenviar
+            self.tap = None
+        else:
+            self.tap = _EncodedFrameTap(original, self._on_frame)
+            setattr(receiver, DECODER_QUEUE_ATTR, self.tap)
+
+    @property
+    def forwarding(self):
+        return self.tap is not None
+
+    def decoded(self):
+        """Track que decodifica aiortc en su hilo. Con ``forwarding`` los frames vuelven al
+        decodificador desde ahora y hasta ``stop_decoding()``; el primero útil es el próximo keyframe"""
+        if self.tap is not None:
+            self.tap.decode = True
+        return self.receiver.track
+
+    def stop_decoding(self):
+        if self.tap is not None:
+            self.tap.decode = False
+
+    def _on_frame(self, codec, frame):
+        SFU_FRAMES.inc(labels=(self.kind,))
+        sampler = self.sampler
+        if not self.subscribers and sampler is None:
+            return
+        keyframe = self.kind == 'video' and is_keyframe(codec.name, frame.data)
+        if sampler is not None:
+            sampler(codec.name, frame.data, keyframe)
+        if not self.subscribers:
+            return
+        packet = av.Packet(frame.data)
+        packet.pts = frame.timestamp
+        packet.time_base = fractions.Fraction(1, codec.clockRate)
+        for track in list(self.subscribers):
+            track.push(packet, keyframe)
+
+    def subscribe(self):
+        track = ForwardedTrack(self)
+        self.subscribers.add(track)
+        self.request_keyframe()
+        return track
+
+    def request_keyframe(self):
+        """Pide un keyframe al broadcaster (RTCP PLI), limitado por KEYFRAME_REQUEST_INTERVAL"""
+        if self.kind != 'video':
+            return
+        now = time.monotonic()
+        if now - self._last_keyframe_request < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self._last_keyframe_request = now
+        send_pli = getattr(self.receiver, '_send_rtcp_pli', None)
+        sources = self.receiver.getSynchronizationSources()
+        if send_pli is not None and sources:
+            task = asyncio.ensure_future(send_pli(sources[0].source))
+            self._pli_tasks.add(task)
+            task.add_done_callback(self._pli_sent)
+
+    def _pli_sent(self, task):
+        self._pli_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Error pidiendo keyframe al broadcaster: %s", task.exception())
+
+    def close(self):
+        for track in list(self.subscribers):
+            track.end()
+
+
+class Publication:
+    def __init__(self, device_id, broadcaster_sid, pc):
+        self.device_id = device_id
+        self.broadcaster_sid = broadcaster_sid
+        self.pc = pc
+        self.tracks = []
+
+
+class ViewerPeer:
+    def __init__(self, sid, device_id, pc):
+        self.sid = sid
+        self.device_id = device_id
+        self.pc = pc
+
+
+def _negotiated_mime_types(sdp):
+    """mid -> mimeType del códec elegido en una descripción SDP"""
+    mime_types = {}
+    for media in SessionDescription.parse(sdp).media:
+        codecs = [codec for codec in media.rtp.codecs if codec.name != 'rtx']
+        if codecs:
+            mime_types[media.rtp.muxId] = codecs[0].mimeType
+    return mime_types
+
+
+class SfuRouter:
+    """Conexiones del SFU: una por broadcaster publicado y una por viewer.
+
+    ``emit(event, data, room)`` es la corrutina que envía señalización a un cliente.
+    ``detector`` (opcional) muestrea el video de cada publicación.
+    """
+
+    def __init__(self, emit, detector=None):
+        self.emit = emit
+        self.detector = detector
+        self.publications = {}   # deviceId -> Publication
+        self.viewers = {}        # sid del viewer -> ViewerPeer
+        self._published = {}     # deviceId -> asyncio.Event para viewers que esperan
+
+    def _published_event(self, device_id):
+        event = self._published.get(device_id)
+        if event is None:
+            event = self._published[device_id] = asyncio.Event()
+        return event
+
+    def _watch_state(self, pc, on_failed):
+        @pc.on('connectionstatechange')
+        async def on_connectionstatechange():
+            if pc.connectionState in ('failed', 'closed'):
+                await on_failed()
+
+    async def publish(self, broadcaster_sid, device_id, sdp):
+        """Responde el offer del broadcaster dirigido a sfu:<deviceId>"""
+        await self.unpublish(device_id)
+        pc = RTCPeerConnection()
+        publication = Publication(device_id, broadcaster_sid, pc)
+        self.publications[device_id] = publication
+        self._watch_state(pc, lambda: self._drop_publication(publication))
+
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=_sdp_text(sdp), type='offer'))
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+
+        mime_types = _negotiated_mime_types(pc.localDescription.sdp)
+        for transceiver in pc.getTransceivers():
+            if transceiver.receiver and transceiver.mid in mime_types:
+                publication.tracks.append(
+                    PublishedTrack(transceiver.receiver, transceiver.kind, mime_types[transceiver.mid])
+                )
+        logger.info("📡 SFU: %s publica %d track(s)", device_id, len(publication.tracks))
+        video = [track for track in publication.tracks if track.kind == 'video']
+        if self.detector and video:
+            self.detector.watch(device_id, video[0])
+
+        await self.emit('answer', {
+            'sender': sfu_peer_id(device_id),
+            'sdp': {'type': 'answer', 'sdp': pc.localDescription.sdp}
+        }, broadcaster_sid)
+        self._published_event(device_id).set()
+
+    async def _drop_publication(self, publication):
+        if self.publications.get(publication.device_id) is publication:
+            await self.unpublish(publication.device_id)
+
+    async def unpublish(self, device_id):
+        """Cierra la publicación de un dispositivo y las conexiones de sus viewers"""
+        if device_id in self._published:
+            self._published[device_id].clear()
+        publication = self.publications.pop(device_id, None)
+        if publication is None:
+            return
+        if self.detector:
+            self.detector.unwatch(device_id)
+        for track in publication.tracks:
+            track.close()
+        for sid in [sid for sid, viewer in self.viewers.items() if viewer.device_id == device_id]:
+            await self.unsubscribe(sid)
+        await publication.pc.close()
+
+    async def subscribe(self, viewer_sid, device_id):
+        """Crea la conexión del viewer con los tracks del dispositivo y le envía el offer"""
+        if device_id not in self.publications:
+            try:
+                await asyncio.wait_for(self._published_event(device_id).wait(), SFU_SUBSCRIBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return False
+        publication = self.publications.get(device_id)
+        if publication is None or not all(track.forwarding for track in publication.tracks):
+            return False
+
+        await self.unsubscribe(viewer_sid)
+        pc = RTCPeerConnection()
+        viewer = self.viewers[viewer_sid] = ViewerPeer(viewer_sid, device_id, pc)
+        self._watch_state(pc, lambda: self._drop_viewer(viewer))
+
+        for published in publication.tracks:
+            transceiver = pc.addTransceiver(published.subscribe(), direction='sendonly')
+            # El viewer debe aceptar exactamente el códec del broadcaster (no se recodifica)
+            transceiver.setCodecPreferences([
+                codec for codec in RTCRtpSender.getCapabilities(published.kind).codecs
+                if codec.mimeType.lower() in (published.mime_type.lower(), f'{published.kind}/rtx')
+            ])
+            # Los PLI del viewer se convierten en PLI hacia el broadcaster
+            if hasattr(transceiver.sender, '_send_keyframe'):
+                transceiver.sender._send_keyframe = published.request_keyframe
+
+        offer = await pc.createOffer()
+        await pc.setLocalDescription(offer)
+        await self.emit('offer', {
+            'sender': sfu_peer_id(device_id),
+            'sdp': {'type': 'offer', 'sdp': pc.localDescription.sdp}
+        }, viewer_sid)
+        return True
+
+    async def answer(self, viewer_sid, sdp):
+        """Answer de un viewer al offer del SFU"""
+        viewer = self.viewers.get(viewer_sid)
+        if viewer is not None:
+            await viewer.pc.setRemoteDescription(RTCSessionDescription(sdp=_sdp_text(sdp), type='answer'))
+
+    async def add_ice_candidate(self, sid, device_id, candidate):
+        """Candidato ICE de un broadcaster o viewer hacia sfu:<deviceId>"""
+        publication = self.publications.get(device_id)
+        if publication is not None and publication.broadcaster_sid == sid:
+            pc = publication.pc
+        elif sid in self.viewers:
+            pc = self.viewers[sid].pc
+        else:
+            return
+        text = (candidate or {}).get('candidate')
+        if not text:
+            return  # fin de candidatos
+        ice_candidate = candidate_from_sdp(text.split(':', 1)[1] if text.startswith('candidate:') else text)
+        ice_candidate.sdpMid = candidate.get('sdpMid')
+        ice_candidate.sdpMLineIndex = candidate.get('sdpMLineIndex')
+        await pc.addIceCandidate(ice_candidate)
+
+    async def _drop_viewer(self, viewer):
+        if self.viewers.get(viewer.sid) is viewer:
+            await self.unsubscribe(viewer.sid)
+
+    async def unsubscribe(self, viewer_sid):
+        viewer = self.viewers.pop(viewer_sid, None)
+        if viewer is not None:
+            for transceiver in viewer.pc.getTransceivers():
+                if transceiver.sender.track:
+                    transceiver.sender.track.stop()
+            await viewer.pc.close()
+
+    async def close(self):
+        for device_id in list(self.publications):
+            await self.unpublish(device_id)
+        for sid in list(self.viewers):
+            await self.unsubscribe(sid)
+        if self.detector:
+            await self.detector.close()
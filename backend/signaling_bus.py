@@ -0,0 +1,197 @@
+"""
+Bus de mensajes y estado compartido entre nodos de señalización WebRTC.
+
+Con un bus configurado el servidor Socket.IO usa un client manager pub/sub: un emit
+a un sid o a una sala llega al nodo donde esté conectado ese cliente, así que
+offers, answers e ICE se enrutan aunque broadcaster y viewer estén en nodos distintos.
+El directorio de broadcasters (deviceId -> sid) se guarda en el mismo backend.
+
+Variables de entorno:
+  SIGNALING_BUS_URL=                un solo nodo (por defecto)
+  SIGNALING_BUS_URL=redis://host:6379/0
+                                    varios nodos: socketio.AsyncRedisManager + hash en Redis
+  SIGNALING_BUS_URL=local://        bus en memoria del proceso, para pruebas con varios
+                                    nodos dentro de un mismo proceso
+  SIGNALING_BUS_CHANNEL=signaling   canal pub/sub y prefijo de claves
+  SIGNALING_NODE_TTL=15             segundos sin heartbeat para dar por caído un nodo
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+import uuid
+from collections import defaultdict
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SIGNALING_BUS_URL = os.getenv('SIGNALING_BUS_URL', '')
+SIGNALING_BUS_CHANNEL = os.getenv('SIGNALING_BUS_CHANNEL', 'signaling')
+SIGNALING_NODE_TTL = float(os.getenv('SIGNALING_NODE_TTL', 15))
+
+# Estado del bus en memoria, compartido por todos los nodos del proceso
+_local_subscribers = defaultdict(list)   # canal -> colas de los managers suscritos
+_local_directories = defaultdict(dict)   # canal -> {deviceId: sid}
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """Client manager pub/sub en memoria; reparte cada mensaje a los managers del mismo canal"""
+
+    name = 'localpubsub'
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.queue = asyncio.Queue()
+        _local_subscribers[channel].append(self.queue)
+
+    async def _publish(self, data):
+        # Serializado como en los backends reales: cada nodo recibe su propia copia
+        message = pickle.dumps(data)
+        for queue in _local_subscribers[self.channel]:
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+class LocalDirectory:
+    """Directorio de broadcasters en memoria (un nodo, o varios nodos en un mismo proceso)"""
+
+    def __init__(self, entries=None):
+        self.entries = {} if entries is None else entries
+        self.node_id = uuid.uuid4().hex[:12]
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def set(self, device_id, sid):
+        self.entries[device_id] = sid
+
+    async def remove(self, device_id, sid):
+        """Borra la entrada solo si sigue apuntando a ese sid"""
+        if self.entries.get(device_id) == sid:
+            del self.entries[device_id]
+
+    async def get(self, device_id):
+        return self.entries.get(device_id)
+
+    async def all(self):
+        return list(self.entries)
+
+
+# Borrado condicional: solo si el valor no cambió desde que se leyó
+_REDIS_DELETE_IF = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+class RedisDirectory:
+    """Directorio de broadcasters en un hash de Redis: deviceId -> "sid nodo".
+
+    Cada nodo renueva una clave con TTL; las entradas de un nodo sin heartbeat se
+    ignoran y se borran al leerlas, así un nodo caído no deja broadcasters fantasma.
+    """
+
+    def __init__(self, url, channel=SIGNALING_BUS_CHANNEL, node_ttl=SIGNALING_NODE_TTL):
+        import redis.asyncio as aioredis
+
+        self.redis = aioredis.from_url(url)
+        self.key = f'{channel}:broadcasters'
+        self.node_prefix = f'{channel}:node:'
+        self.node_id = os.getenv('SIGNALING_NODE_ID') or uuid.uuid4().hex[:12]
+        self.node_ttl = node_ttl
+        self._delete_if = self.redis.register_script(_REDIS_DELETE_IF)
+        self._heartbeat = None
+
+    async def start(self):
+        await self._beat()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _beat(self):
+        await self.redis.set(self.node_prefix + self.node_id, 1, ex=max(int(self.node_ttl), 1))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.node_ttl / 3)
+            try:
+                await self._beat()
+            except Exception:
+                logger.exception("Error renovando heartbeat del nodo %s", self.node_id)
+
+    async def close(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        # Retirar los broadcasters propios sin esperar al TTL
+        for device_id, value in (await self.redis.hgetall(self.key)).items():
+            if value.decode().split(' ')[1] == self.node_id:
+                await self._delete_if(keys=[self.key], args=[device_id, value])
+        await self.redis.delete(self.node_prefix + self.node_id)
+        await self.redis.aclose()
+
+    def _value(self, sid):
+        return f'{sid} {self.node_id}'
+
+    async def set(self, device_id, sid):
+        await self.redis.hset(self.key, device_id, self._value(sid))
+
+    async def remove(self, device_id, sid):
+        await self._delete_if(keys=[self.key], args=[device_id, self._value(sid)])
+
+    async def _alive(self, nodes):
+        nodes = list(nodes)
+        if not nodes:
+            return set()
+        flags = await self.redis.mget([self.node_prefix + node for node in nodes])
+        return {node for node, flag in zip(nodes, flags) if flag is not None}
+
+    async def get(self, device_id):
+        value = await self.redis.hget(self.key, device_id)
+        if value is None:
+            return None
+        sid, node = value.decode().split(' ')
+        if node == self.node_id or node in await self._alive([node]):
+            return sid
+        await self._delete_if(keys=[self.key], args=[device_id, value])
+        return None
+
+    async def all(self):
+        entries = {
+            device_id.decode(): value.decode().split(' ')[1]
+            for device_id, value in (await self.redis.hgetall(self.key)).items()
+        }
+        alive = await self._alive(set(entries.values()) - {self.node_id}) | {self.node_id}
+        return [device_id for device_id, node in entries.items() if node in alive]
+
+
+def client_manager():
+    """Client manager de Socket.IO según SIGNALING_BUS_URL (None = el de un solo nodo)"""
+    if SIGNALING_BUS_URL.startswith(('redis://', 'rediss://')):
+        return socketio.AsyncRedisManager(SIGNALING_BUS_URL, channel=SIGNALING_BUS_CHANNEL,
+                                          logger=logging.getLogger('socketio.server'))
+    if SIGNALING_BUS_URL.startswith('local://'):
+        return LocalPubSubManager(channel=SIGNALING_BUS_CHANNEL, logger=logging.getLogger('socketio.server'))
+    if SIGNALING_BUS_URL:
+        raise ValueError(f"SIGNALING_BUS_URL no soportada: {SIGNALING_BUS_URL}")
+    return None
+
+
+def broadcaster_directory():
+    """Directorio de broadcasters compartido por los nodos del mismo bus"""
+    if SIGNALING_BUS_URL.startswith(('redis://', 'rediss://')):
+        return RedisDirectory(SIGNALING_BUS_URL)
+    if SIGNALING_BUS_URL.startswith('local://'):
+        return LocalDirectory(_local_directories[SIGNALING_BUS_CHANNEL])
+    return LocalDirectory()
@@ -0,0 +1,160 @@
+"""
+Tiles de densidad para el mapa de calor (/api/tiles/{z}/{x}/{y}).
+Cada tile (Web Mercator, mismo esquema z/x/y que OpenStreetMap) se divide en una
+rejilla de TILE_GRID x TILE_GRID celdas; la base de datos agrega por celda el número
+de puntos o el tiempo de permanencia (dwell) de los dispositivos pedidos en el rango.
+El navegador ya no descarga los puntos crudos de /api/location/range.
+
+Los tiles calculados se guardan en disco con una clave (tile, filtro, marca de agua):
+la marca de agua es la suma de los contadores de cambios de los días y celdas de
+1 grado que cubre el tile (Database.get_tile_watermark), que suben la ingesta y el
+archivado. Una fila que llega después, aunque sea de un lote atrasado o se confirme con
+un id menor que otras, cambia la clave y el tile se recalcula; una vista repetida se
+sirve del archivo sin recorrer location_data. La clave es también el ETag.
+
+Variables de entorno:
+  TILE_CACHE_DIR=./tile_cache   directorio de la caché ('' = sin caché en disco)
+  TILE_CACHE_MAX_MB=512         tamaño máximo; se borran los tiles usados hace más tiempo
+  TILE_GRID=64                  celdas por lado de cada tile (máximo 256)
+  TILE_DWELL_MAX_GAP_S=300      huecos más largos entre puntos no suman permanencia (como los recorridos)
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+
+from dotenv import load_dotenv
+
+from metrics import Counter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', './tile_cache')
+TILE_CACHE_MAX_MB = float(os.getenv('TILE_CACHE_MAX_MB', 512))
+TILE_GRID = int(os.getenv('TILE_GRID', 64))
+TILE_DWELL_MAX_GAP_S = float(os.getenv('TILE_DWELL_MAX_GAP_S', 300))
+
+TILE_METRICS = ('count', 'dwell')
+MAX_ZOOM = 22
+# Latitud límite de Web Mercator
+MAX_LATITUDE = 85.05112878
+
+TILE_REQUESTS = Counter('tile_requests_total', 'Tiles de densidad servidos por origen', ('source',))
+
+
+def tile_bounds(z, x, y):
+    """(oeste, sur, este, norte) en grados de un tile z/x/y"""
+    n = 2 ** z
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def validate_tile(z, x, y, grid, metric):
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"z debe estar entre 0 y {MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError("x e y deben estar entre 0 y 2^z - 1")
+    if not 1 <= grid <= 256:
+        raise ValueError("grid debe estar entre 1 y 256")
+    if metric not in TILE_METRICS:
+        raise ValueError(f"metric debe ser uno de {', '.join(TILE_METRICS)}")
+
+
+def tile_key(z, x, y, grid, metric, start_time, end_time, device_ids, watermark):
+    """Nombre del archivo en caché; mismos parámetros y datos -> misma clave"""
+    devices = ','.join(sorted(set(device_ids or ())))
+    text = f'{z}/{x}/{y}|{grid}|{metric}|{start_time}|{end_time}|{devices}|{watermark}'
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class TileCache:
+    """Tiles serializados en archivos ``<clave>.json``; la fecha de modificación hace de último uso"""
+
+    def __init__(self, directory=TILE_CACHE_DIR, max_mb=TILE_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.size = None   # bytes en disco, calculado en la primera poda
+        self._pruning = False
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return content
+
+    def _write(self, key, content):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(content)
+        # Reemplazo atómico: otro worker nunca lee un archivo a medio escribir
+        os.replace(temporary, path)
+
+    def _prune(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total > self.max_bytes:
+            entries.sort()
+            # Bajar al 90 % para no podar en cada escritura
+            for _, size, path in entries:
+                if total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        return total
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._read, key)
+
+    async def put(self, key, content):
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, content)
+        except OSError as e:
+            logger.warning("⚠️ No se pudo guardar el tile en caché: %s", e)
+            return
+        if self.size is not None:
+            self.size += len(content)
+        if (self.size is None or self.size > self.max_bytes) and not self._pruning:
+            self._pruning = True
+            try:
+                self.size = await asyncio.to_thread(self._prune)
+            finally:
+                self._pruning = False
+
+
+tile_cache = TileCache()
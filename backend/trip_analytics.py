@@ -0,0 +1,205 @@
+"""
+Analítica de recorridos de un dispositivo: distancia, tiempo en movimiento, paradas,
+tramos (trips) y perfil de velocidades, por día y para todo el rango.
+La base de datos devuelve la ventana como columnas (array_agg), que se convierten
+directamente en arreglos de NumPy; todos los cálculos son vectorizados sobre los
+pasos entre puntos consecutivos, sin lazos de Python por punto.
+
+Definiciones:
+  - paso: de un punto al siguiente; distancia haversine y dt en segundos
+  - hueco: paso con dt > ANALYTICS_GAP_S (mismo corte de 5 min que los recorridos de area-records);
+    no suma distancia ni tiempo
+  - salto: velocidad del paso > ANALYTICS_MAX_SPEED_MPS (error de GPS); no suma distancia
+  - distancias y tiempos en movimiento excluyen las paradas (el ruido del GPS de un dispositivo quieto)
+  - parada: tramo continuo con velocidad suavizada < ANALYTICS_STOP_SPEED_MPS que dura al menos
+    ANALYTICS_STOP_MIN_S
+  - trip: tramo entre paradas y huecos con al menos TRIP_MIN_DISTANCE_M recorridos
+
+Variables de entorno:
+  ANALYTICS_GAP_S=300
+  ANALYTICS_STOP_SPEED_MPS=0.5
+  ANALYTICS_STOP_MIN_S=120
+  ANALYTICS_MAX_SPEED_MPS=70
+  ANALYTICS_STOP_WINDOW_S=60    ventana de la velocidad suavizada con que se detectan las paradas
+  ANALYTICS_MAX_POINTS=5000000  puntos máximos por consulta
+"""
+
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANALYTICS_GAP_S = float(os.getenv('ANALYTICS_GAP_S', 300))
+ANALYTICS_STOP_SPEED_MPS = float(os.getenv('ANALYTICS_STOP_SPEED_MPS', 0.5))
+ANALYTICS_STOP_MIN_S = float(os.getenv('ANALYTICS_STOP_MIN_S', 120))
+ANALYTICS_MAX_SPEED_MPS = float(os.getenv('ANALYTICS_MAX_SPEED_MPS', 70))
+ANALYTICS_STOP_WINDOW_S = float(os.getenv('ANALYTICS_STOP_WINDOW_S', 60))
+ANALYTICS_MAX_POINTS = int(os.getenv('ANALYTICS_MAX_POINTS', 5_000_000))
+
+TRIP_MIN_DISTANCE_M = 50
+EARTH_RADIUS_M = 6_371_008.8
+# Límites de los intervalos del perfil de velocidades (km/h)
+SPEED_BINS_KMH = np.array([0, 5, 10, 20, 30, 40, 50, 60, 80, 100, 130, np.inf])
+DAY_MS = 86_400_000
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Distancia en metros entre arreglos de puntos (grados)"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def runs(mask):
+    """Inicios y fines (exclusivos) de los tramos consecutivos en True"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def _cumulative(values):
+    return np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+
+
+def _run_sums(cumulative, starts, ends):
+    return cumulative[ends] - cumulative[starts]
+
+
+def _window_speed(timestamps, latitudes, longitudes, gap, window_s):
+    """Velocidad de cada paso como desplazamiento neto en una ventana de ~window_s centrada en él.
+
+    El desplazamiento neto (no la suma de pasos) no crece con el ruido del GPS de un
+    dispositivo quieto. La ventana no cruza huecos.
+    """
+    half_ms = window_s * 500
+    # Primer y último punto del tramo entre huecos al que pertenece cada punto
+    starts = np.concatenate(([0], np.flatnonzero(gap) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(timestamps)])))
+    segment_first = np.repeat(starts, lengths)
+    segment_last = np.repeat(starts + lengths - 1, lengths)
+    low = np.maximum(np.searchsorted(timestamps, timestamps - half_ms, side='left'), segment_first)
+    high = np.minimum(np.searchsorted(timestamps, timestamps + half_ms, side='right') - 1, segment_last)
+    # Paso i (puntos i, i+1): desde el inicio de la ventana de i hasta el final de la de i+1
+    low, high = low[:-1], high[1:]
+    displacement = haversine(latitudes[low], longitudes[low], latitudes[high], longitudes[high])
+    return displacement / ((timestamps[high] - timestamps[low]) / 1000.0)
+
+
+def analyze(timestamps, latitudes, longitudes, tz_offset_minutes=0):
+    """Analítica de una pista ordenada por tiempo (timestamps en ms)"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+
+    # Puntos con el mismo timestamp: queda el primero
+    if len(timestamps) > 1:
+        keep = np.concatenate(([True], np.diff(timestamps) > 0))
+        timestamps, latitudes, longitudes = timestamps[keep], latitudes[keep], longitudes[keep]
+    result = {
+        'points': int(len(timestamps)),
+        'summary': {'distance_m': 0.0, 'moving_s': 0.0, 'stopped_s': 0.0, 'max_speed_mps': 0.0, 'avg_moving_speed_mps': 0.0},
+        'days': [],
+        'trips': [],
+        'stops': [],
+        'speed_profile': {'bins_kmh': SPEED_BINS_KMH[:-1].tolist(), 'seconds': [0.0] * (len(SPEED_BINS_KMH) - 1)},
+    }
+    if len(timestamps) < 2:
+        return result
+
+    seconds = np.diff(timestamps) / 1000.0
+    distance = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+    speed = distance / seconds
+    gap = seconds > ANALYTICS_GAP_S
+    jump = speed > ANALYTICS_MAX_SPEED_MPS
+    counted = ~gap & ~jump
+    distance = np.where(counted, distance, 0.0)
+    seconds = np.where(gap, 0.0, seconds)
+    speed = np.where(counted, speed, 0.0)
+
+    # Paradas: tramos lentos (velocidad suavizada, para ignorar el ruido del GPS) y largos
+    smooth = _window_speed(timestamps, latitudes, longitudes, gap, ANALYTICS_STOP_WINDOW_S)
+    slow_starts, slow_ends = runs((smooth < ANALYTICS_STOP_SPEED_MPS) & ~gap)
+    seconds_sum = _cumulative(seconds)
+    slow_seconds = _run_sums(seconds_sum, slow_starts, slow_ends)
+    is_stop = slow_seconds >= ANALYTICS_STOP_MIN_S
+    stop_starts, stop_ends = slow_starts[is_stop], slow_ends[is_stop]
+    stopped = np.zeros(len(distance), dtype=bool)
+    if len(stop_starts):
+        # Marcar los pasos de cada parada con +1/-1 en los bordes y suma acumulada
+        marks = np.zeros(len(distance) + 1, dtype=np.int64)
+        np.add.at(marks, stop_starts, 1)
+        np.add.at(marks, stop_ends, -1)
+        stopped = np.cumsum(marks[:-1]) > 0
+    moving = ~stopped & ~gap
+    moving_speed = np.where(moving, speed, 0.0)
+
+    # Paradas: centroide de los puntos del tramo (los pasos [s, e) cubren los puntos s..e)
+    lat_sum, lng_sum = _cumulative(latitudes), _cumulative(longitudes)
+    counts = stop_ends - stop_starts + 1
+    stop_lat = (lat_sum[stop_ends + 1] - lat_sum[stop_starts]) / counts
+    stop_lng = (lng_sum[stop_ends + 1] - lng_sum[stop_starts]) / counts
+    result['stops'] = [
+        {'start_time': int(start), 'end_time': int(end), 'duration_s': round(float(duration), 1),
+         'latitude': round(float(lat), 7), 'longitude': round(float(lng), 7), 'points': int(count)}
+        for start, end, duration, lat, lng, count in zip(
+            timestamps[stop_starts], timestamps[stop_ends], slow_seconds[is_stop], stop_lat, stop_lng, counts
+        )
+    ]
+
+    # Trips: tramos en movimiento entre paradas y huecos
+    trip_starts, trip_ends = runs(moving)
+    distance_sum = _cumulative(distance)
+    trip_distance = _run_sums(distance_sum, trip_starts, trip_ends)
+    trip_seconds = _run_sums(seconds_sum, trip_starts, trip_ends)
+    # reduceat llega hasta el inicio del siguiente trip: los pasos sin movimiento cuentan como 0
+    trip_max = np.maximum.reduceat(moving_speed, trip_starts) if len(trip_starts) else np.array([])
+    keep = trip_distance >= TRIP_MIN_DISTANCE_M
+    result['trips'] = [
+        {'start_time': int(start), 'end_time': int(end), 'distance_m': round(float(dist), 1),
+         'duration_s': round(float(duration), 1), 'max_speed_mps': round(float(top), 2),
+         'avg_speed_mps': round(float(dist / duration), 2) if duration > 0 else 0.0}
+        for start, end, dist, duration, top in zip(
+            timestamps[trip_starts[keep]], timestamps[trip_ends[keep]],
+            trip_distance[keep], trip_seconds[keep], trip_max[keep]
+        )
+    ]
+
+    # Resumen y perfil de velocidades (tiempo en movimiento por intervalo de velocidad)
+    moving_distance = float(distance[moving].sum())
+    moving_seconds = float(seconds[moving].sum())
+    result['summary'] = {
+        'distance_m': round(moving_distance, 1),
+        'moving_s': round(moving_seconds, 1),
+        'stopped_s': round(float(seconds[stopped].sum()), 1),
+        'max_speed_mps': round(float(moving_speed.max()), 2),
+        'avg_moving_speed_mps': round(moving_distance / moving_seconds, 2) if moving_seconds > 0 else 0.0,
+    }
+    profile, _ = np.histogram(speed[moving] * 3.6, bins=SPEED_BINS_KMH, weights=seconds[moving])
+    result['speed_profile']['seconds'] = np.round(profile, 1).tolist()
+
+    # Por día (hora local con tz_offset_minutes): cada paso cuenta en el día de su punto inicial
+    day = (timestamps[:-1] + tz_offset_minutes * 60_000) // DAY_MS
+    days, first = np.unique(day, return_index=True)
+    day_index = np.searchsorted(days, day)
+    per_day = {
+        'distance_m': np.bincount(day_index, weights=np.where(moving, distance, 0.0), minlength=len(days)),
+        'moving_s': np.bincount(day_index, weights=np.where(moving, seconds, 0.0), minlength=len(days)),
+        'stopped_s': np.bincount(day_index, weights=np.where(stopped, seconds, 0.0), minlength=len(days)),
+    }
+    day_max = np.maximum.reduceat(moving_speed, first)
+    trips_per_day = np.bincount(day_index[trip_starts[keep]], minlength=len(days))
+    result['days'] = [
+        {
+            'date': str(np.datetime64(int(value), 'D')),
+            'distance_m': round(float(per_day['distance_m'][i]), 1),
+            'moving_s': round(float(per_day['moving_s'][i]), 1),
+            'stopped_s': round(float(per_day['stopped_s'][i]), 1),
+            'max_speed_mps': round(float(day_max[i]), 2),
+            'trips': int(trips_per_day[i]),
+        }
+        for i, value in enumerate(days)
+    ]
+    return result
@@ -2,11 +2,24 @@ import asyncio
 import socket
 import json
 import os
+import time
 from dotenv import load_dotenv
 
+from ingest import INGEST_FIXES, InvalidFix, as_message, normalize_fix, publish_position, recent_fixes
+from log_config import hot_path_logger
+from metrics import Counter, Gauge, Histogram
+
 # Cargar variables de entorno
 load_dotenv()
 
+logger = hot_path_logger('udp.ingest')
+
+UDP_DATAGRAMS = Counter('udp_datagrams_total', 'Datagramas UDP recibidos')
+UDP_PARSE_FAILURES = Counter('udp_parse_failures_total', 'Datagramas UDP con JSON inválido')
+UDP_INSERT_ERRORS = Counter('udp_insert_errors_total', 'Errores insertando ubicaciones recibidas por UDP')
+UDP_INSERT_SECONDS = Histogram('udp_insert_duration_seconds', 'Latencia de inserción de una ubicación UDP')
+UDP_IN_FLIGHT = Gauge('udp_messages_in_flight', 'Mensajes UDP en procesamiento')
+
 class UDPServer:
     def __init__(self, database):  # ✅ Recibe db como parámetro
         self.transport = None
@@ -19,29 +32,55 @@ class UDPServer:
         
     def datagram_received(self, data, addr):
         """Procesa los mensajes UDP recibidos"""
+        UDP_DATAGRAMS.inc()
         asyncio.create_task(self.process_message(data, addr))
         
     async def process_message(self, data, addr):
         """Procesa el mensaje UDP de forma asíncrona"""
-        print(f"UDP mensaje recibido de {addr[0]}:{addr[1]}")
+        logger.debug("UDP mensaje recibido de %s:%s", addr[0], addr[1])
+        UDP_IN_FLIGHT.inc()
         
+        record = None
         try:
-            # Parsear el mensaje JSON
-            message = json.loads(data.decode())
+            # Parsear y validar el mensaje JSON (misma normalización que /api/location/bulk)
+            record = normalize_fix(json.loads(data.decode()))
+            if recent_fixes.seen(record[7], record[2]):
+                INGEST_FIXES.inc(labels=('udp', 'duplicate'))
+                logger.debug("Posición repetida de %s descartada", record[7])
+                return
             
             # Insertar en la base de datos
-            location_id = await self.db.insert_location(message)  # ✅ Usa self.db
-            print(f"Datos insertados: {location_id}")
+            start = time.perf_counter()
+            inserted = await self.db.insert_location(as_message(record))  # ✅ Usa self.db
+            UDP_INSERT_SECONDS.observe(time.perf_counter() - start)
+            if inserted is None:
+                # Ya guardada por otro proceso o por /api/location/bulk
+                INGEST_FIXES.inc(labels=('udp', 'duplicate'))
+                return
+            INGEST_FIXES.inc(labels=('udp', 'inserted'))
+            logger.debug("Datos insertados: %s", inserted['id'])
+
+            # Caché de últimas posiciones y demás consumidores en vivo (también en otros procesos),
+            # salvo que el dispositivo ya tenga guardada una posición más nueva
+            if inserted.pop('is_latest'):
+                publish_position(inserted)
             
-        except json.JSONDecodeError as e:
-            print(f"Error parseando JSON: {e}")
-        except Exception as e:
-            print(f"Error procesando mensaje UDP: {e}")
-            import traceback
-            traceback.print_exc()  # ✅ Para ver el error completo
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            UDP_PARSE_FAILURES.inc()
+            logger.info("Error parseando JSON: %s", e, extra={'src': addr[0]})
+        except InvalidFix as e:
+            INGEST_FIXES.inc(labels=('udp', 'invalid'))
+            logger.info("Posición inválida: %s", e, extra={'src': addr[0]})
+        except Exception:
+            if record is not None:
+                recent_fixes.forget(record[7], record[2])
+            UDP_INSERT_ERRORS.inc()
+            logger.exception("Error procesando mensaje UDP")
+        finally:
+            UDP_IN_FLIGHT.dec()
             
     def error_received(self, exc):
-        print(f"Error en UDP Server: {exc}")
+        logger.error("Error en UDP Server: %s", exc)
 
 class UDPProtocol(asyncio.DatagramProtocol):
     def __init__(self, database):  # ✅ Recibe db como parámetro
@@ -8,17 +8,29 @@ from aiohttp import web
 import socketio
 import aiohttp
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from log_config import hot_path_logger, setup_logging
+import metrics
+from detections import ALL_DEVICES_ROOM, DetectionThrottle, device_room
+from ice_batch import ICE_BATCH_MS, IceBatcher
+from live import hub
+from metrics import Counter, Gauge
+from person_detector import SERVER_DETECTION
+from sessions import SessionRegistry
+import signaling_bus
 
-# ⭐ URLs de los otros servidores (si tienes múltiples servidores) ⭐
-OTHER_SERVERS = []
+logger = logging.getLogger(__name__)
+# Categorías del camino caliente (un mensaje por evento), limitadas por tasa
+relay_logger = hot_path_logger('webrtc.relay')
+detection_logger = hot_path_logger('webrtc.detection')
 
 # Configurar Socket.IO
+# Con SIGNALING_BUS_URL varios nodos comparten clientes a través del bus (ver signaling_bus)
 sio = socketio.AsyncServer(
     async_mode='aiohttp',
+    client_manager=signaling_bus.client_manager(),
     cors_allowed_origins='*',
-    logger=True,
+    # Con un logger propio python-socketio no añade su StreamHandler síncrono
+    logger=logging.getLogger('socketio.server'),
     engineio_logger=False
 )
 
@@ -26,76 +38,168 @@ app = web.Application()
 sio.attach(app)
 
 # ⭐ ESTRUCTURAS DE DATOS MEJORADAS ⭐
-active_broadcasters: Dict[str, str] = {}  # deviceId -> socketId
-active_viewers: Dict[str, Dict] = {}      # viewerId -> { socketId, watchingDevice }
+# El registro mantiene además índices por sid; los dicts se exponen con sus nombres de siempre
+registry = SessionRegistry()
+active_broadcasters: Dict[str, str] = registry.broadcasters  # deviceId -> socketId
+active_viewers: Dict[str, Dict] = registry.viewers           # viewerId -> { socketId, watchingDevice }
 # ⭐ NUEVO: Rastrear viewers por broadcaster ⭐
-broadcaster_viewers: Dict[str, Set[str]] = {}  # deviceId -> Set[viewerSocketId]
+broadcaster_viewers: Dict[str, Set[str]] = registry.broadcaster_viewers  # deviceId -> Set[viewerSocketId]
+# Broadcasters de todos los nodos (deviceId -> sid); los locales están además en active_broadcasters
+directory = signaling_bus.broadcaster_directory()
+
+# Modo SFU: el broadcaster publica una vez hacia el servidor, que reenvía a cada viewer.
+# La publicación vive en el nodo del broadcaster; con varios nodos sus viewers deben
+# llegar a ese mismo nodo (afinidad por dispositivo en el balanceador)
+SFU_MODE = os.getenv('SFU_MODE', '0') == '1'
+# Con SERVER_DETECTION=1 (ver person_detector) el servidor recibe además el video de cada
+# broadcaster para contar personas; sin SFU_MODE eso es una subida más desde el teléfono
+
+# Barrido de sesiones cuyo disconnect nunca llegó (p. ej. caída del worker de engine.io)
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', 30))
+SESSION_STALE_GRACE = float(os.getenv('SESSION_STALE_GRACE', 60))
+
+SIGNALING_EVENTS = Counter('signaling_events_total', 'Eventos Socket.IO recibidos por tipo', ('event',))
+
+
+def _socketio_counts():
+    """Conexiones y salas del namespace por defecto (se calcula al exportar)"""
+    rooms = sio.manager.rooms.get('/', {})
+    connected = rooms.get(None, {})
+    # Cada sid tiene además una sala propia con su nombre; no cuentan como salas
+    named_rooms = sum(1 for room in rooms if room is not None and room not in connected)
+    return {('connections',): len(connected), ('rooms',): named_rooms}
+
+
+Gauge('socketio_sessions', 'Conexiones y salas Socket.IO activas', ('kind',), callback=_socketio_counts)
+ICE_RELAY_MESSAGES = Counter('ice_relay_messages_total', 'Mensajes ICE reenviados por tipo', ('kind',))
+SESSIONS_EXPIRED = Counter('webrtc_sessions_expired_total', 'Sesiones eliminadas por el barrido de inactivas')
+Gauge('webrtc_active_peers', 'Broadcasters y viewers registrados', ('role',),
+      callback=lambda: {('broadcaster',): len(active_broadcasters), ('viewer',): len(active_viewers)})
 
 @sio.event
 async def connect(sid, environ):
     """Cliente se conecta"""
+    SIGNALING_EVENTS.inc(labels=('connect',))
     logger.info(f"🔌 Cliente conectado: {sid}")
     await sio.emit('connection_status', {'status': 'connected'}, room=sid)
 
 @sio.event
 async def disconnect(sid):
     """Cliente se desconecta"""
+    SIGNALING_EVENTS.inc(labels=('disconnect',))
     logger.info(f"❌ Cliente desconectado: {sid}")
     
+    await _release_session(sid)
+
+
+async def _release_session(sid):
+    """Quita un sid del registro y avisa a quien corresponda"""
+    session = registry.remove(sid)
+    if session is None:
+        return
+
     # Limpiar broadcaster si es uno
-    for device_id, broadcaster_sid in list(active_broadcasters.items()):
-        if broadcaster_sid == sid:
-            del active_broadcasters[device_id]
-            
-            # ⭐ NUEVO: Limpiar viewers asociados ⭐
-            if device_id in broadcaster_viewers:
-                del broadcaster_viewers[device_id]
-            
-            await sio.emit('broadcaster-disconnected', {
-                'deviceId': device_id
-            })
-            logger.info(f"📱 Broadcaster {device_id} desconectado")
-            break
-
-    # Limpiar viewer si es unoo
-    for viewer_id, viewer_data in list(active_viewers.items()):
-        if viewer_data['socketId'] == sid:
-            watching_device = viewer_data.get('watchingDevice')
-            
-            # ⭐ NUEVO: Notificar al broadcaster que el viewer se desconectó ⭐
-            if watching_device and watching_device in active_broadcasters:
-                broadcaster_sid = active_broadcasters[watching_device]
-                await sio.emit('viewer-disconnected', {
-                    'viewerId': sid
-                }, room=broadcaster_sid)
-                logger.info(f"📤 Notificado a broadcaster {watching_device} que viewer {sid} se desconectó")
-                
-                # Remover de la lista de viewers del broadcaster
-                if watching_device in broadcaster_viewers:
-                    broadcaster_viewers[watching_device].discard(sid)
-            
-            del active_viewers[viewer_id]
-            logger.info(f"🖥️ Viewer {viewer_id} desconectado")
-            break
+    if session.device_id is not None and session.device_id not in active_broadcasters:
+        await _retire_broadcaster(session.device_id, sid)
+
+    if sfu:
+        # En modo SFU el broadcaster no conoce a los viewers; solo se cierra su conexión
+        await sfu.unsubscribe(sid)
+
+    # ⭐ NUEVO: Notificar al broadcaster que el viewer se desconectó ⭐
+    watching_device = session.watching
+    broadcaster_sid = not SFU_MODE and watching_device and await _find_broadcaster(watching_device)
+    if broadcaster_sid:
+        await sio.emit('viewer-disconnected', {
+            'viewerId': sid
+        }, room=broadcaster_sid)
+        logger.info(f"📤 Notificado a broadcaster {watching_device} que viewer {sid} se desconectó")
+
+    if session.viewer_id is not None:
+        logger.info(f"🖥️ Viewer {session.viewer_id} desconectado")
+
+
+async def _retire_broadcaster(device_id, sid):
+    """Un dispositivo deja de transmitir desde ``sid``: directorio, clientes y SFU"""
+    await directory.remove(device_id, sid)
+    await sio.emit('broadcaster-disconnected', {
+        'deviceId': device_id
+    })
+    detection_throttle.forget(device_id)
+    if sfu:
+        await sfu.unpublish(device_id)
+    logger.info(f"📱 Broadcaster {device_id} desconectado")
+
+
+def _watching(sid):
+    """Dispositivo que está viendo un sid, o None"""
+    session = registry.sessions.get(sid)
+    return session.watching if session is not None else None
+
+
+async def _find_broadcaster(device_id):
+    """Sid del broadcaster de un dispositivo, en este nodo o en otro"""
+    return active_broadcasters.get(device_id) or await directory.get(device_id)
+
+
+async def _sweep_stale_sessions():
+    """Elimina periódicamente sesiones registradas cuya conexión ya no existe"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        stale = registry.stale(lambda sid: sio.manager.is_connected(sid, '/'), SESSION_STALE_GRACE)
+        for sid in stale:
+            SESSIONS_EXPIRED.inc()
+            await _release_session(sid)
+        if stale:
+            logger.info("🧹 %d sesiones inactivas eliminadas", len(stale))
+
+
+async def _start_background(app):
+    await directory.start()
+    app['session_sweeper'] = asyncio.create_task(_sweep_stale_sessions())
+
+
+async def _stop_background(app):
+    app['session_sweeper'].cancel()
+    if sfu:
+        await sfu.close()
+    await directory.close()
+
+
+def _register_features(sid, data):
+    # Capacidades opcionales; los clientes que no las anuncian reciben el protocolo original
+    if data.get('iceBatch'):
+        registry.add_features(sid, ('iceBatch',))
+
 
 # ⭐ NUEVO: ANDROID SE REGISTRA COMO BROADCASTER ⭐
 @sio.event
 async def register_broadcaster(sid, data):
     """Android se registra como broadcaster"""
+    SIGNALING_EVENTS.inc(labels=('register_broadcaster',))
     device_id = data.get('deviceId')
     logger.info(f"📱 Broadcaster registrado: {device_id} (sid: {sid})")
     
-    active_broadcasters[device_id] = sid
-    
-    # ⭐ NUEVO: Inicializar set de viewers para este broadcaster ⭐
-    if device_id not in broadcaster_viewers:
-        broadcaster_viewers[device_id] = set()
+    # ⭐ NUEVO: Inicializa también el set de viewers para este broadcaster ⭐
+    replaced = registry.register_broadcaster(sid, device_id)
+    if replaced is not None and replaced not in active_broadcasters:
+        # El mismo sid ahora transmite otro dispositivo
+        await _retire_broadcaster(replaced, sid)
+    _register_features(sid, data)
+    await directory.set(device_id, sid)
     
     # Notificar a todos los clientes web que hay un nuevo broadcaster
     await sio.emit('broadcaster-available', {
         'deviceId': device_id
     })
     
+    if sfu:
+        # El SFU se presenta como un viewer más: el broadcaster le enviará su offer
+        await sio.emit('viewer-joined', {
+            'viewerId': sfu_peer_id(device_id),
+            'socketId': sfu_peer_id(device_id)
+        }, room=sid)
+    
     logger.info(f"✅ Broadcaster {device_id} listo para transmitir")
     
 # Alias para compatibilidad con guiones
@@ -105,16 +209,19 @@ sio.on('register-broadcaster', register_broadcaster)
 @sio.event
 async def register_viewer(sid, data):
     """Navegador se registra como viewer"""
+    SIGNALING_EVENTS.inc(labels=('register_viewer',))
     viewer_id = data.get('viewerId')
     logger.info(f"🖥️ Viewer registrado: {viewer_id} (sid: {sid})")
     
-    active_viewers[viewer_id] = {
-        'socketId': sid,
-        'watchingDevice': None
-    }
+    # Un re-registro deja de ver el dispositivo anterior y sus detecciones
+    previous_device = _watching(sid)
+    registry.register_viewer(sid, viewer_id)
+    if previous_device is not None:
+        await sio.leave_room(sid, device_room(previous_device))
+    _register_features(sid, data)
     
     # Enviar lista de broadcasters disponibles
-    available_devices = list(active_broadcasters.keys())
+    available_devices = await directory.all()
     await sio.emit('available-broadcasters', available_devices, room=sid)
     
     logger.info(f"📡 Enviados {len(available_devices)} dispositivos disponibles a {viewer_id}")
@@ -126,25 +233,31 @@ sio.on('register-viewer', register_viewer)
 @sio.event
 async def request_stream(sid, data):
     """Navegador solicita stream de un dispositivo"""
+    SIGNALING_EVENTS.inc(labels=('request_stream',))
     device_id = data.get('deviceId')
-    broadcaster_sid = active_broadcasters.get(device_id)
     
     logger.info(f"📡 Viewer {sid} solicita stream de {device_id}")
     
+    # Actualiza qué dispositivo está viendo y lo agrega al set del broadcaster
+    previous_device = _watching(sid)
+    broadcaster_sid = registry.watch(sid, device_id, await _find_broadcaster(device_id))
     if broadcaster_sid:
-        # Actualizar qué dispositivo está viendo
-        for viewer_id, viewer_data in active_viewers.items():
-            if viewer_data['socketId'] == sid:
-                viewer_data['watchingDevice'] = device_id
-                break
-        
-        # ⭐ NUEVO: Agregar viewer al set del broadcaster ⭐
-        if device_id not in broadcaster_viewers:
-            broadcaster_viewers[device_id] = set()
-        broadcaster_viewers[device_id].add(sid)
+        # Quien ve el stream recibe también las detecciones de ese dispositivo (y ya no
+        # las del que veía antes)
+        if previous_device is not None and previous_device != device_id:
+            await sio.leave_room(sid, device_room(previous_device))
+        await sio.enter_room(sid, device_room(device_id))
         
         logger.info(f"📊 Viewers activos para {device_id}: {len(broadcaster_viewers[device_id])}")
         
+        if SFU_MODE:
+            # El SFU le envía el offer con los tracks ya publicados por el broadcaster
+            if not await sfu.subscribe(sid, device_id):
+                await sio.emit('error', {
+                    'message': f'Device {device_id} not publishing'
+                }, room=sid)
+            return
+        
         # Notificar al broadcaster (Android) que hay un nuevo viewer
         await sio.emit('viewer-joined', {
             'viewerId': sid,
@@ -165,11 +278,20 @@ sio.on('request-stream', request_stream)
 @sio.event
 async def offer(sid, data):
     """Retransmitir offer de Android a Navegador"""
+    SIGNALING_EVENTS.inc(labels=('offer',))
+    registry.touch(sid)
     target = data.get('target')
     sdp = data.get('sdp')
     
-    logger.info(f"📨 Retransmitiendo OFFER de {sid} a {target}")
+    relay_logger.info("📨 Retransmitiendo OFFER de %s a %s", sid, target)
     
+    if sfu and is_sfu_peer(target):
+        await sfu.publish(sid, target[len(SFU_PEER_PREFIX):], sdp)
+        return
+    
+    # Los candidatos pendientes del mismo par van antes que la nueva descripción
+    if ice_batcher:
+        await ice_batcher.flush(sid, target)
     await sio.emit('offer', {
         'sender': sid,
         'sdp': sdp
@@ -179,11 +301,19 @@ async def offer(sid, data):
 @sio.event
 async def answer(sid, data):
     """Retransmitir answer de Navegador a Android"""
+    SIGNALING_EVENTS.inc(labels=('answer',))
+    registry.touch(sid)
     target = data.get('target')
     sdp = data.get('sdp')
     
-    logger.info(f"📨 Retransmitiendo ANSWER de {sid} a {target}")
+    relay_logger.info("📨 Retransmitiendo ANSWER de %s a %s", sid, target)
+    
+    if sfu and is_sfu_peer(target):
+        await sfu.answer(sid, sdp)
+        return
     
+    if ice_batcher:
+        await ice_batcher.flush(sid, target)
     # ⭐ NUEVO: Incluir el sender ID para que Android sepa de qué viewer viene ⭐
     await sio.emit('answer', {
         'sender': sid,
@@ -191,47 +321,154 @@ async def answer(sid, data):
     }, room=target)
 
 # ⭐ MODIFICADO: RETRANSMITIR ICE CANDIDATES ⭐
+async def _deliver_ice(sender, target, candidates):
+    """Entrega candidatos: en un solo mensaje si el destino lo soporta, uno a uno si no"""
+    if len(candidates) > 1 and registry.supports(target, 'iceBatch'):
+        ICE_RELAY_MESSAGES.inc(labels=('batch',))
+        await sio.emit('ice-candidates', {
+            'sender': sender,
+            'candidates': candidates
+        }, room=target)
+        return
+    for candidate in candidates:
+        ICE_RELAY_MESSAGES.inc(labels=('single',))
+        # ⭐ NUEVO: Incluir el sender ID para que Android sepa de qué viewer viene ⭐
+        await sio.emit('ice-candidate', {
+            'sender': sender,
+            'candidate': candidate
+        }, room=target)
+
+async def _emit_to(event, data, room):
+    await sio.emit(event, data, room=room)
+
+async def _publish_server_detection(device_id, person_count, timestamp):
+    hub.publish('detection', {'deviceId': device_id, 'personCount': person_count, 'source': 'server'})
+    await detection_throttle.submit(device_id, {
+        'deviceId': device_id,
+        'personCount': person_count,
+        'timestamp': timestamp,
+        'source': 'server'
+    })
+
+if SFU_MODE:
+    from sfu import SFU_SUPPORTED
+    if not SFU_SUPPORTED:
+        # La versión de aiortc no permite reenviar sin decodificar: cada viewer conecta con el teléfono
+        logger.warning("⚠️ SFU_MODE=1 no disponible con esta versión de aiortc; se usa el modo mesh")
+        SFU_MODE = False
+
+if SFU_MODE or SERVER_DETECTION:
+    from sfu import SFU_PEER_PREFIX, SfuRouter, is_sfu_peer, sfu_peer_id
+    if SERVER_DETECTION:
+        from person_detector import PersonDetector
+        sfu = SfuRouter(_emit_to, detector=PersonDetector(_publish_server_detection))
+    else:
+        sfu = SfuRouter(_emit_to)
+    Gauge('sfu_peers', 'Conexiones del SFU por rol', ('role',),
+          callback=lambda: {('broadcaster',): len(sfu.publications), ('viewer',): len(sfu.viewers)})
+else:
+    sfu = None
+
+# Con ICE_BATCH_MS > 0 los candidatos hacia clientes con 'iceBatch' se agrupan
+ice_batcher = IceBatcher(_deliver_ice) if ICE_BATCH_MS > 0 else None
+
+async def _relay_ice(sender, target, candidates):
+    if sfu and is_sfu_peer(target):
+        for candidate in candidates:
+            await sfu.add_ice_candidate(sender, target[len(SFU_PEER_PREFIX):], candidate)
+        return
+    # Los destinos sin soporte de lotes (o en otro nodo) reciben cada candidato sin demora
+    if ice_batcher and registry.supports(target, 'iceBatch'):
+        await ice_batcher.add(sender, target, candidates)
+    else:
+        await _deliver_ice(sender, target, candidates)
+
 @sio.event
 async def ice_candidate(sid, data):
     """Retransmitir ICE candidates entre Android y Navegador"""
+    SIGNALING_EVENTS.inc(labels=('ice_candidate',))
+    registry.touch(sid)
     target = data.get('target')
     candidate = data.get('candidate')
     
-    logger.info(f"🧊 Retransmitiendo ICE de {sid} a {target}")
+    relay_logger.debug("🧊 Retransmitiendo ICE de %s a %s", sid, target)
     
-    # ⭐ NUEVO: Incluir el sender ID para que Android sepa de qué viewer viene ⭐
-    await sio.emit('ice-candidate', {
-        'sender': sid,
-        'candidate': candidate
-    }, room=target)
+    await _relay_ice(sid, target, [candidate])
 
 # Alias para compatibilidad con guiones
 sio.on('ice-candidate', ice_candidate)
 
+@sio.event
+async def ice_candidates(sid, data):
+    """Retransmitir varios ICE candidates enviados en un solo mensaje"""
+    SIGNALING_EVENTS.inc(labels=('ice_candidates',))
+    registry.touch(sid)
+    target = data.get('target')
+    candidates = data.get('candidates') or []
+    
+    relay_logger.debug("🧊 Retransmitiendo %d ICE de %s a %s", len(candidates), sid, target)
+    
+    await _relay_ice(sid, target, candidates)
+
+sio.on('ice-candidates', ice_candidates)
+
 # ⭐ NUEVO: RECIBIR DETECCIONES DE PERSONAS ⭐
+async def _emit_detection(device_id, payload):
+    """Entrega la detección a los suscriptores del dispositivo y a los de todos"""
+    await sio.emit('detection-update', payload, room=[device_room(device_id), ALL_DEVICES_ROOM])
+
+detection_throttle = DetectionThrottle(_emit_detection)
+
 @sio.event
 async def person_detection(sid, data):
     """Recibir conteo de personas detectadas desde viewer/raspberry"""
+    SIGNALING_EVENTS.inc(labels=('person_detection',))
+    registry.touch(sid)
     device_id = data.get('deviceId')
     person_count = data.get('personCount', 0)
     timestamp = data.get('timestamp')
     
-    logger.info(f"👤 Detección recibida de {sid}: {person_count} persona(s) en {device_id}")
+    detection_logger.debug("👤 Detección recibida de %s: %s persona(s) en %s", sid, person_count, device_id)
     
-    # Broadcast a TODOS los clientes conectados (web viewers)
-    await sio.emit('detection-update', {
+    # Historial: todas las detecciones, antes del límite de tasa (ver detection_history)
+    hub.publish('detection', {'deviceId': device_id, 'personCount': person_count, 'source': 'client'})
+    
+    # Solo a los suscriptores del dispositivo, como máximo DETECTION_MAX_RATE veces por segundo
+    await detection_throttle.submit(device_id, {
         'deviceId': device_id,
         'personCount': person_count,
         'timestamp': timestamp,
         'source': sid
     })
-    
-    logger.info(f"📡 Detección enviada a todos los clientes web")
 
 # Alias para compatibilidad
 sio.on('person-detection', person_detection)
 
+@sio.event
+async def subscribe_detections(sid, data):
+    """Suscribirse a las detecciones de ciertos dispositivos ('*' = todos)"""
+    SIGNALING_EVENTS.inc(labels=('subscribe_detections',))
+    for device_id in data.get('deviceIds') or []:
+        room = ALL_DEVICES_ROOM if device_id == '*' else device_room(device_id)
+        await sio.enter_room(sid, room)
+
+sio.on('subscribe-detections', subscribe_detections)
+
+@sio.event
+async def unsubscribe_detections(sid, data):
+    """Cancelar la suscripción a detecciones de ciertos dispositivos"""
+    SIGNALING_EVENTS.inc(labels=('unsubscribe_detections',))
+    for device_id in data.get('deviceIds') or []:
+        room = ALL_DEVICES_ROOM if device_id == '*' else device_room(device_id)
+        await sio.leave_room(sid, room)
+
+sio.on('unsubscribe-detections', unsubscribe_detections)
+
 # ⭐ ENDPOINTS HTTP ⭐
+async def metrics_handler(request):
+    """Métricas Prometheus de este proceso (útil en modo run.py --split)"""
+    return web.Response(text=metrics.render(), content_type='text/plain')
+
 async def health_check(request):
     """Health check del servidor de video"""
     # ⭐ NUEVO: Incluir estadísticas de viewers por broadcaster ⭐
@@ -244,6 +481,7 @@ async def health_check(request):
         text=json.dumps({
             "status": "healthy",
             "service": "webrtc_server",
+            "node_id": directory.node_id,
             "active_broadcasters": len(active_broadcasters),
             "active_viewers": len(active_viewers),
             "broadcaster_devices": list(active_broadcasters.keys()),
@@ -253,10 +491,10 @@ async def health_check(request):
     )
 
 async def get_active_devices(request):
-    """Endpoint para obtener dispositivos activos"""
+    """Endpoint para obtener dispositivos activos (de todos los nodos)"""
     return web.Response(
         text=json.dumps({
-            "devices": list(active_broadcasters.keys())
+            "devices": await directory.all()
         }),
         content_type="application/json"
     )
@@ -268,9 +506,12 @@ async def start_webrtc_server(host='0.0.0.0', port=8081):
     # Registrar rutas HTTP
     app.router.add_get('/health', health_check)
     app.router.add_get('/api/devices', get_active_devices)
+    app.router.add_get('/metrics', metrics_handler)
+    app.on_startup.append(_start_background)
+    app.on_cleanup.append(_stop_background)
     
     logger.info(f"🎥 Iniciando servidor WebRTC en {host}:{port}")
-    logger.info(f"📡 Servidores configurados para retransmisión: {len(OTHER_SERVERS)}")
+    logger.info(f"📡 Bus de señalización: {signaling_bus.SIGNALING_BUS_URL or 'un solo nodo'} (nodo {directory.node_id})")
     
     # 🔒 Configurar SSL si hay certificados disponibles
     ssl_context = None
@@ -313,4 +554,5 @@ async def start_webrtc_server(host='0.0.0.0', port=8081):
     return runner
 
 if __name__ == '__main__':
+    setup_logging()
     asyncio.run(start_webrtc_server())
\ No newline at end of file
@@ -1737,42 +1737,46 @@ const handleLiveAreaDrawn = (polygon) => {
     };
   }, [isLiveMode]);
 
-  // useEffect para filtrar dispositivos en Live Area Search
+  // useEffect para Live Area Search: el servidor envía los dispositivos del área (SSE)
 useEffect(() => {
-  if (liveAreaSearchMode && liveAreaBounds && locationsData.length > 0) {
-    const devicesInArea = locationsData.filter(location => {
-      const lat = parseFloat(location.latitude);
-      const lng = parseFloat(location.longitude);
-      
-      return lat >= liveAreaBounds.minLat &&
-             lat <= liveAreaBounds.maxLat &&
-             lng >= liveAreaBounds.minLng &&
-             lng <= liveAreaBounds.maxLng;
-    });
-    
-    setDevicesInLiveArea(devicesInArea);
-    console.log(` 🔵 Dispositivos en área: ${devicesInArea.length}`, devicesInArea.map(d => d.device_id));
-  } else if (!liveAreaSearchMode) {
+  if (!liveAreaSearchMode || !liveAreaBounds) {
     setDevicesInLiveArea([]);
+    return;
   }
-}, [liveAreaSearchMode, liveAreaBounds, locationsData]);
 
-// useEffect para continuar obteniendo ubicaciones en modo Live Area Search
-useEffect(() => {
-  let interval;
-  if (liveAreaSearchMode) {
-    fetchLatestLocations(); // Fetch inicial
-    interval = setInterval(() => {
-      fetchLatestLocations();
-    }, config.POLLING_INTERVAL);
-  }
+  const polygon = liveAreaBounds.polygon.map(([lat, lng]) => `${lat},${lng}`).join(';');
+  const source = new EventSource(
+    `${config.API_BASE_URL}/api/live/devices-in-area/stream?polygon=${encodeURIComponent(polygon)}`
+  );
+  const devices = new Map();
+  const publish = () => setDevicesInLiveArea(
+    [...devices.values()].sort((a, b) => a.device_id.localeCompare(b.device_id))
+  );
 
-  return () => {
-    if (interval) {
-      clearInterval(interval);
-    }
+  source.addEventListener('snapshot', (event) => {
+    devices.clear();
+    JSON.parse(event.data).forEach(location => devices.set(location.device_id, location));
+    publish();
+    console.log(` 🔵 Dispositivos en área: ${devices.size}`, [...devices.keys()]);
+  });
+  const upsert = (event) => {
+    const location = JSON.parse(event.data);
+    devices.set(location.device_id, location);
+    publish();
   };
-}, [liveAreaSearchMode]);
+  source.addEventListener('enter', upsert);
+  source.addEventListener('move', upsert);
+  source.addEventListener('leave', (event) => {
+    devices.delete(JSON.parse(event.data).device_id);
+    publish();
+  });
+  source.onerror = () => {
+    // EventSource reconecta solo y el servidor reenvía la foto completa al reconectar
+    console.log('⚠️ Stream de Live Area Search interrumpido, reconectando...');
+  };
+
+  return () => source.close();
+}, [liveAreaSearchMode, liveAreaBounds]);
 
 // useEffect para conectar WebSocket cuando se activa Live Area Search
 useEffect(() => {
@@ -1800,6 +1804,8 @@ useEffect(() => {
       console.log('✅ WebSocket conectado para detecciones');
       console.log('📡 Socket ID:', newSocket.id);
       console.log('🔗 Transport:', newSocket.io.engine.transport.name);
+      // Las detecciones se envían por sala; el mapa necesita las de todos los dispositivos
+      newSocket.emit('subscribe-detections', { deviceIds: ['*'] });
     });
 
     newSocket.on('detection-update', (data) => {
@@ -82,7 +82,8 @@ function VideoStream({ deviceId, serverUrl }) {
             
             // Registrarse como viewer
             const viewerId = `viewer_${Date.now()}`;
-            socket.emit('register-viewer', { viewerId });
+            // iceBatch: el servidor puede agrupar candidatos ICE en 'ice-candidates'
+            socket.emit('register-viewer', { viewerId, iceBatch: true });
         });
 
         socket.on('available-broadcasters', (devices) => {
@@ -140,14 +141,12 @@ function VideoStream({ deviceId, serverUrl }) {
         });
 
         // ⭐ RECIBIR ICE CANDIDATES DEL ANDROID ⭐
-        socket.on('ice-candidate', async (data) => {
+        const addIceCandidate = async (data) => {
             try {
-                console.log('🧊 ICE candidate recibido del broadcaster');
-                
                 const candidate = new RTCIceCandidate({
-                    sdpMid: data.candidate.sdpMid,
-                    sdpMLineIndex: data.candidate.sdpMLineIndex,
-                    candidate: data.candidate.candidate
+                    sdpMid: data.sdpMid,
+                    sdpMLineIndex: data.sdpMLineIndex,
+                    candidate: data.candidate
                 });
                 
                 await pc.addIceCandidate(candidate);
@@ -156,6 +155,19 @@ function VideoStream({ deviceId, serverUrl }) {
             } catch (error) {
                 console.error('❌ Error añadiendo ICE candidate:', error);
             }
+        };
+
+        socket.on('ice-candidate', async (data) => {
+            console.log('🧊 ICE candidate recibido del broadcaster');
+            await addIceCandidate(data.candidate);
+        });
+
+        // Varios candidatos agrupados por el servidor (ICE_BATCH_MS)
+        socket.on('ice-candidates', async (data) => {
+            console.log(`🧊 ${data.candidates.length} ICE candidates recibidos del broadcaster`);
+            for (const candidate of data.candidates) {
+                await addIceCandidate(candidate);
+            }
         });
 
         socket.on('broadcaster-disconnected', (data) => {